@@ -0,0 +1,6 @@
+from .cache import DiskCache
+from .index import PathwayIndex
+from .kegg import KEGGPathways, OfflineError
+from .mapping import GeneMapping
+from .organisms import OrganismTable
+from .pack import KEGGPack
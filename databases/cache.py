@@ -0,0 +1,163 @@
+"""Persistent cache of responses of remote databases.
+
+Entries are pickled into separate files, named after a hash of the key,
+so that the cache can be shared by concurrent processes (each entry
+is written to a temporary file first and then moved into place).
+
+The modification time of a file tells when the entry was stored
+(used to expire entries after `ttl` seconds), while the access time
+is updated explicitly on each hit (used to evict the least recently
+used entries once the total size exceeds `max_size`).
+"""
+import hashlib
+import os
+import pickle
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from time import time
+
+
+# directory to keep the cache in, ~/.cache/patapy by default
+CACHE_DIR_VARIABLE = 'PATAPY_CACHE'
+
+# KEGG is updated a few times a month
+DEFAULT_TTL = 30 * 24 * 60 * 60
+
+DEFAULT_MAX_SIZE = 512 * 2 ** 20
+
+
+def default_directory() -> Path:
+    return Path(os.environ.get(CACHE_DIR_VARIABLE) or Path.home() / '.cache' / 'patapy')
+
+
+class CacheStatistics:
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        # misses due to expired entries
+        self.expired = 0
+        self.evictions = 0
+
+    @property
+    def hit_ratio(self):
+        requests = self.hits + self.misses
+        return self.hits / requests if requests else 0
+
+    def __str__(self):
+        return (
+            f'{self.hits} hits, {self.misses} misses ({self.expired} expired), '
+            f'{self.evictions} evictions; hit ratio: {self.hit_ratio:.0%}'
+        )
+
+
+class DiskCache:
+    """Stores picklable values in files in `directory`.
+
+    Args:
+        directory: where to keep the entries
+        ttl: seconds after which an entry expires (None: never)
+        max_size: total size of entries (in bytes), above which
+            the least recently used entries are evicted
+    """
+
+    def __init__(self, directory: Path, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE):
+        self.directory = Path(directory)
+        self.ttl = ttl
+        self.max_size = max_size
+        self.statistics = CacheStatistics()
+        # total size of entries; computed on the first store
+        self.size = None
+
+    def path(self, key) -> Path:
+        digest = hashlib.sha256(repr(key).encode()).hexdigest()
+        return self.directory / digest[:2] / (digest + '.pickle')
+
+    def is_expired(self, path: Path):
+        return self.ttl is not None and time() - path.stat().st_mtime > self.ttl
+
+    def load(self, key, allow_expired=False):
+        """Return the value stored for `key`; raise KeyError on a miss.
+
+        Args:
+            key: a tuple of strings (or other values with stable repr)
+            allow_expired: return the value even if expired
+        """
+        path = self.path(key)
+
+        try:
+            if not allow_expired and self.is_expired(path):
+                self.statistics.expired += 1
+                raise KeyError(key)
+
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+
+        except (OSError, EOFError, pickle.UnpicklingError):
+            # missing, removed meanwhile by another process or broken
+            self.statistics.misses += 1
+            raise KeyError(key)
+        except KeyError:
+            self.statistics.misses += 1
+            raise
+
+        try:
+            # mark as recently used, keeping the time of storage
+            os.utime(path, (time(), path.stat().st_mtime))
+        except OSError:
+            # e.g. a read-only cache, seeded in advance for offline use
+            pass
+
+        self.statistics.hits += 1
+        return value
+
+    def store(self, key, value):
+        path = self.path(key)
+        os.makedirs(path.parent, exist_ok=True)
+
+        try:
+            # the entry being replaced, if any
+            replaced = path.stat().st_size
+        except FileNotFoundError:
+            replaced = 0
+
+        with NamedTemporaryFile('wb', dir=path.parent, suffix='.part', delete=False) as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f.name, path)
+
+        if self.size is None:
+            self.size = sum(size for used, size, entry in self.entries())
+        else:
+            self.size += path.stat().st_size - replaced
+
+        if self.size > self.max_size:
+            self.evict()
+
+    def entries(self):
+        """Yield (access time, size, path) for each of the stored entries."""
+        for path in self.directory.glob('*/*.pickle'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            yield stat.st_atime, stat.st_size, path
+
+    def evict(self):
+        """Remove the least recently used entries until the size limit is met."""
+        entries = sorted(self.entries())
+        self.size = sum(size for used, size, path in entries)
+
+        for used, size, path in entries:
+            if self.size <= self.max_size:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            self.size -= size
+            self.statistics.evictions += 1
+
+    def clear(self):
+        for used, size, path in self.entries():
+            path.unlink()
+        self.size = 0
@@ -0,0 +1,117 @@
+from typing import Sequence, Tuple
+
+import networkx as nx
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+
+
+def topological_order(successors: Sequence[set]):
+    """Order nodes of a DAG (given as successors of each node) so that each precedes its successors."""
+    indegree = [0] * len(successors)
+    for targets in successors:
+        for target in targets:
+            indegree[target] += 1
+
+    order = [node for node, degree in enumerate(indegree) if not degree]
+    for node in order:
+        for target in successors[node]:
+            indegree[target] -= 1
+            if not indegree[target]:
+                order.append(target)
+    return order
+
+
+def bits(bitset: int):
+    """Yield positions of set bits."""
+    while bitset:
+        lowest = bitset & -bitset
+        yield lowest.bit_length() - 1
+        bitset ^= lowest
+
+
+def gene_graph(
+    names: Sequence[str], types: Sequence[str], relations: Sequence[Tuple[int, int, str]], self_loops=False
+) -> nx.DiGraph:
+    """Create graph of interactions between genes, contracting other nodes.
+
+    Nodes which are not genes (compounds, orthologs, ...) are removed and
+    each path leading from a gene to a gene through such nodes only is
+    replaced with an edge of type ['indirect'] (overriding the direct edge
+    between the genes, if there is one).
+
+    Instead of connecting predecessors with successors of each removed
+    node (which is quadratic for each node, and repeated for chains),
+    strongly connected components of the non-gene nodes are found and
+    the genes reachable from each of the components are collected once,
+    in reverse topological order (as bitsets).
+
+    Args:
+        names: name of each node
+        types: KGML type of each node ('gene', 'compound', ...)
+        relations: (source, target, interaction name) triples in KGML order,
+            with sources and targets given by positions of the nodes
+        self_loops: keep edges leading from a node to itself?
+
+    Returns:
+        `networkx.DiGraph` with gene nodes (having 'type' attribute) and
+        edges having 'type' attribute: a list of interaction types
+    """
+    count = len(names)
+    is_gene = np.array([node_type == 'gene' for node_type in types], dtype=bool)
+
+    # interactions of each pair of nodes, in order of relations
+    direct = {}
+    for source, target, interaction in relations:
+        if source != target or self_loops:
+            direct.setdefault((source, target), []).append(interaction)
+
+    edges = np.array(list(direct), dtype=np.int64).reshape(-1, 2)
+    sources, targets = edges[:, 0], edges[:, 1]
+
+    between_others = ~is_gene[sources] & ~is_gene[targets]
+    matrix = csr_matrix(
+        (np.ones(between_others.sum(), dtype=np.int8), (sources[between_others], targets[between_others])),
+        shape=(count, count)
+    )
+    components_count, components = connected_components(matrix, directed=True, connection='strong')
+
+    # genes reachable from each component of non-gene nodes (bitsets over node positions)
+    reachable = [0] * components_count
+    successors = [set() for _ in range(components_count)]
+
+    for source, target in direct:
+        if is_gene[source]:
+            continue
+        component = components[source]
+        if is_gene[target]:
+            reachable[component] |= 1 << target
+        elif components[target] != component:
+            successors[component].add(components[target])
+
+    for component in reversed(topological_order(successors)):
+        for successor in successors[component]:
+            reachable[component] |= reachable[successor]
+
+    G = nx.DiGraph()
+
+    for node in range(count):
+        if is_gene[node]:
+            G.add_node(names[node], type=types[node])
+
+    indirect = [0] * count
+
+    for (source, target), interactions in direct.items():
+        if not is_gene[source]:
+            continue
+        if is_gene[target]:
+            G.add_edge(names[source], names[target], type=interactions)
+        else:
+            indirect[source] |= reachable[components[target]]
+
+    for source in range(count):
+        for target in bits(indirect[source]):
+            if source != target or self_loops:
+                G.add_edge(names[source], names[target], type=['indirect'])
+
+    return G
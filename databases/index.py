@@ -0,0 +1,116 @@
+from collections import defaultdict
+from typing import Iterable, Mapping
+
+
+def strip_prefix(identifier: str) -> str:
+    """Remove database prefix from KEGG identifier (ex. 'path:hsa04110' -> 'hsa04110')."""
+    return identifier.split(':', 1)[-1]
+
+
+def parse_gene_list(text: str):
+    """Parse the response of KEGG `list/<org>` query.
+
+    Lines look like: hsa:675<tab>BRCA2, BRCC2, FACD; BRCA2 DNA repair associated
+    (newer responses have additional columns with the type and position
+    of the gene before the last one).
+
+    Returns:
+        (primary symbols, aliases): mappings of symbols to sets of gene ids
+    """
+    primary = defaultdict(set)
+    aliases = defaultdict(set)
+
+    for line in text.split('\n'):
+        if not line:
+            continue
+        columns = line.split('\t')
+        gene = strip_prefix(columns[0])
+        description = columns[-1]
+        if ';' not in description:
+            continue
+        first, *others = description.split(';')[0].split(',')
+        primary[first.strip()].add(gene)
+        for symbol in others:
+            aliases[symbol.strip()].add(gene)
+
+    return primary, aliases
+
+
+def parse_links(text: str):
+    """Parse the response of KEGG `link/pathway/<org>` query into pathway: genes mapping."""
+    pathway_genes = defaultdict(set)
+    for line in text.split('\n'):
+        if line:
+            gene, pathway = line.split('\t')[:2]
+            pathway_genes[strip_prefix(pathway)].add(strip_prefix(gene))
+    return pathway_genes
+
+
+def parse_pathway_list(text: str):
+    """Parse the response of KEGG `list/pathway/<org>` query into pathway: name mapping.
+
+    The names of organism-specific pathways end with the name of the organism
+    (ex. 'Cell cycle - Homo sapiens (human)'), which is removed.
+    """
+    names = {}
+    for line in text.split('\n'):
+        if line:
+            pathway, name = line.split('\t')[:2]
+            if name.endswith(')'):
+                name = name.rpartition(' - ')[0] or name
+            names[strip_prefix(pathway)] = name
+    return names
+
+
+class PathwayIndex:
+    """Maps genes of an organism to KEGG pathways (and back) in memory.
+
+    Genes can be given by symbols (ex. 'BRCA2') or by KEGG gene ids
+    without the organism prefix (ex. '675'); primary symbols take
+    precedence over the aliases.
+
+    Args:
+        pathway_genes: pathway id -> set of gene ids
+        pathway_names: pathway id -> name of the pathway
+        symbols: primary symbol -> set of gene ids
+        aliases: alias -> set of gene ids
+    """
+
+    def __init__(
+        self, pathway_genes: Mapping[str, set], pathway_names: Mapping[str, str],
+        symbols: Mapping[str, set], aliases: Mapping[str, set]
+    ):
+        self.pathway_genes = pathway_genes
+        self.pathway_names = pathway_names
+        self.symbols = symbols
+        self.aliases = aliases
+
+        self.gene_pathways = defaultdict(set)
+        for pathway, genes in pathway_genes.items():
+            for gene in genes:
+                self.gene_pathways[gene].add(pathway)
+
+    @classmethod
+    def from_kegg(cls, gene_list: str, links: str, pathway_list: str):
+        """Create the index from responses of KEGG `list/<org>`,
+        `link/pathway/<org>` and `list/pathway/<org>` queries."""
+        symbols, aliases = parse_gene_list(gene_list)
+        return cls(parse_links(links), parse_pathway_list(pathway_list), symbols, aliases)
+
+    def gene_ids(self, gene: str) -> set:
+        if gene in self.gene_pathways:
+            return {gene}
+        return self.symbols.get(gene) or self.aliases.get(gene) or set()
+
+    def pathways_of(self, gene: str) -> dict:
+        """Return pathways containing the gene, as {pathway id: name} dictionary."""
+        return self.pathways_for_genes([gene])
+
+    def pathways_for_genes(self, genes: Iterable[str]) -> dict:
+        """Return pathways containing any of the genes, as {pathway id: name} dictionary."""
+        pathways = {}
+        for gene in genes:
+            for gene_id in sorted(self.gene_ids(gene)):
+                for pathway in sorted(self.gene_pathways.get(gene_id, ())):
+                    pathways[pathway] = self.pathway_names.get(pathway, pathway)
+        return pathways
@@ -0,0 +1,435 @@
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from copy import deepcopy
+from time import monotonic
+
+import networkx as nx
+from requests import RequestException
+
+from .cache import DiskCache, default_directory
+from .index import PathwayIndex
+from .kgml import KGMLPathway, parse_kgml
+from .mapping import GeneMapping
+from .pack import KEGGPack, default_pack_path
+from .remote import KEGG_URL, KEGG_URL_VARIABLE, get_text, kegg_rate_limiter, pooled_session
+from .organisms import OrganismTable, SNAPSHOT
+
+
+# if set (to anything but an empty string), nothing will be downloaded
+OFFLINE_VARIABLE = 'PATAPY_OFFLINE'
+
+
+class OfflineError(RuntimeError):
+    """Raised in offline mode when the requested data is not in the cache."""
+
+
+# complete lists of organisms, loaded once per process (for each cache directory)
+_organism_tables = {}
+
+# indices of pathways, built once per process (for each cache directory and organism)
+_pathway_indices = {}
+
+# times of failed attempts to build an index (for each cache directory and organism);
+# meanwhile queries for single genes are used, and the index is not retried for:
+INDEX_RETRY_INTERVAL = 5 * 60
+
+_pathway_index_failures = {}
+
+# mappings of genes to NCBI gene ids, built once per process (for each cache directory and organism)
+_gene_mappings = {}
+
+# graphs of pathways, contracted once per process (for each cache directory, pathway and
+# self_loops); the least recently used graphs are dropped when there is more than:
+PATHWAY_GRAPHS_CACHED = 512
+
+_pathway_graphs = OrderedDict()
+
+
+class KEGGPathways:
+    """
+    KEGG PATHWAY Database API
+
+    Responses of KEGG (and parsed KGML pathways) are kept in a disk cache,
+    so that repeated runs do not download the same data again.
+
+    Args:
+        organism: organism name (ex. 'Homo sapiens', 'human')
+        cache: `DiskCache` to use, by default one in `cache.default_directory()`
+            (shared with other methods); pass a cache with custom `ttl`
+            or `max_size` to change when the entries are refreshed or evicted
+        offline: do not connect to KEGG; requests for data which is not cached
+            fail with `OfflineError`; expired entries are used as well.
+            By default enabled if PATAPY_OFFLINE variable is set.
+        pack: path to a pack (see `pack` module) or `KEGGPack` to serve the pathways
+            (and pathways of genes) from, without connecting to KEGG; by default
+            the pack of the organism from PATAPY_KEGG_PACKS directory is used,
+            if there is one. Pass False to disable packs.
+        base_url: URL of KEGG REST API, or of a server standing in for it;
+            by default PATAPY_KEGG_URL variable, or `remote.KEGG_URL`.
+            The rate limit of KEGG applies only to requests sent to KEGG.
+    """
+
+    # endpoints of KEGG REST API returning plain text, queried directly (not with bioservices)
+    rest_endpoints = {'list', 'find', 'link', 'info', 'conv'}
+
+    def __init__(
+        self, organism="Homo sapiens", cache: DiskCache = None, offline: bool = None, pack=None,
+        base_url: str = None
+    ):
+        self.cache = cache or DiskCache(default_directory() / 'kegg')
+        self.offline = bool(os.environ.get(OFFLINE_VARIABLE)) if offline is None else offline
+        self.base_url = (base_url or os.environ.get(KEGG_URL_VARIABLE) or KEGG_URL).rstrip('/')
+        self.limiter = kegg_rate_limiter if self.base_url == KEGG_URL else None
+        self._database = None
+        self._session = None
+        self.organism = self.get_organism_code(organism.lower())
+
+        if pack is None:
+            pack = default_pack_path(self.organism)
+        if pack and not isinstance(pack, KEGGPack):
+            pack = KEGGPack(pack)
+        if pack and pack.organism != self.organism:
+            raise ValueError(f'The pack {pack.path} contains pathways of {pack.organism}, not of {self.organism}')
+        self.pack = pack or None
+
+    @property
+    def database(self):
+        # the connection is set up only when needed (not at all for cached data)
+        if self._database is None:
+            from bioservices.kegg import KEGG
+            self._database = KEGG()
+            self._database.services.url = self.base_url
+        return self._database
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = pooled_session(1)
+        return self._session
+
+    def query(self, endpoint: str, *args) -> str:
+        """Query KEGG REST API (ex. query('list', 'pathway', 'hsa') for /list/pathway/hsa), bypassing the cache.
+
+        Returns:
+            the body of the response, or None if not found
+        """
+        return get_text(self.session, '/'.join([self.base_url, endpoint, *args]), self.limiter)
+
+    def request(self, endpoint: str, *args):
+        """Query `endpoint` of KEGG REST API (see `query`), or call such method
+        of bioservices' KEGG (for endpoints not in `rest_endpoints`), using the cache."""
+        key = (endpoint, *args)
+
+        try:
+            return self.cache.load(key, allow_expired=self.offline)
+        except KeyError:
+            pass
+
+        if self.offline:
+            raise OfflineError(
+                f'Offline mode: {endpoint}{args} is not in the cache of KEGG data ({self.cache.directory})'
+            )
+
+        if endpoint in self.rest_endpoints:
+            response = self.query(endpoint, *args)
+        else:
+            response = getattr(self.database, endpoint)(*args)
+
+        # on errors bioservices returns HTTP status code
+        # or None (if the connection failed) instead of raising
+        if response is not None and not isinstance(response, int):
+            self.cache.store(key, response)
+
+        return response
+
+    def search_by_gene(self, gene_name: str):
+        """
+
+        Args:
+            gene_name: gene name (ex. 'BRCA2')
+
+        Returns:
+            Dictionary with ids of all pathways containing given gene as keys and their full names as values.
+
+        """
+        if self.pack:
+            return self.pack.pathways_for_genes([gene_name])
+
+        index = self.pathway_index()
+        if index:
+            return index.pathways_of(gene_name)
+
+        try:
+            pathways = self.request('get_pathway_by_gene', gene_name, self.organism)
+            return pathways if pathways else {}
+        except AttributeError:
+            return {}
+
+    def pathways_for_genes(self, genes):
+        """
+
+        Args:
+            genes: gene names (ex. ['BRCA2', 'TP53'])
+
+        Returns:
+            Dictionary with ids of all pathways containing any of given genes as keys and their full names as values.
+
+        """
+        if self.pack:
+            return self.pack.pathways_for_genes(genes)
+
+        index = self.pathway_index()
+        if index:
+            return index.pathways_for_genes(genes)
+
+        pathways = {}
+        for gene in genes:
+            pathways.update(self.search_by_gene(gene))
+        return pathways
+
+    def pathway_index(self) -> PathwayIndex:
+        """Return the index of pathways of the organism, built from three bulk queries.
+
+        Returns None if KEGG did not provide the data for the index; in such
+        case, the next attempt is made after `INDEX_RETRY_INTERVAL` seconds,
+        so that a search for each of many genes does not repeat the queries.
+        """
+        key = (self.cache.directory, self.organism)
+
+        if key not in _pathway_indices:
+            failed = _pathway_index_failures.get(key)
+            if failed is not None and monotonic() - failed < INDEX_RETRY_INTERVAL:
+                return None
+            try:
+                responses = [
+                    self.request('list', self.organism),
+                    self.request('link', 'pathway', self.organism),
+                    self.request('list', 'pathway', self.organism)
+                ]
+            except (OfflineError, RequestException):
+                # not cached or the connection failed;
+                # queries for single genes may still work (or be cached)
+                responses = None
+            if not responses or not all(isinstance(response, str) for response in responses):
+                _pathway_index_failures[key] = monotonic()
+                return None
+            _pathway_index_failures.pop(key, None)
+            _pathway_indices[key] = PathwayIndex.from_kegg(*responses)
+
+        return _pathway_indices[key]
+
+    def gene_mapping(self) -> GeneMapping:
+        """Return the mapping of genes of the organism to NCBI gene ids, built from two bulk queries.
+
+        Raises OfflineError (in offline mode) or requests' exception
+        if KEGG did not provide the data.
+        """
+        key = (self.cache.directory, self.organism)
+
+        if key in _gene_mappings:
+            return _gene_mappings[key]
+
+        gene_list = self.request('list', self.organism)
+        conversions = self.request('conv', 'ncbi-geneid', self.organism)
+        mapping = GeneMapping.from_kegg(gene_list or '', conversions or '')
+
+        if gene_list and conversions:
+            # do not remember empty mappings, the next call will retry
+            _gene_mappings[key] = mapping
+
+        return mapping
+
+    def get_pathway(self, pathway_id: str, self_loops: bool = False):
+        """
+
+        Args:
+            pathway_id: KEGG pathway id (ex. 'hsa04110')
+            self_loops: information about whether or not include self loops in returned graph
+
+        Returns:
+            `networkx.DiGraph` object: Directed graph depicting pathway, with a comma-separated string
+            containing gene names as graph nodes and directed edges representing interactions between genes.
+            Each edge has weight 'type', which is a list of interaction types between two nodes.
+
+        """
+        if self.pack and self.pack.self_loops == self_loops:
+            return self.pack.get_pathway(pathway_id)
+
+        return dict(self.get_pathways([pathway_id], self_loops, workers=1))[pathway_id]
+
+    def get_pathways(self, pathway_ids, self_loops: bool = False, workers: int = 3):
+        """Fetch multiple pathways concurrently, yielding these as they arrive.
+
+        Cached pathways are yielded first; the others are downloaded
+        over a pool of keep-alive connections by `workers` threads,
+        within the rate limit of KEGG (see `remote.kegg_rate_limiter`).
+        Meanwhile, the pathways which have already arrived can be analysed.
+
+        Args:
+            pathway_ids: KEGG pathway ids (ex. ['hsa04110', 'hsa03440'])
+            self_loops: see `get_pathway`
+            workers: maximal number of concurrent downloads
+
+        Returns:
+            generator of (pathway id, `networkx.DiGraph`) pairs (see `get_pathway`)
+        """
+        if self.pack and self.pack.self_loops == self_loops:
+            for pathway_id in pathway_ids:
+                yield pathway_id, self.pack.get_pathway(pathway_id)
+            return
+
+        missing = []
+
+        for pathway_id in pathway_ids:
+            graph = self.cached_graph(pathway_id, self_loops)
+            if graph is not None:
+                yield pathway_id, graph
+                continue
+            try:
+                pathway = self.load_pathway(pathway_id)
+            except KeyError:
+                missing.append(pathway_id)
+            else:
+                yield pathway_id, self.contract(pathway_id, pathway, self_loops)
+
+        if not missing:
+            return
+
+        if self.offline:
+            raise OfflineError(
+                f'Offline mode: pathways {", ".join(missing)} are not in the cache of KEGG data ({self.cache.directory})'
+            )
+
+        with pooled_session(workers) as session, ThreadPoolExecutor(max_workers=workers) as executor:
+            downloads = {
+                executor.submit(self.download_pathway, session, pathway_id): pathway_id
+                for pathway_id in missing
+            }
+            try:
+                for download in as_completed(downloads):
+                    pathway_id, pathway = downloads[download], download.result()
+                    if pathway is not None:
+                        self.cache.store(('kgml', pathway_id), pathway)
+                    yield pathway_id, self.contract(pathway_id, pathway, self_loops)
+            finally:
+                # when the consumer stops early, do not download the rest
+                for download in downloads:
+                    download.cancel()
+
+    def load_pathway(self, pathway_id: str) -> KGMLPathway:
+        """Load parsed KGML of the pathway from the cache; raise KeyError if it is not there.
+
+        Pathways cached by former versions (parsed by bioservices) are converted.
+        """
+        try:
+            return self.cache.load(('kgml', pathway_id), allow_expired=self.offline)
+        except KeyError:
+            pathway = self.cache.load(('parse_kgml_pathway', pathway_id), allow_expired=self.offline)
+            return KGMLPathway.from_parsed(pathway)
+
+    def download_pathway(self, session, pathway_id: str) -> KGMLPathway:
+        """Download and parse KGML of the pathway; None for incorrect pathway ids."""
+        kgml = get_text(session, f'{self.base_url}/get/{pathway_id}/kgml', self.limiter)
+        if not kgml:
+            return None
+        return parse_kgml(kgml)
+
+    def cached_graph(self, pathway_id: str, self_loops: bool):
+        """Return a copy of the graph of the pathway if it was created before in this process, or None.
+
+        The attributes (ex. lists of edge types) are copied too, so that
+        changes made by the caller do not reach the remembered graph.
+        """
+        key = (self.cache.directory, pathway_id, self_loops)
+        if key not in _pathway_graphs:
+            return None
+        _pathway_graphs.move_to_end(key)
+        return deepcopy(_pathway_graphs[key])
+
+    def contract(self, pathway_id: str, pathway, self_loops: bool):
+        """Create graph of the pathway from parsed KGML, remembering it for `cached_graph`."""
+        graph = self.pathway_graph(pathway, self_loops)
+        if pathway:
+            _pathway_graphs[(self.cache.directory, pathway_id, self_loops)] = deepcopy(graph)
+            while len(_pathway_graphs) > PATHWAY_GRAPHS_CACHED:
+                _pathway_graphs.popitem(last=False)
+        return graph
+
+    @staticmethod
+    def pathway_graph(pathway, self_loops: bool = False):
+        """Create graph of the pathway (see `get_pathway`) from parsed KGML.
+
+        Args:
+            pathway: `kgml.KGMLPathway`, or a dict returned by
+                `bioservices.KEGG.parse_kgml_pathway`; None gives an empty graph
+
+        Only intra-pathway interactions are taken into account; the
+        interactions going through compounds, orthologs or other
+        non-gene nodes are replaced with 'indirect' edges between genes
+        (see `graphs.gene_graph`).
+        """
+        if not pathway:
+            return nx.DiGraph()
+        if isinstance(pathway, dict):
+            pathway = KGMLPathway.from_parsed(pathway)
+        return pathway.graph(self_loops)
+
+    def fetch_organism_codes(self):
+        """
+
+        Returns:
+            Dictionary with organisms as keys, and KEGG organism codes as values
+            {   'homo sapiens' : 'hsa',
+                'human' : 'hsa',
+                ...
+            }
+
+        """
+        return self.organism_table().codes
+
+    def organism_table(self) -> OrganismTable:
+        """Return the table of all KEGG organisms, shared by all instances."""
+        directory = self.cache.directory
+        if directory not in _organism_tables:
+            _organism_tables[directory] = OrganismTable.from_kegg_list(self.request('list', 'organism'))
+        return _organism_tables[directory]
+
+    def get_organism_code(self, org: str):
+        """
+
+        Common organisms are resolved with a bundled snapshot,
+        others with the complete list of organisms from KEGG.
+
+        Args:
+            org: organism name (ex. 'Homo sapiens', 'human') or KEGG code (ex. 'hsa')
+                - lowercase and uppercase optional
+
+        Returns:
+            str: KEGG organism code
+
+        """
+        if org in SNAPSHOT:
+            return SNAPSHOT.code(org)
+        try:
+            return self.organism_table().code(org)
+        except KeyError:
+            print('Invalid organism name.')
+            raise
+
+    def get_gene_code(self, gen: str):
+        """
+
+        Args:
+            gen: gene name (ex. 'FGR', 'NIPAL1')
+
+        Returns:
+            KEGG gene code
+
+        """
+        code_gen = self.request('find', self.organism, gen)
+
+        if not code_gen or code_gen == str('\n'):
+            code_gen = str()
+            print('Invalid gene name: '+str(gen))
+        return code_gen
@@ -0,0 +1,141 @@
+"""Streaming parser of KGML (KEGG Markup Language) files of pathways.
+
+Only what is needed to create graphs of genes is kept: the names and
+types of the entries taking part in relations, and the relations
+themselves as arrays of positions of the entries and interaction codes.
+"""
+from typing import Iterable, Mapping
+from xml.etree.ElementTree import XMLPullParser
+
+import numpy as np
+
+from .graphs import gene_graph
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+class KGMLPathway:
+    """Relations between the nodes of a pathway, in compact form.
+
+    Entries sharing a name (as displayed on the map, e.g. 'TP53, LFS1')
+    are one node; nodes are ordered as they appear in the relations.
+
+    Attributes:
+        names: name of each node
+        types: type of each node ('gene', 'compound', 'ortholog', ...)
+        sources, targets: positions of nodes for each relation (entry1 -> entry2)
+        interactions: code of the interaction type of each relation
+        interaction_types: interaction type (e.g. 'activation') of each code;
+            None for relations without a subtype
+    """
+    __slots__ = ('names', 'types', 'sources', 'targets', 'interactions', 'interaction_types')
+
+    def __init__(self, entries: Mapping[str, tuple], relations: Iterable[tuple]):
+        """
+        Args:
+            entries: entry id -> (name, type) of entries having names
+            relations: (entry1 id, entry2 id, interaction type) triples
+        """
+        positions = {}
+        codes = {}
+        self.names = []
+        self.types = []
+        sources, targets, interactions = [], [], []
+
+        for first, second, interaction in relations:
+            if first not in entries or second not in entries:
+                # only intra-pathway interactions are taken into account
+                continue
+            ends = []
+            for name, node_type in (entries[first], entries[second]):
+                if name not in positions:
+                    positions[name] = len(self.names)
+                    self.names.append(name)
+                    self.types.append(node_type)
+                # a node has the type of the last of its entries, as the type in networkx graph would
+                self.types[positions[name]] = node_type
+                ends.append(positions[name])
+            sources.append(ends[0])
+            targets.append(ends[1])
+            interactions.append(codes.setdefault(interaction, len(codes)))
+
+        self.sources = np.array(sources, dtype=np.int32)
+        self.targets = np.array(targets, dtype=np.int32)
+        self.interactions = np.array(interactions, dtype=np.uint16)
+        self.interaction_types = list(codes)
+
+    @classmethod
+    def from_parsed(cls, pathway: dict):
+        """Convert pathway parsed by `bioservices.KEGG.parse_kgml_pathway`."""
+        return cls(
+            {entry['id']: (entry['gene_names'], entry['type']) for entry in pathway['entries'] if entry['gene_names']},
+            ((relation['entry1'], relation['entry2'], relation['name']) for relation in pathway['relations'])
+        )
+
+    def __len__(self):
+        """Number of relations."""
+        return len(self.sources)
+
+    def graph(self, self_loops=False):
+        """Create graph of genes of the pathway (see `graphs.gene_graph`)."""
+        return gene_graph(
+            self.names, self.types,
+            zip(self.sources.tolist(), self.targets.tolist(), [self.interaction_types[code] for code in self.interactions]),
+            self_loops
+        )
+
+
+def parse_kgml(kgml) -> KGMLPathway:
+    """Parse KGML (given as str or bytes) incrementally.
+
+    Entries and relations are discarded from the XML tree as soon as they
+    are read, so the whole document is never held as a tree of elements.
+    Matches `bioservices.KEGG.parse_kgml_pathway`: the name of an entry
+    is the name of its graphics (entries without one are skipped) and a
+    relation gives one interaction per subtype (or None if it has none).
+    """
+    parser = XMLPullParser(events=('start', 'end'))
+    entries = {}
+    relations = []
+
+    entry = None
+    relation = None
+    subtypes = []
+    root = None
+
+    def process(events):
+        nonlocal entry, relation, subtypes, root
+        for event, element in events:
+            tag = element.tag
+            if event == 'start':
+                if root is None:
+                    root = element
+                elif tag == 'entry':
+                    entry = [element.get('id'), None, element.get('type')]
+                elif tag == 'graphics' and entry is not None and entry[1] is None:
+                    entry[1] = element.get('name') or ''
+                elif tag == 'relation':
+                    relation = (element.get('entry1'), element.get('entry2'))
+                    subtypes = []
+                elif tag == 'subtype' and relation is not None:
+                    subtypes.append(element.get('name'))
+            elif tag == 'entry':
+                entry_id, name, entry_type = entry
+                if name:
+                    entries[entry_id] = (name, entry_type)
+                entry = None
+                root.clear()
+            elif tag == 'relation':
+                for subtype in subtypes or [None]:
+                    relations.append((*relation, subtype))
+                relation = None
+                root.clear()
+
+    for start in range(0, len(kgml), CHUNK_SIZE):
+        parser.feed(kgml[start:start + CHUNK_SIZE])
+        process(parser.read_events())
+    parser.close()
+    process(parser.read_events())
+
+    return KGMLPathway(entries, relations)
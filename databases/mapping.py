@@ -0,0 +1,69 @@
+from typing import Iterable, Mapping
+
+import pandas as pd
+
+from .index import parse_gene_list, strip_prefix
+
+
+def parse_conversions(text: str) -> dict:
+    """Parse the response of KEGG `conv/ncbi-geneid/<org>` query into gene id: NCBI gene id mapping.
+
+    Lines look like: hsa:675<tab>ncbi-geneid:675
+    """
+    conversions = {}
+    for line in text.split('\n'):
+        if line:
+            first, second = line.split('\t')[:2]
+            if first.startswith('ncbi-geneid:'):
+                first, second = second, first
+            conversions[strip_prefix(first)] = strip_prefix(second)
+    return conversions
+
+
+class GeneMapping:
+    """Maps genes of an organism to NCBI (Entrez) gene ids, in bulk.
+
+    Genes can be given by symbols (ex. 'BRCA2') or by KEGG gene ids
+    without the organism prefix (ex. '675'); as in `PathwayIndex`,
+    gene ids take precedence over primary symbols, and these over aliases.
+    A symbol of many genes maps to the gene with the lowest id.
+
+    Args:
+        symbols: primary symbol -> set of KEGG gene ids
+        aliases: alias -> set of KEGG gene ids
+        conversions: KEGG gene id -> NCBI gene id
+    """
+
+    def __init__(self, symbols: Mapping[str, set], aliases: Mapping[str, set], conversions: Mapping[str, str]):
+        table = {}
+        # later sources override the earlier ones
+        for names in [aliases, symbols]:
+            for name, gene_ids in names.items():
+                mapped = sorted(gene_id for gene_id in gene_ids if gene_id in conversions)
+                if mapped:
+                    table[name] = conversions[mapped[0]]
+        table.update(conversions)
+
+        self.table = pd.Series(table, dtype=object)
+
+    @classmethod
+    def from_kegg(cls, gene_list: str, conversions: str):
+        """Create the mapping from responses of KEGG `list/<org>` and `conv/ncbi-geneid/<org>` queries."""
+        symbols, aliases = parse_gene_list(gene_list)
+        return cls(symbols, aliases, parse_conversions(conversions))
+
+    def __len__(self):
+        return len(self.table)
+
+    def map(self, genes: Iterable[str]):
+        """Map genes to NCBI gene ids.
+
+        Returns:
+            (ids, unmapped): list of NCBI gene ids for the genes (None for
+            genes which could not be mapped), and list of these genes
+        """
+        genes = list(genes)
+        ids = self.table.reindex(genes)
+        missing = ids.isnull().to_numpy()
+        unmapped = [gene for gene, is_missing in zip(genes, missing) if is_missing]
+        return [None if is_missing else gene_id for gene_id, is_missing in zip(ids, missing)], unmapped
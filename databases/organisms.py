@@ -0,0 +1,85 @@
+from collections import defaultdict
+from typing import Mapping
+
+
+class OrganismTable:
+    """Maps names of organisms to KEGG organism codes and back.
+
+    Names (scientific and common ones) are matched case-insensitively;
+    KEGG codes are accepted as well and map to themselves.
+
+    Args:
+        codes: lowercase names of organisms as keys and KEGG codes as values
+    """
+
+    def __init__(self, codes: Mapping[str, str]):
+        self.codes = dict(codes)
+        self.names = defaultdict(list)
+        for name, code in self.codes.items():
+            self.names[code].append(name)
+
+    @classmethod
+    def from_kegg_list(cls, text: str):
+        """Parse the response of KEGG `list/organism` query.
+
+        Lines look like: T01001<tab>hsa<tab>Homo sapiens (human)<tab>lineage
+        """
+        codes = {}
+        for line in text.split('\n'):
+            if line:
+                code = line.split('\t')[1]
+                org = line.split('\t')[2]
+                if '(' in org:
+                    org = [x.strip().lower() for x in org[:-1].split('(')]
+                    for o in org:
+                        codes[o] = code
+                else:
+                    codes[org.lower()] = code
+        return cls(codes)
+
+    def code(self, organism: str) -> str:
+        """Return KEGG code of the organism; raise KeyError if unknown."""
+        organism = organism.lower()
+        if organism in self.codes:
+            return self.codes[organism]
+        if organism in self.names:
+            return organism
+        raise KeyError(organism)
+
+    def names_of(self, code: str) -> list:
+        """Return all known names of the organism with given KEGG code."""
+        return self.names.get(code, [])
+
+    def __contains__(self, organism: str):
+        organism = organism.lower()
+        return organism in self.codes or organism in self.names
+
+    def __len__(self):
+        return len(self.codes)
+
+
+# organisms supported by SPIA, (code, scientific name, common name);
+# these are resolved without fetching the complete list from KEGG
+SNAPSHOT = OrganismTable({
+    name.lower(): code
+    for code, *names in [
+        ('aga', 'Anopheles gambiae', 'anopheles'),
+        ('bta', 'Bos taurus', 'bovine'),
+        ('cel', 'Caenorhabditis elegans', 'worm'),
+        ('cfa', 'Canis familiaris', 'canine'),
+        ('dme', 'Drosophila melanogaster', 'fly'),
+        ('dre', 'Danio rerio', 'zebrafish'),
+        ('eco', 'Escherichia coli K12', 'ecoliK12'),
+        ('ecs', 'Escherichia coli Sakai', 'ecoliSakai'),
+        ('gga', 'Gallus gallus', 'chicken'),
+        ('hsa', 'Homo sapiens', 'human'),
+        ('mcc', 'Macaca mulatta', 'rhesus'),
+        ('mmu', 'Mus musculus', 'mouse'),
+        ('ptr', 'Pan troglodytes', 'chimp'),
+        ('rno', 'Rattus norvegicus', 'rat'),
+        ('sce', 'Saccharomyces cerevisiae', 'yeast'),
+        ('ssc', 'Sus scrofa', 'pig'),
+        ('xla', 'Xenopus laevis', 'xenopus'),
+    ]
+    for name in names
+})
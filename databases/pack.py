@@ -0,0 +1,291 @@
+"""Pathways of an organism compiled into a single, memory-mappable file.
+
+Packs make the analyses reproducible (the data does not change between
+runs) and possible on nodes without access to the Internet. Build one with::
+
+    ./patapy.py kegg build-pack hsa --output data/kegg/hsa.pack
+
+and use it with `KEGGPathways(pack='data/kegg/hsa.pack')` or by setting
+PATAPY_KEGG_PACKS to a directory with packs named after the organisms.
+
+Layout of the file:
+    - MAGIC, format version (uint32) and length of the header (uint64)
+    - header: JSON with metadata and the offsets, types and shapes of arrays
+    - arrays, each aligned to ALIGNMENT bytes
+
+Strings are stored as UTF-8 blobs with int64 offsets. Graphs of all
+pathways share one adjacency matrix in CSR format (nodes of each pathway
+occupy a contiguous range of rows) with the interaction type of each edge.
+"""
+import json
+import os
+import re
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Sequence
+
+import networkx as nx
+import numpy as np
+
+
+MAGIC = b'PATAPACK'
+
+FORMAT_VERSION = 1
+
+ALIGNMENT = 64
+
+# directory with packs (named <organism code>.pack) to be used by default
+PACKS_VARIABLE = 'PATAPY_KEGG_PACKS'
+
+
+class PackError(Exception):
+    pass
+
+
+def default_pack_path(organism: str):
+    """Return the path of the pack for the organism in PATAPY_KEGG_PACKS directory, if it exists."""
+    directory = os.environ.get(PACKS_VARIABLE)
+    if directory:
+        path = Path(directory) / f'{organism}.pack'
+        if path.exists():
+            return path
+
+
+def encode_strings(strings: Sequence[str]):
+    encoded = [string.encode() for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(string) for string in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def decode_strings(blob: np.ndarray, offsets: np.ndarray):
+    data = blob.tobytes()
+    return [data[start:end].decode() for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def csr(rows: Sequence[Sequence[int]], dtype=np.int32):
+    """Create (indptr, indices) of a sparse matrix with given column indices in each row."""
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum([len(row) for row in rows], out=indptr[1:])
+    indices = np.fromiter((column for row in rows for column in row), dtype=dtype, count=indptr[-1])
+    return indptr, indices
+
+
+def write_pack(path, metadata: dict, arrays: dict):
+    """Write arrays (a name: numpy array mapping) with metadata to a pack file."""
+    directory = {}
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        arrays[name] = array
+        directory[name] = {'dtype': array.dtype.str, 'shape': array.shape, 'offset': offset}
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+
+    header = json.dumps({**metadata, 'format': FORMAT_VERSION, 'arrays': directory}).encode()
+    preamble_size = len(MAGIC) + 4 + 8
+    data_start = -(-(preamble_size + len(header)) // ALIGNMENT) * ALIGNMENT
+
+    temporary = Path(str(path) + '.part')
+    with open(temporary, 'wb') as f:
+        f.write(MAGIC)
+        f.write(np.uint32(FORMAT_VERSION).tobytes())
+        f.write(np.uint64(len(header)).tobytes())
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(data_start + directory[name]['offset'])
+            f.write(array.tobytes())
+        # make sure that the file covers the padding of the last array
+        f.truncate(data_start + offset)
+    os.replace(temporary, path)
+
+
+class KEGGPack:
+    """Read-only access to a pack file; the arrays are memory-mapped."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+        with open(self.path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise PackError(f'{path} is not a pack of KEGG pathways')
+            version = int(np.frombuffer(f.read(4), dtype=np.uint32)[0])
+            if version != FORMAT_VERSION:
+                raise PackError(
+                    f'{path} has format version {version}, while version {FORMAT_VERSION} is supported; '
+                    f'please rebuild the pack'
+                )
+            header_length = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+            self.metadata = json.loads(f.read(header_length).decode())
+
+        self.organism = self.metadata['organism']
+        self.self_loops = self.metadata['self_loops']
+        self.interaction_types = [list(types) for types in self.metadata['interaction_types']]
+
+        data_start = -(-(len(MAGIC) + 4 + 8 + header_length) // ALIGNMENT) * ALIGNMENT
+        buffer = np.memmap(self.path, dtype=np.uint8, mode='r')
+        self.arrays = {}
+        for name, array in self.metadata['arrays'].items():
+            dtype = np.dtype(array['dtype'])
+            start = data_start + array['offset']
+            count = int(np.prod(array['shape']))
+            self.arrays[name] = buffer[start:start + count * dtype.itemsize].view(dtype).reshape(array['shape'])
+
+        # string tables are small, these are decoded at once
+        self.pathway_ids = self.strings('pathway_ids')
+        self.pathway_names = dict(zip(self.pathway_ids, self.strings('pathway_names')))
+        self.pathway_positions = {pathway: i for i, pathway in enumerate(self.pathway_ids)}
+        self.node_names = self.strings('node_names')
+        self.genes = {gene: i for i, gene in enumerate(self.strings('genes'))}
+
+    def strings(self, name):
+        return decode_strings(self.arrays[name + '.blob'], self.arrays[name + '.offsets'])
+
+    def __contains__(self, pathway_id):
+        return pathway_id in self.pathway_positions
+
+    def get_pathway(self, pathway_id: str) -> nx.DiGraph:
+        """Return graph of the pathway (as `KEGGPathways.get_pathway`); empty for unknown pathways."""
+        G = nx.DiGraph()
+
+        if pathway_id not in self.pathway_positions:
+            return G
+
+        position = self.pathway_positions[pathway_id]
+        first, last = self.arrays['pathway_nodes'][position:position + 2]
+
+        indptr = self.arrays['adjacency.indptr']
+        indices = self.arrays['adjacency.indices']
+        types = self.arrays['adjacency.types']
+
+        for node in range(first, last):
+            G.add_node(self.node_names[node], type='gene')
+
+        for node in range(first, last):
+            for edge in range(indptr[node], indptr[node + 1]):
+                G.add_edge(
+                    self.node_names[node], self.node_names[indices[edge]],
+                    type=list(self.interaction_types[types[edge]])
+                )
+
+        return G
+
+    def pathways_for_genes(self, genes) -> dict:
+        indptr = self.arrays['gene_pathways.indptr']
+        indices = self.arrays['gene_pathways.indices']
+        pathways = {}
+        for gene in genes:
+            if gene in self.genes:
+                row = self.genes[gene]
+                for position in indices[indptr[row]:indptr[row + 1]]:
+                    pathway = self.pathway_ids[position]
+                    pathways[pathway] = self.pathway_names[pathway]
+        return pathways
+
+
+def kegg_release(db) -> str:
+    """Return the release of KEGG, if available (e.g. '106.0+/05-13, May 23')."""
+    if db.offline:
+        return None
+    try:
+        info = db.query('info', db.organism)
+        return re.search(r'Release\s+(.*)', info).group(1).strip()
+    except Exception:
+        return None
+
+
+def build_pack(db, path, self_loops=False, workers=3):
+    """Compile all pathways of the organism of `db` (a KEGGPathways) into a pack.
+
+    Returns:
+        the created `KEGGPack`
+    """
+    index = db.pathway_index()
+    if not index:
+        raise PackError(f'Cannot retrieve the list of pathways of {db.organism} from KEGG')
+
+    pathway_ids = sorted(index.pathway_names)
+    graphs = dict(db.get_pathways(pathway_ids, self_loops=self_loops, workers=workers))
+
+    node_names = []
+    pathway_nodes = [0]
+    adjacency = []
+    edge_types = []
+    interaction_types = {}
+
+    for pathway_id in pathway_ids:
+        graph = graphs[pathway_id]
+        first = len(node_names)
+        positions = {node: first + i for i, node in enumerate(graph.nodes)}
+        node_names.extend(graph.nodes)
+        pathway_nodes.append(len(node_names))
+
+        for node in graph.nodes:
+            targets = []
+            for target, types in graph[node].items():
+                targets.append(positions[target])
+                edge_types.append(interaction_types.setdefault(tuple(types['type']), len(interaction_types)))
+            adjacency.append(targets)
+
+    # genes: symbols, aliases and KEGG gene ids, as understood by PathwayIndex
+    positions = {pathway: i for i, pathway in enumerate(pathway_ids)}
+    genes = sorted(set(index.symbols) | set(index.aliases) | set(index.gene_pathways))
+    gene_pathways = [
+        sorted(positions[pathway] for pathway in index.pathways_of(gene) if pathway in positions)
+        for gene in genes
+    ]
+
+    arrays = {}
+    for name, strings in [
+        ('pathway_ids', pathway_ids),
+        ('pathway_names', [index.pathway_names[pathway] for pathway in pathway_ids]),
+        ('node_names', node_names),
+        ('genes', genes)
+    ]:
+        arrays[name + '.blob'], arrays[name + '.offsets'] = encode_strings(strings)
+
+    arrays['pathway_nodes'] = np.array(pathway_nodes, dtype=np.int64)
+    arrays['adjacency.indptr'], arrays['adjacency.indices'] = csr(adjacency)
+    arrays['adjacency.types'] = np.array(edge_types, dtype=np.uint16)
+    arrays['gene_pathways.indptr'], arrays['gene_pathways.indices'] = csr(gene_pathways)
+
+    metadata = {
+        'organism': db.organism,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'kegg_release': kegg_release(db),
+        'self_loops': self_loops,
+        'interaction_types': sorted(interaction_types, key=interaction_types.get)
+    }
+
+    os.makedirs(Path(path).parent, exist_ok=True)
+    write_pack(path, metadata, arrays)
+
+    return KEGGPack(path)
+
+
+def main(argv=None):
+    from databases.kegg import KEGGPathways
+
+    parser = ArgumentParser(prog='patapy kegg', description='Manage local copies of KEGG data')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    build = commands.add_parser('build-pack', help='compile all pathways of an organism into a pack file')
+    build.add_argument('organism', help="organism name or KEGG code (ex. 'hsa', 'human')")
+    build.add_argument('--output', help='path of the pack, by default data/kegg/<organism code>.pack')
+    build.add_argument('--self-loops', action='store_true', help='keep self loops in the graphs of pathways')
+    build.add_argument('--workers', type=int, default=3, help='maximal number of concurrent downloads')
+    build.add_argument('--offline', action='store_true', help='use only the data from the local cache of KEGG')
+
+    args = parser.parse_args(argv)
+
+    db = KEGGPathways(args.organism, offline=args.offline or None, pack=False)
+    output = args.output or Path('data') / 'kegg' / f'{db.organism}.pack'
+
+    pack = build_pack(db, output, self_loops=args.self_loops, workers=args.workers)
+
+    print(
+        f'Saved {len(pack.pathway_ids)} pathways of {pack.organism} '
+        f'(KEGG release: {pack.metadata["kegg_release"] or "unknown"}) to {output}'
+    )
+    return pack
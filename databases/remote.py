@@ -0,0 +1,67 @@
+"""Direct access to KEGG REST API, for bulk downloads.
+
+bioservices opens a new request for each query and waits for it to
+complete; here the queries share a pool of keep-alive connections
+and can be run from multiple threads (within the rate limit).
+"""
+from threading import Lock
+from time import monotonic, sleep
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+KEGG_URL = 'https://rest.kegg.jp'
+
+# URL of a server to use instead of KEGG (e.g. a mirror or a local stand-in for tests)
+KEGG_URL_VARIABLE = 'PATAPY_KEGG_URL'
+
+# KEGG asks not to exceed three requests per second
+KEGG_REQUESTS_PER_SECOND = 3
+
+
+class RateLimiter:
+    """Spaces out calls of `wait` so that at most `rate` calls per second pass.
+
+    Thread-safe: concurrent callers are given consecutive time slots.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self.next_slot = monotonic()
+        self.lock = Lock()
+
+    def wait(self):
+        with self.lock:
+            now = monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            sleep(slot - now)
+
+
+# shared by all the downloads of the process, as the limit applies to the client
+kegg_rate_limiter = RateLimiter(KEGG_REQUESTS_PER_SECOND)
+
+
+def pooled_session(connections: int) -> requests.Session:
+    """Create a session keeping up to `connections` keep-alive connections per host."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=connections, max_retries=2)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_text(session: requests.Session, url: str, limiter: RateLimiter = kegg_rate_limiter, timeout=60):
+    """Return the body of the response, or None if not found (HTTP 404).
+
+    Pass None as `limiter` to send the request immediately.
+    """
+    if limiter:
+        limiter.wait()
+    response = session.get(url, timeout=timeout)
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.text
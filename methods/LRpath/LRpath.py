@@ -8,10 +8,14 @@ import statsmodels.api as sm
 from scipy import stats
 
 from databases import KEGGPathways
-from methods.method import Method, MethodResult
+from methods.method import Method, MethodResult, offline_argument
 from models import Experiment
 
 
+# how many of the genes which could not be mapped are named in the warning
+UNMAPPED_SHOWN = 10
+
+
 class LRpathResult(MethodResult):
     columns = ['Path_ID', 'nGene', 'LRcoeff', 'odds_ratio', 'LRpvalue', 'catsigIDs']
     description = """ 
@@ -64,9 +68,11 @@ class LRpath(Method):
 
     legal_disclaimer = """ Copyright 2010 The University of Michigan  """
 
+    offline = offline_argument()
+
     def __init__(
             self, database, organism: str = 'Homo sapiens', min_g=10, max_g=None,
-            cutoff=0.05, odds_min=0.001, odds_max=0.5, markdown: str = ''
+            cutoff=0.05, odds_min=0.001, odds_max=0.5, markdown: str = '', offline: bool = False
     ):
         """
 ma
@@ -80,6 +86,7 @@ ma
             odds_min: lower p-values be used
             odds_max: upper p-values to be used
             markdown: generate additional markdown output file with given name
+            offline: use only cached KEGG data (see `databases.KEGGPathways`)
         """
 
         self.database = database
@@ -90,6 +97,7 @@ ma
         self.odds_min = odds_min
         self.odds_max = odds_max
         self.markdown = markdown
+        self.offline = offline
         if markdown:
             if os.path.exists(markdown if '.md' in markdown else markdown.split('.')[0] + '.md'):
                 print("Warning: '" + markdown + "' file already exists and will be overwritten!")
@@ -151,14 +159,28 @@ ma
         return db
 
     def name_geneid(self, data, geneids):
-        geneid = []
-        for geny in geneids:
-            geneid.append(KEGGPathways(self.organism).get_gene_code(gen=geny.name).split()[0])
+        """
+        Map genes to Entrez gene ids (with KEGG tables fetched once per organism),
+        skipping genes which could not be mapped
+
+        """
+        kegg = KEGGPathways(self.organism, offline=self.offline)
+        geneid, unmapped = kegg.gene_mapping().map(geny.name for geny in geneids)
+
+        if unmapped:
+            shown = ', '.join(unmapped[:UNMAPPED_SHOWN])
+            if len(unmapped) > UNMAPPED_SHOWN:
+                shown += f' and {len(unmapped) - UNMAPPED_SHOWN} more'
+            print(
+                f'Warning: {len(unmapped)} of {len(geneid)} genes could not be mapped to Entrez gene ids '
+                f'and will be skipped: ' + shown
+            )
 
         data['gene_name'] = data.index
         data.index = geneid
+        data = data[data.index.notnull()]
 
-        return data, geneid
+        return data, [genid for genid in geneid if genid is not None]
 
     def get_list_db(self):
         """
@@ -230,7 +252,7 @@ ma
         for i in range(len(uniqids)):
             if newp[i] is not None:
                 if math.exp(-newp[i]) < self.cutoff:
-                    siggenes.append(uniqids[i][4:])
+                    siggenes.append(uniqids[i])
 
         if self.max_g is None:
             self.max_g = 99999
@@ -242,7 +264,7 @@ ma
             path = []
             for el in value:
                 for u in range(len(uniqids)):
-                    if el == uniqids[u][4:]:
+                    if el == uniqids[u]:
                         path.append(u)
 
             length = len(path)
@@ -1,6 +1,7 @@
 from .constants import *
 from databases import KEGGPathways
-from methods.method import Method, MethodResult
+from methods.alignment import AMBIGUOUS, NodeAlignment, unique_gene
+from methods.method import Method, MethodResult, backend_argument, offline_argument
 from models import Experiment
 from networkx import get_edge_attributes
 from scipy import stats
@@ -8,6 +9,7 @@ from scipy.stats import norm
 from stats import ttest
 from statsmodels.sandbox.stats import multicomp
 import math
+import multiprocess
 import numpy as np
 import os
 import pandas as pd
@@ -65,7 +67,16 @@ class SPIA(Method):
     help = __doc__
     name = "SPIA"
 
-    def __init__(self, organism: str = 'hsa', threshold: float = 0.05, nB: int = 2000, beta=None, markdown: str = ''):
+    # the linear solves release the GIL, so threads are the natural choice
+    # for parallel runs; serial by default to keep sampling reproducible
+    backend = backend_argument(default='serial')
+
+    offline = offline_argument()
+
+    def __init__(
+        self, organism: str = 'hsa', threshold: float = 0.05, nB: int = 2000, beta=None, markdown: str = '',
+        processes: int = 0, backend='serial', threads_per_worker: int = 0, offline: bool = False
+    ):
         """
 
         Args:
@@ -74,6 +85,11 @@ class SPIA(Method):
             nB: number of iterations of random sample choosing at SPIA algorithm
             beta: list of gene relations values, if None the values are default
             markdown: generate additional markdown output file with given name
+            processes: a number of processes (or threads) to use; by default all available cores will be utilized
+            backend: one of `multiprocess.BACKENDS`, 'serial' by default
+            threads_per_worker: a number of BLAS threads for each process (or thread);
+                by default the cores are divided equally between these
+            offline: use only cached KEGG data (see `databases.KEGGPathways`)
         """
         for x in SPECIES:
             if organism in x:
@@ -87,12 +103,16 @@ class SPIA(Method):
         self.nB = nB
         self.beta = beta
         self.markdown = markdown
+        self.processes = processes
+        self.backend = backend
+        self.threads_per_worker = threads_per_worker
+        self.offline = offline
         if markdown:
             if os.path.exists(markdown if '.md' in markdown else markdown.split('.')[0] + '.md'):
                 print("Warning: '" + markdown + "' file already exists and will be overwritten!")
 
     @staticmethod
-    def load_data_dict(dictionary, all):
+    def load_data_dict(dictionary, all, alignment=None):
         '''
 
         Part of this code is imported from https://github.com/iseekwonderful/PyPathway on MIT license.
@@ -101,12 +121,15 @@ class SPIA(Method):
         Args:
             dictionary: the json, this method will load data form json
             all: a python list of total genes. e.g. ['A', 'B', 'C', 'D']
+            alignment: alignment of the nodes with `all` (created if not given)
 
-        Returns: the loaded data
+        Returns: the loaded data; 'rows' of each pathway are the positions
+            of the genes of its nodes in `all` (negative for nodes without one)
 
         '''
         data = dictionary
-        Bb = set(all)
+        # each distinct node name is matched with the genes once, for all pathways
+        alignment = alignment or NodeAlignment(all, unique_gene)
         datpT = {}
         id2name = data['id2name']
         for pid, v in data.items():
@@ -115,15 +138,16 @@ class SPIA(Method):
             datpT[pid] = {}
             for key, d in v.items():
                 if key == 'row_names':
+                    rows = np.empty(len(d), dtype=np.int64)
                     for idname in range(len(d)):
-                        Aaa = set(d[idname].split(','))
-                        Ddd = list(Aaa.intersection(Bb))
-                        if Ddd:
-                            if len(Ddd) > 1:
-                                print("Error with gene names in pathway occured")
-                            else:
-                                d[idname] = Ddd[0]
+                        row = alignment.row(d[idname])
+                        if row >= 0:
+                            d[idname] = alignment.genes[row]
+                        elif row == AMBIGUOUS:
+                            print("Error with gene names in pathway occured")
+                        rows[idname] = row
                     datpT[pid][key] = d
+                    datpT[pid]['rows'] = rows
                 else:
                     m = np.zeros(
                         (len(v['row_names']), len(v['row_names'])))
@@ -135,7 +159,75 @@ class SPIA(Method):
         return datpT, id2name
 
     @staticmethod
-    def calculate_spia(de, all, dictionary, nB=2000, beta=None, combine='fisher'):
+    def analyze_pathway(pathway, de, fold_changes, all, nB, combine):
+        """Calculate pNDE, pPERT, pG and status of a single pathway.
+
+        Args:
+            pathway: a tuple with pathway id, matrix of gene relations, names of genes (row_names)
+                and positions of these genes in `all` (negative for nodes without a gene)
+            fold_changes: fold changes of DEGs aligned with `all` (zero for the other genes)
+            de, all, nB, combine: as in `calculate_spia`
+
+        Returns: a tuple (pathway id, pNDE, pPERT, pG, status), or None
+            if the perturbation cannot be calculated for the pathway
+        """
+        k, v, row_names, rows = pathway
+        genes = set(all)
+        # let first calculate the pNDE
+        noMy = len(
+            set(row_names) & set(de.keys()))
+        pNDE = stats.hypergeom.sf(noMy - 1, len(all), len(set(row_names) & genes), len(de))
+        # then calculate the Ac and pPERT
+        M = np.eye(v.shape[0]) * -1 + v
+        if np.linalg.det(M) == 0:
+            return None
+        X = np.zeros(len(rows))
+        found = rows >= 0
+        X[found] = fold_changes[rows[found]]
+        pfs = np.linalg.solve(M, -X)
+        smPFS = sum(pfs - X)
+        tAraw = smPFS
+        pfstmp = []
+        de_sample = list(de.values())
+        all_sample = [i for i, x in enumerate(row_names) if x in genes]
+        length = len(X)
+        for i in range(nB):
+            x = np.zeros(length)
+            sp = random.sample(de_sample, noMy)
+            idx = random.sample(all_sample, noMy)
+            x[idx] = sp
+            tt = np.linalg.solve(M, -x)
+            pfstmp.append(sum(tt - x))
+        tA = tAraw - np.median(np.array(pfstmp))
+        if tA > 0:
+            status = "Activated"
+        else:
+            status = "Inhibited"
+        ob = tA
+        pfstmp = np.array(pfstmp) - np.median(np.array(pfstmp))
+        if ob > 0:
+            pb = sum([1 for pf in pfstmp if pf >= ob]) / len(pfstmp) * 2
+            if pb <= 0:
+                pb = 1 / nB / 100
+            elif pb >= 1:
+                pb = 1
+        elif ob < 0:
+            pb = sum([1 for pf in pfstmp if pf <= ob]) / len(pfstmp) * 2
+            if pb <= 0:
+                pb = 1 / nB / 100
+            elif pb >= 1:
+                pb = 1
+        else:
+            pb = 1
+        if combine == 'fisher':
+            c = pNDE * pb
+            pG = c - c * math.log(c)
+        else:
+            pG = norm.cdf(norm.ppf(pNDE) + norm.ppf(pb) / math.sqrt(2))
+        return k, pNDE, pb, pG, status
+
+    @staticmethod
+    def calculate_spia(de, all, dictionary, nB=2000, beta=None, combine='fisher', pool=None):
         """
         This code is imported from https://github.com/iseekwonderful/PyPathway on MIT license.
         Contains SPIA algorithm.
@@ -147,6 +239,8 @@ class SPIA(Method):
             nB: number of iterations of random sample choosing
             beta: list of gene relations values, if None the values are default
             combine: way of calculating pG
+            pool: a pool (see `multiprocess.get_pool`) to analyse the pathways with;
+                by default the pathways are analysed one after another
 
         Returns: an array with pathway id, pathway name, pNDE, pPERT, pG, FDR correction,
         Bonferroni correction, status for each pathway
@@ -155,7 +249,12 @@ class SPIA(Method):
 
         de = {k: float(v) for k, v in de.items()}
         all = [x for x in all]
-        datpT_ALL, id2name = SPIA.load_data_dict(dictionary, all)
+        alignment = NodeAlignment(all, unique_gene)
+        datpT_ALL, id2name = SPIA.load_data_dict(dictionary, all, alignment)
+        fold_changes = np.zeros(len(all))
+        for gene, fold_change in de.items():
+            if gene in alignment.positions:
+                fold_changes[alignment.positions[gene]] = fold_change
         inter_value = i_val or beta
         rel_dict = {rel[i]: inter_value[i] for i in range(len(rel))}
         datp_ALL = {}
@@ -170,65 +269,19 @@ class SPIA(Method):
             z[z == 0] = -1
             r = np.divide(s, z)
             datp_ALL[k] = r
-        smPFS, tAraw, tA, pNDE, pb, pG, status = {}, {}, {}, {}, {}, {}, {}
-        # calculate the Ac
-        for k, v in datp_ALL.items():
-            row_names = datpT_ALL[k]['row_names']
-            # let first calculate the pNDE
-            noMy = len(
-                set(row_names) & set(de.keys()))
-            pNDE[k] = stats.hypergeom.sf(noMy - 1, len(all), len(set(row_names) & set(all)), len(de))
-            # then calculate the Ac and pPERT
-            M = np.eye(v.shape[0]) * -1 + v
-            if np.linalg.det(M) == 0:
-                smPFS[k], tAraw[k], tA[k], pb[k] = np.nan, np.nan, np.nan, np.nan
+        pool = pool or multiprocess.SerialPool()
+        pathways = [(k, v, datpT_ALL[k]['row_names'], datpT_ALL[k]['rows']) for k, v in datp_ALL.items()]
+        # the cost is dominated by nB linear solves for each pathway
+        costs = [len(row_names) ** 3 for k, v, row_names, rows in pathways]
+        analysed = pool.imap(
+            SPIA.analyze_pathway, pathways,
+            shared_args=(de, fold_changes, all, nB, combine), ordered=True, costs=costs
+        )
+        pNDE, pb, pG, status = {}, {}, {}, {}
+        for result in analysed:
+            if result is None:
                 continue
-            X = []
-            for x in row_names:
-                if x in de:
-                    X.append(de[x])
-                else:
-                    X.append(0)
-            pfs = np.linalg.solve(M, -np.array(X))
-            smPFS[k] = sum(pfs - X)
-            tAraw[k] = smPFS[k]
-            pfstmp = []
-            de_sample = list(de.values())
-            all_sample = [i for i, x in enumerate(row_names) if x in all]
-            length = len(X)
-            for i in range(nB):
-                x = np.zeros(length)
-                sp = random.sample(de_sample, noMy)
-                idx = random.sample(all_sample, noMy)
-                x[idx] = sp
-                tt = np.linalg.solve(M, -x)
-                pfstmp.append(sum(tt - x))
-            tA[k] = tAraw[k] - np.median(np.array(pfstmp))
-            if tA[k] > 0:
-                status[k] = "Activated"
-            else:
-                status[k] = "Inhibited"
-            ob = tA[k]
-            pfstmp = np.array(pfstmp) - np.median(np.array(pfstmp))
-            if ob > 0:
-                pb[k] = sum([1 for pf in pfstmp if pf >= ob]) / len(pfstmp) * 2
-                if pb[k] <= 0:
-                    pb[k] = 1 / nB / 100
-                elif pb[k] >= 1:
-                    pb[k] = 1
-            elif ob < 0:
-                pb[k] = sum([1 for pf in pfstmp if pf <= ob]) / len(pfstmp) * 2
-                if pb[k] <= 0:
-                    pb[k] = 1 / nB / 100
-                elif pb[k] >= 1:
-                    pb[k] = 1
-            else:
-                pb[k] = 1
-            if combine == 'fisher':
-                c = pNDE[k] * pb[k]
-                pG[k] = c - c * math.log(c)
-            else:
-                pG[k] = norm.cdf(norm.ppf(pNDE[k]) + norm.ppf(pb[k]) / math.sqrt(2))
+            k, pNDE[k], pb[k], pG[k], status[k] = result
         _, o, _, _ = multicomp.multipletests(list(pG.values()), method='fdr_bh')
         pGfdr = {list(pG.keys())[i]: o[i] for i in range(len(list(pG.keys())))}
         _, o, _, _ = multicomp.multipletests(list(pG.values()), method='bonferroni')
@@ -260,18 +313,14 @@ class SPIA(Method):
             # if there are no DEGs anywhere, the problem of finding the impact on various pathways is meaningless
             print('No differentialy expressed genes.')
             return SPIAResult([])
-        db = KEGGPathways(self.organism)
-        pathways = {}
-        for gene in de.keys():
-            ps = db.search_by_gene(gene)
-            for (k, v) in ps.items():
-                if k not in pathways.keys():
-                    pathways[k] = v
+        db = KEGGPathways(self.organism, offline=self.offline)
+        pathways = db.pathways_for_genes(de.keys())
         if not pathways:
             print('No pathways found in database.')
             return SPIAResult([])
-        for (id, descr) in pathways.items():
-            pathway = db.get_pathway(id)
+        # keep the order of pathways, regardless of the order of arrival
+        json = dict.fromkeys(pathways)
+        for id, pathway in db.get_pathways(pathways):
             path_genes = set(pathway.nodes)
             path_genes = list(path_genes)
             interaction_list = {i: [] for i in rel}
@@ -285,7 +334,8 @@ class SPIA(Method):
             interaction_list['row_names'] = path_genes
             json[id] = interaction_list
         json['id2name'] = pathways
-        s = SPIA.calculate_spia(de, all, json)
+        pool = multiprocess.get_pool(self.processes, self.backend, self.threads_per_worker)
+        s = SPIA.calculate_spia(de, all, json, pool=pool)
         result = SPIAResult(s)
         if self.markdown:
             result.generate_markdown(self.markdown, 'Results of SPIA:')
@@ -0,0 +1,110 @@
+from typing import Callable, Mapping, Sequence
+
+import networkx as nx
+import numpy as np
+
+
+# rows of nodes which do not correspond to a gene of the experiment
+NOT_FOUND = -1
+AMBIGUOUS = -2
+
+
+def first_gene(node: str, positions: Mapping[str, int]) -> int:
+    """Choose the first of the genes of the node present in the experiment.
+
+    As in Impact Analysis, the node is considered only if any of its
+    names, not stripped of whitespace, is a gene of the experiment.
+    """
+    names = node.split(',')
+    if any(name in positions for name in names):
+        for name in names:
+            if name.strip() in positions:
+                return positions[name.strip()]
+    return NOT_FOUND
+
+
+def unique_gene(node: str, positions: Mapping[str, int]) -> int:
+    """Choose the gene of the node if exactly one of its names (as in SPIA) is a gene of the experiment."""
+    matches = set(node.split(',')) & positions.keys()
+    if len(matches) > 1:
+        return AMBIGUOUS
+    return positions[matches.pop()] if matches else NOT_FOUND
+
+
+class AlignedPathway:
+    """Nodes of a pathway with positions of their genes in the arrays of an experiment.
+
+    Attributes:
+        nodes: nodes of the pathway graph
+        rows: rows of the genes of the nodes (negative for nodes without one)
+        positions: node -> index in `nodes`
+        genes: names of all genes of the nodes (stripped of whitespace)
+    """
+    __slots__ = ('nodes', 'rows', 'positions', 'genes')
+
+    def __init__(self, nodes: Sequence[str], rows: np.ndarray, genes: set):
+        self.nodes = list(nodes)
+        self.rows = rows
+        self.positions = {node: i for i, node in enumerate(self.nodes)}
+        self.genes = genes
+
+    def values(self, array, missing=0) -> np.ndarray:
+        """Gather values of the nodes from `array` (ex. fold changes) aligned with the genes of the experiment."""
+        found = self.rows >= 0
+        values = np.full(len(self.rows), missing, dtype=np.asarray(array).dtype)
+        values[found] = np.asarray(array)[self.rows[found]]
+        return values
+
+
+class NodeAlignment:
+    """Aligns nodes of pathways with the genes of an experiment.
+
+    Nodes of KEGG pathways are named with comma-separated names of genes
+    (ex. 'TP53, LFS1'). Each distinct name is resolved only once (for all
+    the pathways) to the position of its gene among `genes`, which are the
+    rows of the expression or fold change arrays; values of the nodes
+    of a pathway are then gathered from these arrays by the positions.
+
+    Args:
+        genes: names of the genes of the experiment, in the order of rows
+        resolve: chooses the gene of a node, given the name of the node
+            and gene name -> position mapping (see `first_gene`, `unique_gene`)
+    """
+
+    def __init__(self, genes: Sequence[str], resolve: Callable[[str, Mapping[str, int]], int] = first_gene):
+        self.genes = list(genes)
+        self.positions = {}
+        for i, gene in enumerate(self.genes):
+            self.positions.setdefault(gene, i)
+        self.resolve = resolve
+        self.node_rows = {}
+        self.node_genes = {}
+        self.pathways = {}
+
+    def row(self, node: str) -> int:
+        """Return the row of the gene of the node (negative if there is none)."""
+        if node not in self.node_rows:
+            self.node_rows[node] = self.resolve(node, self.positions)
+        return self.node_rows[node]
+
+    def gene_names(self, node: str) -> list:
+        if node not in self.node_genes:
+            self.node_genes[node] = [name.strip() for name in node.split(',')]
+        return self.node_genes[node]
+
+    def align(self, pathway: nx.DiGraph, pathway_id: str = None) -> AlignedPathway:
+        """Align the nodes of the pathway; these are remembered under `pathway_id`, if given."""
+        if pathway_id in self.pathways:
+            return self.pathways[pathway_id]
+
+        nodes = list(pathway.nodes)
+        rows = np.fromiter((self.row(node) for node in nodes), dtype=np.int64, count=len(nodes))
+        genes = {name for node in nodes for name in self.gene_names(node)}
+        aligned = AlignedPathway(nodes, rows, genes)
+
+        if pathway_id is not None:
+            self.pathways[pathway_id] = aligned
+        return aligned
+
+    def __getitem__(self, pathway_id: str) -> AlignedPathway:
+        return self.pathways[pathway_id]
@@ -0,0 +1,163 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Mapping, Sequence
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlparse
+from urllib.request import Request, urlopen
+from warnings import warn
+
+
+# a file in sha256sum format, placed in the root of a remote (or mirror)
+MANIFEST = 'SHA256SUMS'
+
+CHUNK_SIZE = 64 * 1024
+
+# seconds to wait for a response (or for each chunk of it)
+TIMEOUT = 60
+
+
+class ChecksumError(Exception):
+    pass
+
+
+def sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_manifest(text: str) -> Mapping[str, str]:
+    """Parse output of sha256sum into relative path: checksum mapping."""
+    checksums = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        checksum, path = line.split(maxsplit=1)
+        # binary mode is marked with an asterisk
+        checksums[path.lstrip('*')] = checksum.lower()
+    return checksums
+
+
+def as_url(remote: str) -> str:
+    """Allow to use a plain path to a local directory as a mirror."""
+    if urlparse(remote).scheme in ('http', 'https', 'file'):
+        return remote
+    return Path(remote).resolve().as_uri() + '/'
+
+
+class Fetcher:
+    """Downloads files from a remote location to a local directory.
+
+    The remote can be a http(s) URL, a file:// URL or a path to a local
+    directory, so that air-gapped nodes can be seeded from a shared mirror.
+
+    Files are downloaded concurrently, to a temporary ".part" file first;
+    interrupted downloads are resumed (where the server supports ranges).
+    If the remote provides a manifest (see `MANIFEST`), the checksums of
+    downloaded files are verified before the files are put in place.
+    """
+
+    def __init__(
+        self, remote: str, destination: Path, workers: int=4, manifest: str=MANIFEST, timeout: float=TIMEOUT
+    ):
+        """
+        Args:
+            remote: base URL (or directory) with the files
+            destination: local directory to store the files in
+            workers: maximal number of concurrent downloads
+            manifest: path of checksums manifest, relative to the remote
+            timeout: seconds to wait for the server before giving up
+        """
+        self.remote = as_url(remote)
+        self.destination = Path(destination)
+        self.workers = workers
+        self.manifest = manifest
+        self.timeout = timeout
+        self._checksums = None
+
+    def url(self, relative_path) -> str:
+        return self.remote + str(relative_path)
+
+    @property
+    def checksums(self) -> Mapping[str, str]:
+        if self._checksums is None:
+            try:
+                with urlopen(self.url(self.manifest), timeout=self.timeout) as response:
+                    self._checksums = parse_manifest(response.read().decode())
+            except (HTTPError, URLError):
+                warn(f'No checksums manifest found at {self.url(self.manifest)}; integrity will not be verified.')
+                self._checksums = {}
+        return self._checksums
+
+    def is_valid(self, path: Path, relative_path) -> bool:
+        expected = self.checksums.get(str(relative_path))
+        return not expected or sha256(path) == expected
+
+    def fetch(self, relative_paths: Sequence) -> Sequence[Path]:
+        """Fetch multiple files concurrently.
+
+        Returns: local paths of fetched files
+        """
+        # load the manifest once, before workers need it
+        self.checksums
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(self.fetch_file, relative_paths))
+
+    def fetch_file(self, relative_path) -> Path:
+        """Fetch a single file unless a valid copy is already present.
+
+        Returns: local path of the fetched file
+        """
+        path = self.destination / relative_path
+
+        if path.exists() and self.is_valid(path, relative_path):
+            return path
+
+        os.makedirs(path.parent, exist_ok=True)
+
+        partial = path.with_name(path.name + '.part')
+
+        self.download(relative_path, partial)
+
+        if not self.is_valid(partial, relative_path):
+            partial.unlink()
+            raise ChecksumError(f'Checksum of {relative_path} fetched from {self.remote} does not match the manifest')
+
+        os.replace(partial, path)
+
+        return path
+
+    def download(self, relative_path, partial: Path):
+        """Download the file into `partial`, resuming from its current size."""
+        offset = partial.stat().st_size if partial.exists() else 0
+
+        request = Request(self.url(relative_path))
+        if offset:
+            request.add_header('Range', f'bytes={offset}-')
+
+        try:
+            response = urlopen(request, timeout=self.timeout)
+        except HTTPError as error:
+            # 416 Range Not Satisfiable: nothing is left after the offset
+            if error.code != 416 or not offset:
+                raise
+            if self.checksums.get(str(relative_path)) and self.is_valid(partial, relative_path):
+                # completed before an interruption (before it was put in place)
+                return
+            # no way to tell if it is complete, or it is not the same file
+            partial.unlink()
+            return self.download(relative_path, partial)
+
+        with response:
+            # servers not supporting ranges (and file:// URLs) send everything
+            if getattr(response, 'status', None) != 206:
+                offset = 0
+
+            with open(partial, 'ab' if offset else 'wb') as f:
+                for chunk in iter(lambda: response.read(CHUNK_SIZE), b''):
+                    f.write(chunk)
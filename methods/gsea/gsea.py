@@ -1,9 +1,12 @@
 import random
+from collections import namedtuple
 from itertools import chain
-from math import sqrt
+from math import sqrt, floor
 from operator import itemgetter
 from textwrap import dedent
+from time import monotonic
 from typing import List, Iterable, Sequence
+from uuid import uuid4
 from warnings import warn
 
 import numpy as np
@@ -14,16 +17,16 @@ from utils import jit
 
 import multiprocess
 from methods.gsea.shufflers import PhenotypeShuffler, GeneShuffler
-from methods.method import Method, MethodResult
+from methods.method import Method, MethodResult, backend_argument
 from metrics import signal_to_noise, RANKING_METRICS
 from models import Experiment, SampleCollection
-from .signatures import DatabaseParser, GeneSet
+from .signatures import DatabaseParser, GeneSet, GeneSetView, fetch_presets
 
 
 class GSEAResult(MethodResult):
 
     # TODO: FWER p-values
-    columns = ['name', 'enrichment', 'nominal_p_value', 'fdr']
+    columns = ['name', 'enrichment', 'nominal_p_value', 'fdr', 'tags', 'list_pct', 'leading_edge']
 
     description = """
     For help with interpreting the data see:
@@ -59,6 +62,12 @@ class ScoreDistribution:
         return len(self.positive_scores) + len(self.negative_scores)
 
 
+# score: the maximum deviation of running sum statistic from zero,
+# peak: position of the maximum deviation on the ranked list (None if there is no deviation),
+# hits: boolean mask of ranked list positions occupied by the genes of the gene set
+EnrichmentWalk = namedtuple('EnrichmentWalk', 'score, peak, hits')
+
+
 @jit
 def is_more_extreme(x, enrichment):
     """Is x more extreme (more negative or more positive) than provided enrichment?"""
@@ -145,12 +154,15 @@ class GeneralisedGSEA(Method):
         help="'genes' or 'phenotypes' (one of shufflers)"
     )
 
+    backend = backend_argument()
+
     def __init__(
         self, database, ranked_list_weight: float=1, ranking_metric=signal_to_noise,
         permutation_type=GeneShuffler, normalize_es=True,
         processes: positive_int=0, permutations: positive_int=1000,
         min_genes: positive_int=15, max_genes: positive_int=500,
-        descending_sort=True, match_gene_set=None, **kwargs
+        descending_sort=True, match_gene_set=None, fdr_cutoff: float=0.25,
+        time_budget: float=None, backend='process', threads_per_worker: positive_int=0, **kwargs
     ):
         """
 
@@ -166,6 +178,16 @@ class GeneralisedGSEA(Method):
             normalize_es: should enrichment scores be normalized (adjusting for variation in gene sets)?
             processes: a number of processes to use; by default all available cores will be utilized
             match_gene_set: a string for restricting gene sets by partial name match, useful for debugging
+            fdr_cutoff: leading edge subsets are reported for gene sets with FDR q-value not exceeding this cutoff
+            time_budget:
+                wall-clock limit for the analysis (in seconds); if given, the count
+                of permutations will be chosen as the largest one fitting in the budget
+                (as measured in a short calibration phase), up to `permutations`
+            backend: one of `multiprocess.BACKENDS`, 'process' by default
+            threads_per_worker:
+                a number of threads which numerical libraries (BLAS/OpenMP)
+                can use in each process; by default the cores are divided
+                equally between the processes
         """
         # TODO: store opts in a dict?
         if hasattr(database, 'database'):
@@ -175,7 +197,11 @@ class GeneralisedGSEA(Method):
         self.calculate_rank = ranking_metric
         self.normalize_es = normalize_es
         self.processes = processes
+        self.backend = backend
+        self.threads_per_worker = threads_per_worker
         self.permutations = permutations
+        # an upper bound of the count of permutations fitted in the time budget
+        self.max_permutations = permutations
         self.gene_sets = [
             gene_set for gene_set in self.database.gene_sets.values()
             if not match_gene_set or match_gene_set in gene_set.name
@@ -185,34 +211,44 @@ class GeneralisedGSEA(Method):
 
         self.shuffler_class = permutation_type
         self.shuffler = None
-        # TODO: p-value, fdr cutoff
+        self.membership = None
+        # key of the membership index in state of a persistent pool workers
+        self.membership_key = None
+        self.fdr_cutoff = fdr_cutoff
+        self.time_budget = time_budget
+        # TODO: p-value cutoff
 
-    def trim_gene_sets(self, gene_sets: Sequence[GeneSet], experiment: Experiment) -> Sequence[GeneSet]:
-        """Clear gene_sets of genes absent in expression dataset of experiment
+    def trim_gene_sets(self, gene_sets: Sequence[GeneSet], experiment: Experiment) -> Sequence[GeneSetView]:
+        """Create views of gene_sets without genes absent in expression dataset of experiment
 
         and remove those gene_sets that have less than min/max genes.
+        Gene sets of the database are not modified.
 
         Behaviour as documented in GSEA FAQ:
             http://software.broadinstitute.org/cancer/software/gsea/wiki/index.php/FAQ#Can_GSEA_analyze_a_gene_set_that_contains_genes_that_are_not_in_my_expression_dataset.3F
         """
         trimmed = []
-        genes = experiment.case.genes
+        genes = list(experiment.case.genes)
         min_genes, max_genes = self.min_max
 
+        membership = self.database.membership(genes)
+
         all_removed = set()
 
         for gene_set in gene_sets:
-            removed = gene_set.restrict_to_genes(genes)
-            all_removed.update(removed)
+            view = membership.view(gene_set)
 
-            if len(gene_set) == len(genes):
-                warn(f'{gene_set.name} has as many genes as the expression dataset')
+            if len(view) != len(gene_set):
+                all_removed.update(
+                    gene for gene in gene_set.genes
+                    if gene not in membership.gene_index
+                )
 
-            if min_genes <= len(gene_set) <= max_genes:
-                trimmed.append(gene_set)
+            if len(view) == len(genes):
+                warn(f'{gene_set.name} has as many genes as the expression dataset')
 
-            if len(gene_set) > len(genes):
-                assert False
+            if min_genes <= len(view) <= max_genes:
+                trimmed.append(view)
 
         diff = len(gene_sets) - len(trimmed)
 
@@ -224,6 +260,72 @@ class GeneralisedGSEA(Method):
         )
         return trimmed
 
+    # settings of the calibration phase of time-budgeted runs
+    calibration_sets = 3
+    calibration_permutations = 10
+    # a margin left for FDR computation, inter-process communication etc.
+    budget_safety_factor = 0.8
+
+    def calibration_sample(self, gene_sets: Sequence[GeneSetView]) -> List[GeneSetView]:
+        """Choose gene sets representative of the sizes of all the sets.
+
+        The sets are divided (by size) into `calibration_sets` strata
+        of equal count, and the median set of each stratum is chosen.
+        """
+        by_size = sorted(gene_sets, key=len)
+        strata = min(self.calibration_sets, len(by_size))
+        return [by_size[(2 * i + 1) * len(by_size) // (2 * strata)] for i in range(strata)]
+
+    def fit_permutations_in_budget(self, gene_sets: Sequence[GeneSetView], started: float, parallelism=1) -> int:
+        """Measure throughput of permutations and choose count of permutations fitting in the time budget.
+
+        The count is not larger than `max_permutations` (as given by the user).
+
+        Args:
+            gene_sets: gene sets to be analysed
+            started: time of the start of analysis (as given by `time.monotonic`)
+            parallelism: count of gene sets analysed at the same time (see `Pool.parallelism`)
+        """
+        sample = self.calibration_sample(gene_sets)
+        calibration_start = monotonic()
+
+        for gene_set in sample:
+            self.shuffler.set_gene_set(gene_set)
+            for _ in range(self.calibration_permutations):
+                self.shuffler.permute_and_score()
+
+        time_per_permutation = (monotonic() - calibration_start) / (len(sample) * self.calibration_permutations)
+
+        cores = min(parallelism, len(gene_sets))
+        remaining = self.time_budget - (monotonic() - started)
+
+        permutations = floor(
+            remaining * self.budget_safety_factor * cores
+            /
+            (time_per_permutation * len(gene_sets))
+        )
+
+        if permutations < 1:
+            raise ValueError(
+                f'Time budget of {self.time_budget} seconds is too small to '
+                f'perform even a single permutation for each of {len(gene_sets)} '
+                f'gene sets (estimated time per permutation: {time_per_permutation:.2g}s)'
+            )
+
+        if permutations > self.max_permutations:
+            print(
+                f'Estimated {time_per_permutation:.2g}s per permutation; '
+                f'{permutations} permutations fit in the time budget of {self.time_budget}s, '
+                f'{self.max_permutations} will be performed.'
+            )
+            return self.max_permutations
+
+        print(
+            f'Estimated {time_per_permutation:.2g}s per permutation; '
+            f'{permutations} permutations fit in the time budget of {self.time_budget}s.'
+        )
+        return permutations
+
     def sanity_check(self, experiment: Experiment):
 
         if len(experiment.case.genes) < self.min_max[0]:
@@ -237,9 +339,13 @@ class GeneralisedGSEA(Method):
         """Return list of gene sets sorted by normalized enrichment score.
 
         Each gene set in the list has FDR and enrichment_score assigned."""
+        started = monotonic()
 
         self.sanity_check(experiment)
 
+        # index of gene sets members, shared by all gene sets analyses
+        self.membership = self.database.membership(list(experiment.case.genes))
+
         gene_sets = self.trim_gene_sets(self.gene_sets, experiment)
 
         # L in the Subramanian2005 publication
@@ -254,20 +360,68 @@ class GeneralisedGSEA(Method):
             self.calculate_enrichment_score,
         )
 
-        args = (ranked_list, )
+        pool = multiprocess.get_pool(self.processes, self.backend, self.threads_per_worker)
+
+        if self.time_budget and gene_sets:
+            self.permutations = self.fit_permutations_in_budget(gene_sets, started, pool.parallelism)
+
+        # the observed ranking is passed as arrays, so that (if large enough)
+        # these can be shared with the workers instead of being copied
+        genes, ranks = zip(*ranked_list)
+        args = (self.membership.columns(genes), np.array(ranks))
+
+        if isinstance(pool, multiprocess.PersistentPool):
+            # the membership index is loaded into the workers of a persistent
+            # pool once, rather than sent with each of the analyses; the key
+            # is unique, so that it never refers to an index of another run
+            self.membership_key = ('membership', uuid4().hex)
+            pool.load(self.membership_key, self.membership)
 
-        pool = multiprocess.Pool(self.processes)
-        gene_sets = pool.imap(self.analyze_gene_set, gene_sets, shared_args=args)
+        # larger gene sets take longer to analyse, so these are scheduled first
+        costs = [len(gene_set) * self.permutations for gene_set in gene_sets]
 
-        sorted_gene_sets = sorted(gene_sets)
+        try:
+            gene_sets = pool.imap(self.analyze_gene_set, gene_sets, shared_args=args, costs=costs)
+            sorted_gene_sets = sorted(gene_sets)
+        finally:
+            if self.membership_key:
+                # the workers outlive the run: release the index
+                pool.unload(self.membership_key)
+                self.membership_key = None
+
+        if pool.utilisation:
+            print(pool.utilisation)
 
         self.compute_fdr(sorted_gene_sets)
 
-        return GSEAResult(sorted_gene_sets)
+        for gene_set in sorted_gene_sets:
+            self.find_leading_edge(gene_set, ranked_list)
+
+        return GSEAResult(
+            sorted_gene_sets,
+            description=(
+                f'Null distributions were created with {self.permutations} permutations '
+                f'(nominal p-value resolution: {1 / self.permutations:g})'
+            )
+        )
 
-    def analyze_gene_set(self, gene_set: GeneSet, ranked_list):
+    def __getstate__(self):
+        # workers need neither the database nor the full list of gene sets
+        state = self.__dict__.copy()
+        state['database'] = None
+        state['gene_sets'] = None
+        if self.membership_key:
+            state['membership'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.membership_key:
+            self.membership = multiprocess.worker_state[self.membership_key]
+
+    def analyze_gene_set(self, gene_set: GeneSetView, columns: np.ndarray, ranks: np.ndarray):
         # 1. step in the publication (Calculation of an Enrichment Score)
-        enrichment_score = self.calculate_enrichment_score(ranked_list, gene_set)
+        enrichment_score, peak, hits = self.enrichment_walk(columns, ranks, gene_set)
 
         # 2. step in the publication (Estimation of Significance Level of ES)
         null_distribution = self.enrichments_for_permuted_labels(gene_set)
@@ -286,8 +440,45 @@ class GeneralisedGSEA(Method):
         gene_set.nominal_p_value = nominal_p_value
         gene_set.null_distribution = null_distribution
 
+        # retained to extract the leading edge subset, if the set turns out to be significant
+        gene_set.peak = peak
+        gene_set.hit_positions = np.flatnonzero(hits)
+
         return gene_set
 
+    def find_leading_edge(self, gene_set: GeneSetView, ranked_list):
+        """Extract leading edge subset of an analysed gene set, if its FDR passes the cutoff.
+
+        The leading edge subset consists of the genes of the set which appear
+        in the ranked list before (or after, for negative enrichment) the
+        maximum deviation of the running sum statistic.
+
+        Sets following attributes of gene_set:
+            leading_edge: names of genes in the leading edge subset
+            tags: fraction of the genes of gene set which are in the leading edge
+            list_pct: fraction of ranked list before (or after) the peak
+        """
+        gene_set.leading_edge = gene_set.tags = gene_set.list_pct = None
+
+        significant = gene_set.fdr is not None and gene_set.fdr <= self.fdr_cutoff
+
+        if not significant or gene_set.peak is None:
+            return
+
+        positions = gene_set.hit_positions
+        peak = gene_set.peak
+        n = len(ranked_list)
+
+        if gene_set.enrichment > 0:
+            edge = positions[positions <= peak]
+            gene_set.list_pct = (peak + 1) / n
+        else:
+            edge = positions[positions >= peak]
+            gene_set.list_pct = (n - peak) / n
+
+        gene_set.tags = len(edge) / len(positions)
+        gene_set.leading_edge = ', '.join(ranked_list[position][0].name for position in edge)
+
     @action
     def show_licence(namespace):
         """Print out licence and legal information."""
@@ -295,8 +486,16 @@ class GeneralisedGSEA(Method):
 
     @action
     def download_all(namespace):
-        """Fetch all databases"""
-        pass
+        """Fetch all databases (from the remote, of the version and with identifiers given for the database)"""
+        # the database sub-parser is handled first, its namespace is nested
+        database = getattr(namespace, 'database', None)
+        options = {
+            option: getattr(database, option)
+            for option in ['remote', 'version', 'identifiers']
+            if hasattr(database, option)
+        }
+        for path in fetch_presets(**options):
+            print(path)
 
     def create_ranked_gene_list(self, case: SampleCollection, control: SampleCollection, labels_map=None):
         """
@@ -330,27 +529,27 @@ class GeneralisedGSEA(Method):
             reverse=self.descending_sort
         )
 
+    def calculate_enrichment_score(self, ranked_list, gene_set: GeneSetView) -> float:
+        genes, ranks = zip(*ranked_list)
+        return self.enrichment_walk(self.membership.columns(genes), np.array(ranks), gene_set).score
+
     @jit
-    def calculate_enrichment_score(self, ranked_list, gene_set: GeneSet):
+    def enrichment_walk(self, columns: np.ndarray, ranks: np.ndarray, gene_set: GeneSetView) -> EnrichmentWalk:
+        """Walk along a ranked list given as membership columns of genes and their ranks."""
         # TODO: review of formulas more than welcome;
         # based on formulas from "Appendix: Mathematical Description of Methods"
-        maximum_deviation = 0
-        running_sum_statistic_hits = 0
-        running_sum_statistic_misses = 0
+        hits = self.membership.hits(gene_set.row, columns)
 
         p = self.ranked_list_weight
 
-        n = len(ranked_list)
+        n = len(ranks)
         nh = len(gene_set)
 
         # P_miss(S, i, j)
         decrement = 1 / (n - nh)
 
         # weight, N_R
-        hit_denominator = 0
-        for gene, rank in ranked_list:
-            if gene in gene_set:
-                hit_denominator += abs(pow(rank, p))
+        hit_denominator = np.abs(np.power(ranks[hits], p)).sum()
 
         if not hit_denominator:
             # this means that ranks of all genes with are present
@@ -370,25 +569,24 @@ class GeneralisedGSEA(Method):
                 'or an attempt to use the same set of samples '
                 'for both: case and control'
             )
-            return 0
+            return EnrichmentWalk(0, None, hits)
 
-        for gene, rank in ranked_list:
+        # the walk along the ranked list: hits increase the running sum
+        # and misses decrease it; cumulative sums keep the exact order
+        # of additions of a step-by-step walk
+        running_sum_statistic_hits = np.cumsum(np.where(hits, np.power(ranks, p) / hit_denominator, 0))
+        running_sum_statistic_misses = np.cumsum(np.where(hits, 0, -decrement))
 
-            # hit
-            if gene in gene_set:
-                power_of_rank = pow(rank, p)
-                increment = power_of_rank / hit_denominator
-                running_sum_statistic_hits += increment
-            # miss
-            else:
-                running_sum_statistic_misses -= decrement
+        diff = running_sum_statistic_hits - running_sum_statistic_misses
 
-            diff = running_sum_statistic_hits - running_sum_statistic_misses
+        # the first position of the maximal deviation
+        peak = int(np.argmax(np.abs(diff)))
+        maximum_deviation = diff[peak]
 
-            if abs(diff) > abs(maximum_deviation):
-                maximum_deviation = diff
+        if not maximum_deviation:
+            return EnrichmentWalk(0, None, hits)
 
-        return maximum_deviation
+        return EnrichmentWalk(float(maximum_deviation), peak, hits)
 
     def enrichments_for_permuted_labels(self, gene_set):
         """Create null distribution by repetitive permutations of gene labels"""
@@ -396,6 +594,9 @@ class GeneralisedGSEA(Method):
         es_null = ScoreDistribution()
 
         shuffler = self.shuffler
+        if self.backend == 'thread':
+            # the threads cannot share state of a single shuffler
+            shuffler = shuffler.copy()
         shuffler.set_gene_set(gene_set)
 
         for score in range(self.permutations):
@@ -434,7 +635,7 @@ class GeneralisedGSEA(Method):
         return p_value
 
     @staticmethod
-    def compute_fdr(analyzed_gene_sets: List[GeneSet]):
+    def compute_fdr(analyzed_gene_sets: List[GeneSetView]):
         """FDR = a ratio of more extreme results in random distributions / observed.
 
         Citing from GSEA documentation:
@@ -542,25 +743,28 @@ class SimpleGSEA(GeneralisedGSEA):
     database = DatabaseParser()
 
     # TODO: test this
-    def calculate_enrichment_score(self, ranked_list, gene_set):
+    def enrichment_walk(self, columns, ranks, gene_set):
         # variable names were chosen to reflect description Supporting Text of GeneralisedGSEA
 
         maximum_deviation = 0
         running_sum_statistic = 0
+        peak = None
 
-        n = len(ranked_list)
+        n = len(ranks)
         nh = len(gene_set)
 
         increment = sqrt(n - nh) / nh
         decrement = sqrt(nh / (n - nh))
 
-        for gene, _ in ranked_list:
-            if gene in gene_set:
+        hits = self.membership.hits(gene_set.row, columns)
+
+        for position, hit in enumerate(hits):
+            if hit:
                 running_sum_statistic += increment
             else:
                 running_sum_statistic -= decrement
             if abs(running_sum_statistic) > abs(maximum_deviation):
                 maximum_deviation = running_sum_statistic
+                peak = position
 
-        return maximum_deviation
-
+        return EnrichmentWalk(maximum_deviation, peak, hits)
@@ -1,9 +1,12 @@
 from abc import ABC, abstractmethod
 from copy import copy
+
+import numpy as np
 from numpy.random import shuffle
 
-from methods.gsea.signatures import GeneSet
-from models import SampleCollection, Experiment
+from methods.gsea.signatures import GeneSetView
+from models import Sample, SampleCollection, Experiment
+from multiprocess.shared import share, unwrap
 
 
 def shuffle_and_divide(merged_collection, midpoint):
@@ -15,6 +18,20 @@ def shuffle_and_divide(merged_collection, midpoint):
     )
 
 
+def pack_collection(collection: SampleCollection, genes):
+    """Represent the collection as (name, sample names, samples × genes array of expression values)."""
+    values = np.array([[sample.data[gene] for gene in genes] for sample in collection.samples], dtype=float)
+    return collection.name, collection.labels, share(values)
+
+
+def unpack_collection(packed, genes) -> SampleCollection:
+    name, labels, values = packed
+    return SampleCollection(name, [
+        Sample(label, dict(zip(genes, row.tolist())))
+        for label, row in zip(labels, unwrap(values))
+    ])
+
+
 class Shuffler(ABC):
 
     @abstractmethod
@@ -24,9 +41,38 @@ class Shuffler(ABC):
         self.score = score
         self.gene_set = None
 
-    def set_gene_set(self, gene_set: GeneSet):
+    def set_gene_set(self, gene_set: GeneSetView):
         self.gene_set = gene_set
 
+    def __getstate__(self):
+        # expression values are pickled as arrays, which
+        # (if large enough) can be shared with the workers
+        state = self.__dict__.copy()
+        experiment = state.pop('experiment')
+        genes = list(experiment.case.genes)
+        state['expression'] = (
+            genes,
+            pack_collection(experiment.case, genes),
+            pack_collection(experiment.control, genes)
+        )
+        return state
+
+    def __setstate__(self, state):
+        genes, case, control = state.pop('expression')
+        self.__dict__.update(state)
+        self.experiment = Experiment(unpack_collection(case, genes), unpack_collection(control, genes))
+
+    def __copy__(self):
+        # copies in the same process share the experiment (unlike pickled ones);
+        # subclasses duplicate their mutable state of permutations
+        shuffler = self.__class__.__new__(self.__class__)
+        shuffler.__dict__.update(self.__dict__)
+        return shuffler
+
+    def copy(self):
+        """Create a shuffler with separate state, e.g. to be used in another thread."""
+        return copy(self)
+
     @abstractmethod
     def permute_and_score(self):
         pass
@@ -39,6 +85,15 @@ class PhenotypeShuffler(Shuffler):
         self.all_samples = experiment.case + experiment.control
         self.cases_cnt = len(experiment.case.samples)
 
+    def __getstate__(self):
+        state = super().__getstate__()
+        del state['all_samples']
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self.all_samples = self.experiment.case + self.experiment.control
+
     def permute_and_score(self):
         random_case, random_control = shuffle_and_divide(self.all_samples, self.cases_cnt)
         ranked_list = self.rank(random_case, random_control)
@@ -53,6 +108,11 @@ class GeneShuffler(Shuffler):
         self.gene_labels = list(experiment.control.genes)
         self.permutation = copy(self.gene_labels)
 
+    def __copy__(self):
+        shuffler = super().__copy__()
+        shuffler.permutation = copy(self.permutation)
+        return shuffler
+
     def permute_and_score(self):
         shuffle(self.permutation)
 
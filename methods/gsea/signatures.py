@@ -1,17 +1,28 @@
 import gzip
+from collections import OrderedDict
 from pathlib import Path
+from threading import Lock
 from typing import Mapping, Sequence
-from urllib.request import urlretrieve
 
-import os
+import numpy as np
+from scipy.sparse import csr_matrix
 
 from declarative_parser.parser import Argument, Parser, action
 from models import Gene
+from multiprocess.shared import share, unwrap
 from utils import jit
+from .downloads import Fetcher
 
 REMOTE = 'https://github.com/kn-bibs/pathways-data/raw/master/gsea/msigdb/'
 DATA_DIR = Path('data')
 
+# membership matrices (one per order of genes, i.e. per experiment) kept by
+# a database; the least recently used ones are dropped when there are more
+MEMBERSHIPS_CACHED = 8
+
+# databases may serve concurrent requests (e.g. in a long-lived service)
+_memberships_lock = Lock()
+
 
 def gzip_open_text(path, mode='r'):
     return gzip.open(path, mode + 't')
@@ -60,11 +71,148 @@ class GeneSet:
         return f'<GeneSet: {self.name} with {len(self.genes)} genes>'
 
 
+class GeneSetView:
+    """A gene set as seen by a single experiment.
+
+    Holds positions of the genes of the set within the columns of
+    a shared `GeneSetMembership`, leaving the original `GeneSet` intact,
+    so that one database can serve any number of experiments.
+    Results of an analysis are stored on the view.
+    """
+
+    def __init__(self, gene_set: GeneSet, row: int, indices: np.ndarray):
+        self.name = gene_set.name
+        self.url = gene_set.url
+        self.row = row
+        self.indices = indices
+        self.enrichment = None
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __lt__(self, other):
+        return self.enrichment < other.enrichment
+
+    def __repr__(self):
+        return f'<GeneSetView: {self.name} with {len(self.indices)} genes>'
+
+
+class GeneSetMembership:
+    """Sparse (gene sets × genes) membership matrix.
+
+    Rows follow the order of provided gene sets, columns follow the order
+    of provided genes (e.g. rows of an expression matrix), so that a row
+    of the matrix can be used directly as a mask over expression data.
+    Genes of the sets which are absent in `genes` are not represented.
+
+    Attributes:
+        matrix: boolean `scipy.sparse.csr_matrix` of shape (sets, genes)
+        gene_index: mapping of Gene to the column in the matrix
+        row_index: mapping of gene set name to the row in the matrix
+    """
+
+    def __init__(self, gene_sets: Sequence[GeneSet], genes: Sequence[Gene]):
+        self.genes = list(genes)
+        self.gene_index = {gene: column for column, gene in enumerate(self.genes)}
+        self.row_index = {gene_set.name: row for row, gene_set in enumerate(gene_sets)}
+
+        indices = []
+        indptr = [0]
+
+        for gene_set in gene_sets:
+            columns = sorted(
+                self.gene_index[gene]
+                for gene in gene_set.genes
+                if gene in self.gene_index
+            )
+            indices.extend(columns)
+            indptr.append(len(indices))
+
+        self.matrix = csr_matrix(
+            (np.ones(len(indices), dtype=bool), np.array(indices, dtype=np.int64), np.array(indptr)),
+            shape=(len(gene_sets), len(self.genes))
+        )
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        matrix = state.pop('matrix')
+        # the index can be large: if sent to many workers at once, it is shared
+        state['csr'] = [share(array) for array in (matrix.data, matrix.indices, matrix.indptr)], matrix.shape
+        return state
+
+    def __setstate__(self, state):
+        arrays, shape = state.pop('csr')
+        self.__dict__.update(state)
+        # assigned directly, as the constructor could copy the arrays
+        self.matrix = csr_matrix(shape, dtype=bool)
+        self.matrix.data, self.matrix.indices, self.matrix.indptr = map(unwrap, arrays)
+
+    @property
+    def sizes(self) -> np.ndarray:
+        """Number of genes of each set which are present in the columns."""
+        return np.diff(self.matrix.indptr)
+
+    def members(self, row: int) -> np.ndarray:
+        """Sorted columns of genes belonging to the gene set in given row."""
+        indptr = self.matrix.indptr
+        return self.matrix.indices[indptr[row]:indptr[row + 1]]
+
+    def view(self, gene_set: GeneSet) -> GeneSetView:
+        """Create a view of the gene set restricted to genes in the columns."""
+        row = self.row_index[gene_set.name]
+        return GeneSetView(gene_set, row, self.members(row))
+
+    def columns(self, genes: Sequence[Gene]) -> np.ndarray:
+        """Translate genes into columns of the matrix."""
+        gene_index = self.gene_index
+        return np.fromiter((gene_index[gene] for gene in genes), dtype=np.int64, count=len(genes))
+
+    def hits(self, row: int, columns: np.ndarray) -> np.ndarray:
+        """Boolean mask telling which of given columns belong to the gene set in given row."""
+        mask = np.zeros(len(self.genes), dtype=bool)
+        mask[self.members(row)] = True
+        return mask[columns]
+
+    def overlaps(self, genes: Sequence[Gene]) -> np.ndarray:
+        """Count genes shared by each of the gene sets and provided genes.
+
+        Useful for over-representation analysis, where `genes`
+        would be the differentially expressed ones.
+        """
+        selected = np.zeros(len(self.genes), dtype=np.int64)
+        selected[[self.gene_index[gene] for gene in genes if gene in self.gene_index]] = 1
+        return self.matrix @ selected
+
+
 class MolecularSignatureDatabase:
 
     def __init__(self, gene_sets: Mapping[str, GeneSet], label=None):
         self.label = label
         self.gene_sets = gene_sets
+        self._memberships = OrderedDict()
+
+    def membership(self, genes: Sequence[Gene]) -> GeneSetMembership:
+        """Sparse membership matrix of all gene sets, with columns aligned to `genes`.
+
+        The matrix is built once for a given order of genes (i.e. once
+        per experiment) and re-used by subsequent calls, as long as it
+        is one of `MEMBERSHIPS_CACHED` most recently used matrices.
+        """
+        key = tuple(gene.id for gene in genes)
+
+        with _memberships_lock:
+            if key in self._memberships:
+                self._memberships.move_to_end(key)
+                return self._memberships[key]
+
+        membership = GeneSetMembership(list(self.gene_sets.values()), genes)
+
+        with _memberships_lock:
+            self._memberships[key] = membership
+            while len(self._memberships) > MEMBERSHIPS_CACHED:
+                self._memberships.popitem(last=False)
+
+        return membership
 
 
 class GMTSignatureDatabase(MolecularSignatureDatabase):
@@ -92,15 +240,17 @@ class GMTSignatureDatabase(MolecularSignatureDatabase):
 class RemoteDatabase(GMTSignatureDatabase):
 
     def __init__(self, set_name, identifiers='symbols', version=6.1, remote=REMOTE, label=None):
-        path = f'{version}/{set_name}.v{version}.{identifiers}.gmt.gz'
+        path = self.relative_path(set_name, identifiers, version)
         self.raw_path = path
         self.remote = remote
         GMTSignatureDatabase.__init__(self, path, label)
 
+    @staticmethod
+    def relative_path(set_name, identifiers='symbols', version=6.1):
+        return f'{version}/{set_name}.v{version}.{identifiers}.gmt.gz'
+
     def fetch(self):
-        url = self.remote + str(self.raw_path)
-        os.makedirs(self.path.parent, exist_ok=True)
-        urlretrieve(url, self.path)
+        Fetcher(self.remote, DATA_DIR).fetch_file(self.raw_path)
 
     def load(self, opener=open):
         if not self.path.exists():
@@ -108,14 +258,65 @@ class RemoteDatabase(GMTSignatureDatabase):
         return super().load(opener)
 
 
+# KEGG, BioCarta and AAAS/STKE derived sets are excluded due to licencing
 DATABASE_PRESETS = {
     'H': (
         'h.all',
         'hallmark gene sets'
+    ),
+    'C1': (
+        'c1.all',
+        'positional gene sets'
+    ),
+    'C2_CGP': (
+        'c2.cgp',
+        'chemical and genetic perturbations'
+    ),
+    'C2_REACTOME': (
+        'c2.cp.reactome',
+        'Reactome gene sets'
+    ),
+    'C3': (
+        'c3.all',
+        'motif gene sets'
+    ),
+    'C4': (
+        'c4.all',
+        'computational gene sets'
+    ),
+    'C5': (
+        'c5.all',
+        'GO gene sets'
+    ),
+    'C6': (
+        'c6.all',
+        'oncogenic signatures'
+    ),
+    'C7': (
+        'c7.all',
+        'immunologic signatures'
     )
 }
 
 
+def fetch_presets(names=None, identifiers='symbols', version=6.1, remote=REMOTE, workers=4):
+    """Download multiple pre-defined databases concurrently.
+
+    Args:
+        names: keys of DATABASE_PRESETS to fetch, all by default
+        identifiers: 'symbols' or 'entrez'
+        version: version of MSigDB
+        remote: URL of remote or local mirror (or a path to a directory)
+        workers: maximal number of concurrent downloads
+    """
+    names = names or DATABASE_PRESETS.keys()
+    paths = [
+        RemoteDatabase.relative_path(DATABASE_PRESETS[name][0], identifiers, version)
+        for name in names
+    ]
+    return Fetcher(remote, DATA_DIR, workers=workers).fetch(paths)
+
+
 class DatabaseParser(Parser):
     """Help"""
 
@@ -144,7 +345,9 @@ class DatabaseParser(Parser):
     remote = Argument(
         # we may want to create a mirror when things go serious to
         # do not overuse BI and to gain independence
-        default=REMOTE
+        default=REMOTE,
+        help='URL of the remote with databases; a file:// URL or a path '
+             'to a directory with a local mirror is accepted as well.'
     )
 
     @action
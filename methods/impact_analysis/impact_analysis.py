@@ -1,9 +1,9 @@
 from databases import KEGGPathways
-from methods.method import Method, MethodResult
+from methods.alignment import NodeAlignment, first_gene
+from methods.method import Method, MethodResult, offline_argument
 from metrics import mean
 from models import Experiment, Gene
-from networkx import get_edge_attributes
-from numpy import log2, isnan
+from numpy import log2, isnan, where
 from stats import ttest, hypergeom_distribution
 from statsmodels.stats.multitest import multipletests
 from .constants import *
@@ -54,8 +54,10 @@ class ImpactAnalysis(Method):
 
     name = 'impact_analysis'
 
+    offline = offline_argument()
+
     def __init__(self, organism: str = 'Homo sapiens', threshold: float = 0.05, markdown: str = '', degs: str = '',
-                 **kwargs):
+                 offline: bool = False, **kwargs):
         """
 
         Args:
@@ -63,13 +65,16 @@ class ImpactAnalysis(Method):
             threshold: float: threshold for identification of differentially expressed genes
             markdown: generate additional markdown output file with given name
             degs: comma-separated list of ids of differentially expressed genes
+            offline: use only cached KEGG data (see `databases.KEGGPathways`)
         """
         if threshold < 0 or threshold > 1:
             raise ValueError('Indices need to be in (0,1) range')
         self.threshold = threshold
         self.org = organism
+        self.offline = offline
         self.FC = None
         self.experiment_genes = None
+        self.alignment = None
         self.markdown = markdown
         if markdown:
             if os.path.exists(markdown if '.md' in markdown else markdown.split('.')[0] + '.md'):
@@ -90,6 +95,7 @@ class ImpactAnalysis(Method):
 
         # calculate fold change
         self.FC = experiment.calculate_fold_change()
+        self.alignment = None
 
         # remove genes for witch fold change cannot be calculated correctly
         experiment.exclude_genes(list(self.FC['FC'][isnan(self.FC['FC'])].index))
@@ -106,23 +112,22 @@ class ImpactAnalysis(Method):
             print('No differentialy expressed genes.')
             return ImpactAnalysisResult([])
 
-        db = KEGGPathways(self.org)
-        pathways = {}
-
-        for gene in [g.name for g in list(self.degs.index)]:
-            ps = db.search_by_gene(gene)
-            for (k, v) in ps.items():
-                if k not in pathways.keys():
-                    pathways[k] = v
+        db = KEGGPathways(self.org, offline=self.offline)
+        pathways = db.pathways_for_genes([g.name for g in list(self.degs.index)])
 
         if not pathways:
             print('No pathways found in database.')
             return ImpactAnalysisResult([])
 
+        # pathways are analysed as these arrive
+        impacts = {
+            code: self.calculate_impact_factor(experiment, pathway, code)
+            for code, pathway in db.get_pathways(pathways)
+        }
+
         res = pd.DataFrame(columns=['name', 'IF', 'pvalue'])
         for (code, descr) in pathways.items():
-            pathway = db.get_pathway(code)
-            impact_factor, pval = self.calculate_impact_factor(experiment, pathway)
+            impact_factor, pval = impacts[code]
             if impact_factor is not None and pval is not None:
                 res.loc[len(res.index)] = [descr, impact_factor, pval]
 
@@ -135,9 +140,23 @@ class ImpactAnalysis(Method):
             result.generate_markdown(self.markdown, 'Results of Impact Analysis:')
         return result
 
-    def calculate_impact_factor(self, experiment, pathway):
+    def align(self) -> NodeAlignment:
+        """Align nodes of pathways with genes of the fold change array, once for each experiment.
+
+        Fold changes of the genes (MAX_IF where these cannot be calculated)
+        are kept in `node_fc`, in the order of the alignment rows.
+        """
+        if self.alignment is None:
+            self.alignment = NodeAlignment([gene.name for gene in self.FC.index], first_gene)
+            fc = self.FC['FC'].to_numpy(dtype=float)
+            self.node_fc = where(isnan(fc), MAX_IF, fc)
+            self.mean_abs_fc = mean([abs(i) for i in self.FC['FC'].values if not isnan(i)])
+        return self.alignment
+
+    def calculate_impact_factor(self, experiment, pathway, pathway_id=None):
 
-        path_genes = set([x.strip() for x in ' ,'.join(pathway.nodes).split(',')])
+        aligned = self.align().align(pathway, pathway_id)
+        path_genes = aligned.genes
         DEGs_set = set([gene.name for gene in list(self.degs.index)])
 
         # no DEGs in pathway
@@ -150,36 +169,38 @@ class ImpactAnalysis(Method):
         if pval_path != 0:
             impact_factor = log2(pval_path)
 
+            # ΔE of each node
+            delta = dict(zip(aligned.nodes, aligned.values(self.node_fc)))
+
             impact_factor += sum(
-                [abs(self.calculate_perturbation_factor(experiment, gene, pathway)) for gene in pathway.nodes]) / len(
-                path_genes & DEGs_set) * mean([abs(i) for i in self.FC['FC'].values if not isnan(i)])
+                [abs(self.calculate_perturbation_factor(experiment, gene, pathway, delta=delta))
+                 for gene in pathway.nodes]) / len(path_genes & DEGs_set) * self.mean_abs_fc
 
         else:
             impact_factor = MAX_IF
 
         return impact_factor, pval_path
 
-    def calculate_perturbation_factor(self, experiment, gene, pathway, visited=None):
+    def calculate_perturbation_factor(self, experiment, gene, pathway, visited=None, delta=None):
 
         visited = [] if not visited else visited
 
-        pf = 0
-        if len(set(gene.split(',')) & set(self.experiment_genes)) != 0:
-            for name in gene.split(','):
-                if name.strip() in self.experiment_genes:
-                    # get ΔE
-                    pf = self.FC['FC'][Gene(name)] if not isnan(self.FC['FC'][Gene(name)]) else MAX_IF
-                    break
+        if delta is None:
+            aligned = self.align().align(pathway)
+            delta = dict(zip(aligned.nodes, aligned.values(self.node_fc)))
+
+        # ΔE, zero for genes not measured in the experiment
+        pf = delta[gene]
 
         # genes directly upstream
         for edge in pathway.in_edges(gene):
             if edge[0] not in visited:
                 beta = mean([interaction_weights[t] if t in interaction_weights.keys() else 0 for t in
-                             get_edge_attributes(pathway, 'type')[edge]])
+                             pathway.edges[edge]['type']])
                 # genes directly downstream
                 dstream = len(pathway.out_edges(edge[0]))
                 pf += self.calculate_perturbation_factor(experiment, edge[0], pathway,
-                                                         visited + [edge[1]]) * beta / dstream
+                                                         visited + [edge[1]], delta) * beta / dstream
         return pf
 
     def calculate_corrections(self, pvalues):
@@ -1,10 +1,49 @@
 from abc import abstractmethod, ABC
 from typing import Iterable
 
+from declarative_parser.parser import Argument
+
 from models import Experiment
+from multiprocess import BACKENDS
 from utils import AbstractRegisteringType, abstract_property
 
 
+def backend_argument(default='process'):
+    """Create the argument for choice of execution backend of a method.
+
+    Methods using `multiprocess.get_pool` should accept
+    `backend` in `__init__` and define this argument::
+
+        class MyMethod(Method):
+
+            backend = backend_argument()
+
+            def __init__(self, backend='process'):
+                pass
+    """
+    return Argument(
+        choices=list(BACKENDS),
+        default=default,
+        help=(
+            "how to run the computations in parallel: 'process' (separate processes), "
+            "'thread' (threads; worth using for code releasing the GIL), 'serial' "
+            "or 'cluster' (worker daemons on other hosts, see multiprocess.cluster)"
+        )
+    )
+
+
+def offline_argument():
+    """Create the argument disabling downloads, for methods using `databases.KEGGPathways`.
+
+    Methods should accept `offline` in `__init__` and pass it to the database.
+    """
+    return Argument(
+        action='store_true',
+        help='use only the data from the local cache of KEGG (do not connect to the '
+             'database); fail if something is missing. Useful on air-gapped nodes.'
+    )
+
+
 class MethodResult(ABC):
     """Result should contain list of matched pathways or processes
 
@@ -45,10 +45,28 @@ class Gene:
         self.name = name
         self.description = description
 
+    def __reduce__(self):
+        return restore_gene, (self.name, self.description, self.id)
+
     def __repr__(self):
         return f'<Gene: {self.name}>'
 
 
+def restore_gene(name, description, identifier):
+    """Unpickle a gene, preserving the multiton property in the receiving process.
+
+    Genes unpickled from separately pickled objects (e.g. sent
+    to a worker process one after another) are the same object.
+    """
+    if name not in Gene.instances:
+        gene = Gene.__new__(Gene)
+        gene.name = name
+        gene.description = description
+        gene.id = identifier
+        Gene.instances[name] = gene
+    return Gene.instances[name]
+
+
 class Sample:
     """Sample contains expression values for genes."""
 
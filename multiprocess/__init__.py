@@ -1,55 +1,200 @@
+import atexit
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from contextlib import contextmanager
+from itertools import count, islice
+from queue import Full
+from threading import Event, Thread, get_ident
+from time import monotonic
+from traceback import format_exc
 import os
-from multiprocessing import Manager, Queue, Process
-from multiprocessing.managers import ListProxy
-
-from multiprocess.progress_bar import progress_bar
+import random
+from multiprocessing import Barrier, Queue, Process
+
+from multiprocess.limits import Placement, limited_threads, placed
+from multiprocess.progress_bar import Progress, Utilisation
+from multiprocess.shared import (
+    SharedArray, SHARING_THRESHOLD, share, share_tracker, shared_arrays, sharing, should_share, unwrap
+)
 from multiprocess.signals import STOP
-from tqdm import tqdm
+
+import numpy as np
 
 
 def available_cores():
     return len(os.sched_getaffinity(0))
 
 
-def worker(func, input: Queue, progress_bar_updates: Queue, output: ListProxy, *args):
-    """Generic worker for map-like operations with progress bar.
+def reseed():
+    """Seed the random generators of a worker process independently of its parent.
+
+    Forked workers inherit the state of the generators, so without
+    reseeding all of them would draw the same numbers (e.g. permutations).
+    """
+    random.seed(os.urandom(16))
+    np.random.seed(int.from_bytes(os.urandom(4), 'little'))
+
+
+class TaskError(Exception):
+    """Raised in the parent process when a task failed in a worker.
+
+    The message contains the traceback from the worker.
+    """
+
+
+def worker(func, input: Queue, output: Queue, *args):
+    """Generic worker for map-like operations.
+
+    Calls `func` on every object of indexed chunks (lists of objects)
+    provided on `input_` queue until `STOP` (None) is received.
+    Results of `func` calls are put on the `output` queue
+    (all results of a chunk at once, with index of the chunk,
+    the time spent on the computation and the pid of the worker);
+    if a call fails, `TaskError` is put instead of the results.
+    The parent tracks the progress basing on the results.
 
-    Calls `func` on every object provided on `input_` queue
-    until `STOP` (None) is received. After each step queues
-    an update on `progress_bar` queue.
-    Results of `func` calls are appended to `output` list.
-    
     Args:
         func: function to be called on queued objects
         input: input queue
-        progress_bar_updates: progress_bar queue
-        output: managed list for results
-        *args: additional positional arguments to be passed to `func`
+        output: queue for results
+        *args: additional positional arguments to be passed to `func`;
+            `SharedArray`s are passed to `func` as numpy arrays
     """
+    args = [unwrap(arg) for arg in args]
+    reseed()
+
     while True:
-        data = input.get()
+        task = input.get()
 
-        if data is STOP:
+        if task is STOP:
             return
 
-        result = func(data, *args)
+        index, chunk = task
+        started = monotonic()
+
+        try:
+            results = [func(data, *args) for data in chunk]
+        except Exception:
+            results = TaskError(format_exc())
+
+        output.put((index, results, monotonic() - started, os.getpid()))
+
 
-        output.append(result)
-        progress_bar_updates.put(1)
+def auto_chunksize(total, processes):
+    """Choose size of chunks so that each worker gets about four of them.
+
+    Smaller chunks balance the load better, larger ones
+    reduce the overhead of inter-process communication.
+    """
+    chunksize, extra = divmod(total, processes * 4)
+    if extra or not chunksize:
+        chunksize += 1
+    return chunksize
+
+
+def chunks(iterable, size):
+    """Split iterable into lists of `size` items (the last one may be shorter)."""
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def chunks_by_cost(positions, costs, target):
+    """Split positions into lists with total cost of at least `target` (except the last one)."""
+    chunk, chunk_cost = [], 0
+    for position in positions:
+        chunk.append(position)
+        chunk_cost += costs[position]
+        if chunk_cost >= target:
+            yield chunk
+            chunk, chunk_cost = [], 0
+    if chunk:
+        yield chunk
+
+
+def schedule(items, processes, chunksize=None, costs=None):
+    """Split items into chunks, returning a list of (positions, chunk) pairs.
+
+    Without costs, the chunks follow the order of items. Otherwise the
+    most costly items are scheduled first (longest processing time first)
+    so that the cheap ones fill the gaps at the end, when some of the
+    workers would be idle otherwise. If chunksize is not given, the chunks
+    are composed to have a similar cost, each about a quarter of the
+    average cost per worker: expensive items are dispatched one by one,
+    cheap ones in groups.
+
+    Args:
+        items: a sequence of items
+        processes: count of workers
+        chunksize: count of items in a chunk
+        costs: estimated cost of processing of each of the items
+    """
+    positions = range(len(items))
+
+    if costs is None:
+        grouped = chunks(positions, chunksize or auto_chunksize(len(items), processes))
+    else:
+        costs = list(costs)
+        positions = sorted(positions, key=lambda position: costs[position], reverse=True)
+        if chunksize:
+            grouped = chunks(positions, chunksize)
+        else:
+            grouped = chunks_by_cost(positions, costs, target=sum(costs) / (processes * 4))
+
+    return [
+        (chunk_positions, [items[position] for position in chunk_positions])
+        for chunk_positions in grouped
+    ]
+
+
+def gather(next_result, scheduled, ordered, progress: Progress):
+    """Yield results of scheduled chunks as received with `next_result` callable.
+
+    Args:
+        next_result: returns (index, results, busy time, worker)
+            for the next completed chunk
+        scheduled: list of (positions, chunk) pairs, as returned by `schedule`
+        ordered: should the results be yielded in the order of positions?
+        progress: to be updated with each of the completed chunks
+    """
+    # results of items completed ahead of order
+    pending = {}
+    next_position = 0
+
+    for _ in scheduled:
+        index, results, busy, worker = next_result()
+
+        if isinstance(results, TaskError):
+            raise results
+
+        progress.update(len(results), busy, worker)
+
+        if not ordered:
+            yield from results
+            continue
+
+        pending.update(zip(scheduled[index][0], results))
+
+        while next_position in pending:
+            yield pending.pop(next_position)
+            next_position += 1
+
+    progress.utilisation.finish()
 
 
 api_template = namedtuple('API', 'queue, results')
 
 
-@contextmanager
-def multiprocessing_queue(target, args, processes, total):
-    manager = Manager()
-    results = manager.list()
-    queue = Queue()
+# how many chunks per worker can wait in the queue; when the queue
+# is full, the producer blocks until workers take some chunks out
+QUEUED_CHUNKS_PER_WORKER = 2
 
-    api = api_template(queue, results)
+
+@contextmanager
+def multiprocessing_queue(target, args, processes, total, threads_per_worker=None, pin=False):
+    results = Queue()
 
     processes_cnt = processes or available_cores()
 
@@ -57,30 +202,56 @@ def multiprocessing_queue(target, args, processes, total):
     if processes_cnt > total:
         processes_cnt = total
 
-    with progress_bar(total) as progress_queue:
+    # bounded queue provides backpressure: memory used by queued
+    # items does not grow with the total count of items
+    queue = Queue(maxsize=processes_cnt * QUEUED_CHUNKS_PER_WORKER)
+
+    api = api_template(queue, results)
 
-        worker_args = [target, queue, progress_queue, results]
+    placement = Placement(processes_cnt, threads_per_worker, pin)
 
-        if args:
-            worker_args.extend(args)
+    worker_args = [target, queue, results]
 
-        processes = [
-            Process(target=worker, args=worker_args)
-            for _ in range(processes_cnt)
-        ]
+    if args:
+        worker_args.extend(args)
 
-        yield api
+    processes = [
+        Process(target=placed, args=[placement, index, worker, *worker_args])
+        for index in range(processes_cnt)
+    ]
 
-        for _ in processes:
-            queue.put(STOP)
+    share_tracker()
 
-        for process in processes:
-            process.start()
+    # start workers first, so that the work begins with the first queued chunk
+    for process in processes:
+        process.start()
 
+    try:
+        yield api
+    except BaseException:
+        # including GeneratorExit, when results are no longer needed
+        for process in processes:
+            process.terminate()
+        raise
+    else:
+        for _ in processes:
+            queue.put(STOP)
+    finally:
         for process in processes:
             process.join()
 
 
+def feed(queue: Queue, tasks, stopped: Event, timeout=0.1):
+    """Put tasks on the queue, waiting while it is full (unless stopped)."""
+    for task in tasks:
+        while not stopped.is_set():
+            try:
+                queue.put(task, timeout=timeout)
+                break
+            except Full:
+                pass
+
+
 # TODO: is it possible to use partial instead of shared_args?
 class Pool:
     """A pool with support for shared arguments and progress bar.
@@ -88,30 +259,488 @@ class Pool:
     Interface is partially compatible with `multiprocessing.Pool`.
 
     Only imap method is implemented so far.
+
+    Args:
+        processes: count of worker processes, by default one per available core
+        threads_per_worker: count of threads which BLAS/OpenMP libraries
+            can use in each worker; by default the available cores are
+            divided equally between the workers (see `limits.Placement`)
+        pin: should the workers be pinned to disjoint sets of CPUs?
+        on_progress: called with progress reports (see `Progress.report`):
+            count of processed items, items per second, ETA and
+            utilisation of each of the workers
+
+    The progress bar is shown only if the standard output is a terminal.
     """
 
-    def __init__(self, processes):
+    def __init__(self, processes, threads_per_worker=None, pin=False, on_progress=None):
         self.processes = processes
+        self.threads_per_worker = threads_per_worker
+        self.pin = pin
+        self.on_progress = on_progress
+        # of the latest imap call
+        self.utilisation = None
 
-    def imap(self, func, iterable, shared_args=tuple()):
-        """Iteratively apply function to items ofo `iterable` and return results.
+    @property
+    def parallelism(self):
+        """Count of items which can be processed at the same time."""
+        return self.processes or available_cores()
 
-        The order of resultant list is not guaranteed to be preserved.
-        Items will be passed from `iterable` to pool queue one by one.
+    def imap(self, func, iterable, shared_args=tuple(), chunksize=None, ordered=False, costs=None):
+        """Lazily apply function to items of `iterable`, yielding results as they come.
+
+        Items will be passed from `iterable` to pool queue in chunks,
+        while the results can be consumed as soon as these are ready.
 
         Args:
             func: function to be applied to items
             iterable: an iterable with items
-            shared_args: positional arguments to be passed to func after item
+            shared_args: positional arguments to be passed to func after item;
+                large numpy arrays will be placed in shared memory, so that
+                the workers can access these without copying
+            chunksize: count of items sent to a worker at once,
+                by default chosen basing on count of items and processes
+            ordered: should the results be yielded in the order of items?
+                By default the results are yielded in order of completion.
+            costs: estimated cost of processing of each of the items;
+                if given, the most costly items are processed first
+                (see `schedule`). Idle workers take the next chunk
+                from the queue, so these never wait while work remains.
+
+        Once the results are consumed, `utilisation` of workers is available.
         """
 
         if self.processes == 1:
             # for profiling and debugging a single process works better
             # (and there is less overhead than forking for one more)
-            return map(lambda i: func(i, *shared_args), tqdm(iterable))
+            serial = SerialPool(on_progress=self.on_progress)
+            return serial.imap(func, iterable, shared_args)
+
+        total = len(iterable)
+        processes = self.processes or available_cores()
+        scheduled = schedule(iterable, processes, chunksize, costs)
+
+        # do not start more processes than there are chunks
+        processes = min(processes, len(scheduled))
+
+        return self._imap(func, scheduled, shared_args, total, processes, ordered)
+
+    def _imap(self, func, scheduled, shared_args, total, processes, ordered):
 
-        with multiprocessing_queue(func, shared_args, self.processes, total=len(iterable)) as api:
+        with shared_arrays(shared_args) as args, multiprocessing_queue(
+            func, args, processes, total=total,
+            threads_per_worker=self.threads_per_worker, pin=self.pin
+        ) as api:
+
+            stopped = Event()
+            tasks = ((index, chunk) for index, (positions, chunk) in enumerate(scheduled))
+
+            # the items are fed from a thread, so that results can be consumed meanwhile
+            feeder = Thread(target=feed, args=(api.queue, tasks, stopped), daemon=True)
+            feeder.start()
+
+            try:
+                with Progress(total, processes, self.on_progress) as progress:
+                    self.utilisation = progress.utilisation
+                    yield from gather(api.results.get, scheduled, ordered, progress)
+            finally:
+                stopped.set()
+                feeder.join()
+
+
+class SerialPool:
+    """Runs all tasks in the calling process, one after another.
+
+    Has the interface of `Pool`; the results are always ordered.
+    """
+
+    def __init__(self, processes=1, threads_per_worker=None, pin=False, on_progress=None):
+        self.processes = 1
+        self.on_progress = on_progress
+        # of the latest imap call
+        self.utilisation = None
+
+    parallelism = 1
+
+    def imap(self, func, iterable, shared_args=tuple(), chunksize=None, ordered=False, costs=None):
+        with Progress(len(iterable), 1, self.on_progress) as progress:
+            self.utilisation = progress.utilisation
             for item in iterable:
-                api.queue.put(item)
+                started = monotonic()
+                result = func(item, *shared_args)
+                progress.update(1, monotonic() - started, os.getpid())
+                yield result
+
+
+def run_chunk(func, index, chunk, args):
+    started = monotonic()
+    try:
+        results = [func(data, *args) for data in chunk]
+    except Exception:
+        results = TaskError(format_exc())
+    return index, results, monotonic() - started, get_ident()
+
+
+class ThreadPool:
+    """A pool of threads, with the interface of `Pool`.
+
+    The threads share memory with the calling thread, so nothing has
+    to be copied or pickled; this is worth using for functions which
+    spend most of the time in code releasing the GIL (like numpy
+    linear algebra). Functions holding the GIL will not run in parallel.
+
+    BLAS threads are shared by all the threads, so these are limited
+    for the duration of `imap` (if threadpoolctl is installed).
+    """
+
+    def __init__(self, processes, threads_per_worker=None, pin=False, on_progress=None):
+        self.processes = processes
+        self.threads_per_worker = threads_per_worker
+        self.on_progress = on_progress
+        # of the latest imap call
+        self.utilisation = None
+
+    # the threads run Python code one at a time, holding the GIL
+    parallelism = 1
+
+    def imap(self, func, iterable, shared_args=tuple(), chunksize=None, ordered=False, costs=None):
+        """Lazily apply function to items of `iterable`, yielding results as they come.
+
+        Arguments have the same meaning as for `Pool.imap`.
+        """
+        threads = self.processes or available_cores()
+        scheduled = schedule(iterable, threads, chunksize, costs)
+        return self._imap(func, scheduled, shared_args, len(iterable), min(threads, len(scheduled)), ordered)
+
+    def _imap(self, func, scheduled, shared_args, total, threads, ordered):
+
+        placement = Placement(threads, self.threads_per_worker)
+
+        with limited_threads(placement.threads), \
+                ThreadPoolExecutor(max_workers=max(threads, 1)) as executor, \
+                Progress(total, threads, self.on_progress) as progress:
+
+            futures = [
+                executor.submit(run_chunk, func, index, chunk, shared_args)
+                for index, (positions, chunk) in enumerate(scheduled)
+            ]
+            completed = as_completed(futures)
+
+            self.utilisation = progress.utilisation
+
+            try:
+                yield from gather(lambda: next(completed).result(), scheduled, ordered, progress)
+            finally:
+                # do not start the chunks which were not started yet
+                for future in futures:
+                    future.cancel()
+
+
+BACKENDS = {
+    'process': Pool,
+    'thread': ThreadPool,
+    'serial': SerialPool
+}
+
+
+# kinds of messages understood by persistent_worker
+LOAD, UNLOAD, JOB, TASK = 'load', 'unload', 'job', 'task'
+
+# state loaded into a worker of PersistentPool (see PersistentPool.load)
+worker_state = {}
+
+
+def persistent_worker(inbox: Queue, output: Queue, barrier: Barrier):
+    """Worker of PersistentPool, living until `STOP` is received.
+
+    Messages are tuples with the kind of the message as the first item:
+        (LOAD, key, value): store the value in `worker_state`
+        (UNLOAD, key): remove the value from `worker_state`
+        (JOB, job, func, args): set up the function for following tasks
+        (TASK, job, index, chunk): call the function on every object of chunk
+
+    LOAD, UNLOAD and JOB messages are broadcast to all workers: after receiving
+    one, the worker waits on `barrier` so that it will not take over
+    the message meant for another worker.
+    """
+    jobs = {}
+    reseed()
+
+    while True:
+        message = inbox.get()
+
+        if message is STOP:
+            return
+
+        kind, *payload = message
+
+        if kind == LOAD:
+            key, value = payload
+            worker_state[key] = unwrap(value)
+            barrier.wait()
+
+        elif kind == UNLOAD:
+            key, = payload
+            worker_state.pop(key, None)
+            barrier.wait()
+
+        elif kind == JOB:
+            job, func, args = payload
+            # only the current job is kept, releasing arguments of the previous one
+            jobs = {job: (func, [unwrap(arg) for arg in args])}
+            barrier.wait()
+
+        else:
+            job, index, chunk = payload
+
+            if job not in jobs:
+                # leftover of an abandoned job
+                continue
+
+            func, args = jobs[job]
+            started = monotonic()
+
+            try:
+                results = [func(data, *args) for data in chunk]
+            except Exception:
+                results = TaskError(format_exc())
+
+            output.put((job, index, results, monotonic() - started, os.getpid()))
+
+
+class PersistentPool:
+    """A pool of long-lived workers, reused by subsequent `imap` calls.
+
+    Starting processes and sending over the data they need is paid once,
+    instead of on every run of a method. Use as a context manager:
+
+        with PersistentPool(4) as pool:
+            pool.load('database', database)
+            for experiment in experiments:
+                method.run(experiment)
+
+    While in the context, the pool is returned by `get_pool`, so methods
+    which use `get_pool` will run on it. Alternatively, `warm_pool()`
+    provides a module-level pool, kept until the interpreter exits.
+
+    Only one `imap` can be consumed at a time. See `Pool`
+    for the description of `threads_per_worker`, `pin` and `on_progress`.
+    """
+
+    def __init__(self, processes=0, threads_per_worker=None, pin=False, on_progress=None):
+        self.processes = processes or available_cores()
+        self.on_progress = on_progress
+        self.placement = Placement(self.processes, threads_per_worker, pin)
+        self.inbox = None
+        self.results = None
+        self.barrier = None
+        self.workers = []
+        self.loaded = {}
+        self.jobs = count()
+        self.busy = False
+        # of the latest imap call
+        self.utilisation = None
+
+    @property
+    def parallelism(self):
+        return self.processes
+
+    @property
+    def running(self):
+        return bool(self.workers)
+
+    def start(self):
+        if self.running:
+            return
+        self.inbox = Queue(maxsize=self.processes * QUEUED_CHUNKS_PER_WORKER)
+        self.results = Queue()
+        # workers and the parent process meet at the barrier after each broadcast
+        self.barrier = Barrier(self.processes + 1)
+        self.workers = [
+            Process(
+                target=placed,
+                args=(self.placement, index, persistent_worker, self.inbox, self.results, self.barrier),
+                daemon=True
+            )
+            for index in range(self.processes)
+        ]
+        share_tracker()
+        for process in self.workers:
+            process.start()
+
+    def broadcast(self, *message):
+        """Deliver a message to each of the workers, waiting until all received it."""
+        if self.busy:
+            raise RuntimeError('Cannot broadcast while imap results are being consumed')
+        self.start()
+        # the message is pickled for each of the workers, but large arrays
+        # of objects supporting `share` are placed in shared memory once
+        with sharing():
+            for _ in self.workers:
+                self.inbox.put(message)
+            self.barrier.wait()
+
+    def load(self, key, value):
+        """Store value in `worker_state[key]` of every worker.
+
+        Loaded values stay in the workers until replaced
+        or until the pool is closed; large numpy arrays are
+        placed in shared memory rather than copied.
+        """
+        if should_share(value):
+            value = SharedArray.from_array(value)
+        self.broadcast(LOAD, key, value)
+        previous = self.loaded.get(key)
+        if isinstance(previous, SharedArray):
+            previous.unlink()
+        self.loaded[key] = value
+
+    def unload(self, key):
+        """Remove value loaded under `key` from the workers, releasing its memory."""
+        if key not in self.loaded:
+            return
+        if self.running:
+            self.broadcast(UNLOAD, key)
+        value = self.loaded.pop(key)
+        if isinstance(value, SharedArray):
+            value.unlink()
+
+    def is_loaded(self, key):
+        return key in self.loaded
+
+    def imap(self, func, iterable, shared_args=tuple(), chunksize=None, ordered=False, costs=None):
+        """Lazily apply function to items of `iterable`, yielding results as they come.
+
+        Arguments have the same meaning as for `Pool.imap`; `func`
+        and `shared_args` are sent to each worker once per call.
+        """
+        scheduled = schedule(iterable, self.processes, chunksize, costs)
+        return self._imap(func, scheduled, shared_args, len(iterable), ordered)
+
+    def _imap(self, func, scheduled, shared_args, total, ordered):
+
+        with shared_arrays(shared_args) as args:
+            job = self.start_job(func, args)
+            yield from self._run_job(job, scheduled, total, ordered)
+
+    def start_job(self, func, shared_args=tuple()) -> int:
+        """Send the function and shared arguments to each worker, for `job_imap` calls.
+
+        The job replaces the previous one in the workers. Returns the id of the job.
+        """
+        job = next(self.jobs)
+        self.broadcast(JOB, job, func, tuple(shared_args))
+        return job
+
+    def job_imap(self, job, iterable, chunksize=None, ordered=False, costs=None):
+        """Like `imap`, for the function and arguments of the current job (see `start_job`).
+
+        Only the items are sent to the workers, so that many calls can share
+        a single (possibly large) set of arguments sent over once.
+        """
+        scheduled = schedule(iterable, self.processes, chunksize, costs)
+        return self._run_job(job, scheduled, len(iterable), ordered)
+
+    def _run_job(self, job, scheduled, total, ordered):
+        self.busy = True
+
+        stopped = Event()
+        tasks = ((TASK, job, index, chunk) for index, (positions, chunk) in enumerate(scheduled))
+
+        feeder = Thread(target=feed, args=(self.inbox, tasks, stopped), daemon=True)
+        feeder.start()
+
+        def next_result():
+            while True:
+                result_job, *result = self.results.get()
+                # skip results of an abandoned job
+                if result_job == job:
+                    return result
+
+        try:
+            with Progress(total, min(self.processes, len(scheduled)), self.on_progress) as progress:
+                self.utilisation = progress.utilisation
+                yield from gather(next_result, scheduled, ordered, progress)
+        finally:
+            stopped.set()
+            feeder.join()
+            self.busy = False
+
+    def close(self):
+        """Stop the workers once these finish queued tasks and release loaded state."""
+        if self in _active_pools:
+            _active_pools.remove(self)
+        if self.running:
+            for _ in self.workers:
+                self.inbox.put(STOP)
+            for process in self.workers:
+                process.join()
+            self.workers = []
+        for value in self.loaded.values():
+            if isinstance(value, SharedArray):
+                value.unlink()
+        self.loaded = {}
+
+    def terminate(self):
+        for process in self.workers:
+            process.terminate()
+        for process in self.workers:
+            process.join()
+        self.workers = []
+        self.close()
+
+    def __enter__(self):
+        self.start()
+        _active_pools.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type:
+            self.terminate()
+        else:
+            self.close()
+
+
+# pools entered as context managers (the most recent last)
+_active_pools = []
+
+_warm_pool = None
+
+
+def warm_pool(processes=0, threads_per_worker=None, pin=False) -> PersistentPool:
+    """Return the module-level PersistentPool, starting it if needed.
+
+    The pool becomes active (see `get_pool`) and is closed at exit.
+    """
+    global _warm_pool
+
+    if _warm_pool is None or not _warm_pool.running:
+        _warm_pool = PersistentPool(processes, threads_per_worker, pin)
+        _warm_pool.__enter__()
+        atexit.register(_warm_pool.close)
+
+    return _warm_pool
+
+
+def get_pool(processes=0, backend='process', threads_per_worker=None, pin=False, on_progress=None):
+    """Return a pool of given backend (one of `BACKENDS`).
+
+    For the 'process' backend the active PersistentPool is returned,
+    if there is one. Requests for a single process are served by
+    a serial pool, as these are meant for debugging.
+
+    See `Pool` for the description of `threads_per_worker`, `pin` and `on_progress`.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f'Unknown backend: {backend}; choose one of: {", ".join(BACKENDS)}')
+    if processes == 1:
+        return SerialPool(on_progress=on_progress)
+    if backend == 'process' and _active_pools:
+        return _active_pools[-1]
+    return BACKENDS[backend](processes, threads_per_worker=threads_per_worker, pin=pin, on_progress=on_progress)
+
+
+# the cluster backend builds on the utilities defined above
+from multiprocess.cluster import ClusterPool  # noqa: E402
 
-        return api.results
+BACKENDS['cluster'] = ClusterPool
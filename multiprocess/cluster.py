@@ -0,0 +1,379 @@
+"""Execution of pool tasks on worker daemons running on other hosts.
+
+Start a daemon on each of the hosts (the same version of the code
+has to be available there, as functions are sent by reference)::
+
+    PATAPY_CLUSTER_KEY=secret python3 -m multiprocess.cluster --host 0.0.0.0 --port 7531
+
+Each daemon computes the chunks it receives with a local pool of worker
+processes, by default one per available core of the host (see --processes).
+
+and then point the 'cluster' backend to the daemons::
+
+    PATAPY_CLUSTER=node1:7531,node2:7531 PATAPY_CLUSTER_KEY=secret ./patapy.py gsea --backend cluster ...
+
+The messages are pickled objects sent over TCP connections (authenticated
+with the shared key, but not encrypted: use on trusted networks only).
+
+For testing, `local_cluster` starts daemons on localhost.
+"""
+import os
+import signal
+import sys
+from argparse import ArgumentParser
+from contextlib import contextmanager
+from multiprocessing import AuthenticationError, Pipe, Process
+from multiprocessing.connection import Client, Listener
+from queue import Empty, Queue
+from threading import Event, Lock, Thread
+from time import monotonic
+from traceback import format_exc
+from warnings import warn
+
+from multiprocess import PersistentPool, Progress, TaskError, available_cores, gather, reseed, schedule
+
+
+NODES_VARIABLE = 'PATAPY_CLUSTER'
+KEY_VARIABLE = 'PATAPY_CLUSTER_KEY'
+
+DEFAULT_PORT = 7531
+
+# a busy daemon reports that it is alive every HEARTBEAT_INTERVAL seconds;
+# a node which has not sent anything for NODE_TIMEOUT seconds is considered lost
+HEARTBEAT_INTERVAL = 1
+NODE_TIMEOUT = 10
+
+# how many times a chunk of a lost node can be sent to another node
+RETRIES = 2
+
+# kinds of messages
+JOB, READY, TASK, RESULT, HEARTBEAT = 'job', 'ready', 'task', 'result', 'heartbeat'
+
+
+class NodeLost(Exception):
+    pass
+
+
+def parse_nodes(text):
+    """Parse comma-separated list of host:port addresses."""
+    nodes = []
+    for node in text.split(','):
+        if not node.strip():
+            continue
+        host, _, port = node.strip().rpartition(':')
+        nodes.append((host, int(port)))
+    return nodes
+
+
+def beat(send, done: Event, interval):
+    while not done.wait(interval):
+        try:
+            send((HEARTBEAT,))
+        except OSError:
+            return
+
+
+def compute(func, args, chunk, pool=None, job=None):
+    if pool is None:
+        return [func(data, *args) for data in chunk]
+    return list(pool.job_imap(job, chunk, ordered=True))
+
+
+def handle(connection, heartbeat_interval=HEARTBEAT_INTERVAL, pool: PersistentPool=None):
+    """Serve a single coordinator until it disconnects.
+
+    Protocol (coordinator -> daemon: reply):
+        (JOB, func, args): (READY,)
+        (TASK, index, chunk): (HEARTBEAT,) while computing, then (RESULT, index, results, busy time)
+
+    Args:
+        connection: connection with the coordinator
+        heartbeat_interval: see HEARTBEAT_INTERVAL
+        pool: local pool computing the items of each chunk in parallel
+            (its workers get the function and arguments once per job);
+            without one, the chunks are computed by the daemon process
+    """
+    lock = Lock()
+
+    def send(message):
+        with lock:
+            connection.send(message)
+
+    func, args, job = None, (), None
+
+    while True:
+        try:
+            message = connection.recv()
+        except (EOFError, OSError):
+            return
+
+        kind, *payload = message
+
+        if kind == JOB:
+            # shared arguments are sent once per job
+            func, args = payload
+            if pool:
+                job = pool.start_job(func, args)
+            send((READY,))
+
+        elif kind == TASK:
+            index, chunk = payload
+            started = monotonic()
+
+            done = Event()
+            heartbeat = Thread(target=beat, args=(send, done, heartbeat_interval), daemon=True)
+            heartbeat.start()
+
+            try:
+                results = compute(func, args, chunk, pool, job)
+            except Exception:
+                results = TaskError(format_exc())
+            finally:
+                done.set()
+                heartbeat.join()
+
+            send((RESULT, index, results, monotonic() - started))
+
+
+def serve(listener: Listener, heartbeat_interval=HEARTBEAT_INTERVAL, processes=1):
+    """Serve coordinators connecting to the listener, one after another.
+
+    Args:
+        listener: listener accepting the coordinators
+        heartbeat_interval: see HEARTBEAT_INTERVAL
+        processes: count of local worker processes (kept for all the
+            coordinators); with one, the daemon computes the chunks itself
+    """
+    # daemons may be forked too (see local_cluster)
+    reseed()
+    pool = PersistentPool(processes) if processes > 1 else None
+
+    try:
+        while True:
+            try:
+                connection = listener.accept()
+            except (AuthenticationError, EOFError, OSError):
+                # a client which failed the handshake: it disconnected
+                # (e.g. a port scanner), sent garbage or a wrong key
+                continue
+            with connection:
+                handle(connection, heartbeat_interval, pool)
+    finally:
+        if pool:
+            pool.terminate()
+
+
+def stop_on_sigterm():
+    """Exit (releasing the local pool) on SIGTERM, as on KeyboardInterrupt."""
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+
+class ClusterPool:
+    """A pool sending tasks to worker daemons, with the interface of `Pool`.
+
+    Each of the daemons (nodes) gets the function and shared arguments
+    once per `imap` call, and then the chunks, one at a time. When a node
+    stops responding (no result nor heartbeat within `timeout` seconds)
+    or disconnects, its chunk is sent to another node (up to `retries`
+    times) and the node is not used until the end of the call.
+
+    Args:
+        processes, threads_per_worker, pin: not used, the daemons decide these
+        nodes: list of (host, port) addresses of the daemons;
+            by default read from PATAPY_CLUSTER variable (host:port,host:port)
+        authkey: the key shared with the daemons;
+            by default read from PATAPY_CLUSTER_KEY variable
+        timeout: seconds after which a silent node is considered lost
+        retries: how many times a chunk can be retried on another node
+        on_progress: see `Pool`; workers are identified by node addresses
+    """
+
+    # processes of daemons started by local_cluster
+    daemons = ()
+
+    def __init__(
+        self, processes=0, threads_per_worker=None, pin=False, on_progress=None,
+        nodes=None, authkey: bytes=None, timeout=NODE_TIMEOUT, retries=RETRIES
+    ):
+        self.nodes = nodes or parse_nodes(os.environ.get(NODES_VARIABLE, ''))
+        self.authkey = authkey or os.environb.get(KEY_VARIABLE.encode())
+        if not self.nodes:
+            raise ValueError(f'No nodes of the cluster given; please set {NODES_VARIABLE} variable')
+        if not self.authkey:
+            raise ValueError(f'No key for the cluster given; please set {KEY_VARIABLE} variable')
+        self.timeout = timeout
+        self.retries = retries
+        self.on_progress = on_progress
+        # of the latest imap call
+        self.utilisation = None
+
+    @property
+    def parallelism(self):
+        # as many chunks as there are nodes are processed at a time
+        # (though each of these by many processes of the node)
+        return len(self.nodes)
+
+    def imap(self, func, iterable, shared_args=tuple(), chunksize=None, ordered=False, costs=None):
+        """Lazily apply function to items of `iterable`, yielding results as they come.
+
+        Arguments have the same meaning as for `Pool.imap`; `func`
+        has to be importable on the nodes.
+        """
+        scheduled = schedule(iterable, len(self.nodes), chunksize, costs)
+        return self._imap(func, scheduled, shared_args, len(iterable), ordered)
+
+    def _imap(self, func, scheduled, shared_args, total, ordered):
+        pending = Queue()
+        results = Queue()
+        done = Event()
+
+        for index, (positions, chunk) in enumerate(scheduled):
+            pending.put((index, chunk, 0))
+
+        drivers = [
+            Thread(target=self.drive, args=(node, func, tuple(shared_args), pending, results, done), daemon=True)
+            for node in self.nodes
+        ]
+        for driver in drivers:
+            driver.start()
+
+        def next_result():
+            while True:
+                try:
+                    return results.get(timeout=0.1)
+                except Empty:
+                    if not any(driver.is_alive() for driver in drivers):
+                        raise TaskError('All nodes of the cluster were lost')
+
+        try:
+            with Progress(total, len(self.nodes), self.on_progress) as progress:
+                self.utilisation = progress.utilisation
+                yield from gather(next_result, scheduled, ordered, progress)
+        finally:
+            done.set()
+            for driver in drivers:
+                # a driver connecting to a frozen node could wait forever
+                driver.join(self.timeout)
+
+    def receive(self, connection):
+        """Receive the next message other than a heartbeat."""
+        while True:
+            if not connection.poll(self.timeout):
+                raise NodeLost(f'No message within {self.timeout} seconds')
+            message = connection.recv()
+            if message[0] != HEARTBEAT:
+                return message
+
+    def drive(self, node, func, args, pending: Queue, results: Queue, done: Event):
+        """Send pending chunks to the node (one at a time) until done."""
+        host, port = node
+        address = f'{host}:{port}'
+        try:
+            connection = Client(node, authkey=self.authkey)
+        except (OSError, AuthenticationError) as e:
+            warn(f'Cannot connect to node {node}: {e}')
+            return
+
+        with connection:
+            try:
+                connection.send((JOB, func, args))
+                self.receive(connection)
+            except (OSError, EOFError, NodeLost) as e:
+                warn(f'Lost node {node}: {e}')
+                return
+
+            while not done.is_set():
+                try:
+                    index, chunk, attempts = pending.get(timeout=0.1)
+                except Empty:
+                    continue
+
+                try:
+                    connection.send((TASK, index, chunk))
+                    _, index, chunk_results, busy = self.receive(connection)
+                except (OSError, EOFError, NodeLost) as e:
+                    warn(f'Lost node {node}: {e}')
+                    if attempts < self.retries:
+                        pending.put((index, chunk, attempts + 1))
+                    else:
+                        error = TaskError(f'Chunk {index} was lost by {attempts + 1} nodes')
+                        results.put((index, error, 0, address))
+                    return
+
+                results.put((index, chunk_results, busy, address))
+
+
+def serve_locally(address_connection, authkey, heartbeat_interval, processes):
+    stop_on_sigterm()
+    listener = Listener(('127.0.0.1', 0), authkey=authkey)
+    address_connection.send(listener.address)
+    address_connection.close()
+    serve(listener, heartbeat_interval, processes)
+
+
+@contextmanager
+def local_cluster(nodes=2, heartbeat_interval=HEARTBEAT_INTERVAL, processes=1, **pool_options):
+    """Start daemons on localhost and yield a ClusterPool using these.
+
+    Args:
+        nodes: count of daemons to start
+        heartbeat_interval: see HEARTBEAT_INTERVAL
+        processes: count of local worker processes of each daemon
+        **pool_options: passed to ClusterPool
+    """
+    authkey = os.urandom(16)
+    addresses = []
+    daemons = []
+
+    for _ in range(nodes):
+        receiver, sender = Pipe(duplex=False)
+        # not daemonic, as these may start worker processes (and are stopped below anyway)
+        daemon = Process(target=serve_locally, args=(sender, authkey, heartbeat_interval, processes))
+        daemon.start()
+        addresses.append(receiver.recv())
+        daemons.append(daemon)
+
+    pool = ClusterPool(nodes=addresses, authkey=authkey, **pool_options)
+    pool.daemons = daemons
+
+    try:
+        yield pool
+    finally:
+        for daemon in daemons:
+            if processes > 1:
+                # let the daemon stop its workers
+                daemon.terminate()
+                daemon.join(1)
+            # SIGKILL works for stopped processes too
+            if daemon.is_alive():
+                os.kill(daemon.pid, signal.SIGKILL)
+            daemon.join()
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='Worker daemon for the cluster backend of multiprocess')
+    parser.add_argument('--host', default='127.0.0.1', help='interface to listen on')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        '--heartbeat', type=float, default=HEARTBEAT_INTERVAL,
+        help='interval (in seconds) of heartbeat messages sent while computing'
+    )
+    parser.add_argument(
+        '--processes', type=int, default=available_cores(),
+        help='count of worker processes computing the chunks, by default one per available core'
+    )
+    args = parser.parse_args(argv)
+
+    authkey = os.environb.get(KEY_VARIABLE.encode())
+    if not authkey:
+        parser.error(f'Please set {KEY_VARIABLE} variable to a secret shared with the coordinator')
+
+    stop_on_sigterm()
+
+    with Listener((args.host, args.port), authkey=authkey) as listener:
+        print(f'Listening on {args.host}:{args.port} with {args.processes} worker processes')
+        serve(listener, args.heartbeat, args.processes)
+
+
+if __name__ == '__main__':
+    main()
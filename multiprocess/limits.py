@@ -0,0 +1,125 @@
+import os
+from contextlib import contextmanager
+from warnings import warn
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
+
+# read by BLAS/OpenMP implementations when these are loaded
+THREADS_VARIABLES = [
+    'OMP_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'MKL_NUM_THREADS',
+    'VECLIB_MAXIMUM_THREADS',
+    'NUMEXPR_NUM_THREADS'
+]
+
+
+def allowed_cpus():
+    return sorted(os.sched_getaffinity(0))
+
+
+def warn_if_not_limited(threads):
+    """Warn that BLAS/OpenMP threads cannot be limited to `threads` (as threadpoolctl is missing)."""
+    if not threadpool_limits and threads < len(allowed_cpus()):
+        warn(
+            f'Cannot limit BLAS/OpenMP libraries to {threads} threads, as threadpoolctl '
+            f'is not installed (these were loaded with numpy, so the environment variables '
+            f'are ignored); the workers may oversubscribe the CPUs'
+        )
+
+
+def limit_threads(threads):
+    """Limit count of threads used by BLAS and OpenMP in the current process.
+
+    The environment variables are respected only by libraries which are
+    loaded afterwards (e.g. in spawned processes); numpy is usually
+    loaded already, so the limits of loaded libraries are changed
+    with threadpoolctl, if it is installed.
+
+    Returns:
+        threadpoolctl limiter (to be kept while the limits should hold) or None
+    """
+    for variable in THREADS_VARIABLES:
+        os.environ[variable] = str(threads)
+    if threadpool_limits:
+        return threadpool_limits(limits=threads)
+
+
+@contextmanager
+def limited_threads(threads):
+    """Temporarily limit threads of BLAS and OpenMP libraries (requires threadpoolctl)."""
+    warn_if_not_limited(threads)
+    if not threadpool_limits:
+        yield
+        return
+    with threadpool_limits(limits=threads):
+        yield
+
+
+def cpu_sets(workers, threads_per_worker, cpus=None):
+    """Divide CPUs into disjoint sets, one for each of the workers.
+
+    Args:
+        workers: count of workers
+        threads_per_worker: count of CPUs in each set
+        cpus: CPUs to divide, by default those allowed for the current process
+
+    Returns:
+        list of sets of CPUs, or None if there are not enough CPUs
+    """
+    cpus = sorted(cpus or allowed_cpus())
+
+    if workers * threads_per_worker > len(cpus):
+        return None
+
+    return [
+        set(cpus[i * threads_per_worker:(i + 1) * threads_per_worker])
+        for i in range(workers)
+    ]
+
+
+class Placement:
+    """Limits of threads and (optionally) CPUs for each of the pool workers.
+
+    Without limits, every worker would use as many BLAS threads as there
+    are cores, oversubscribing the machine many times over.
+
+    Args:
+        workers: count of workers
+        threads_per_worker: count of threads of BLAS/OpenMP for each worker;
+            by default allowed CPUs are divided equally between the workers
+        pin: should the workers be pinned to disjoint sets of CPUs?
+    """
+
+    def __init__(self, workers, threads_per_worker=None, pin=False):
+        cpus = allowed_cpus()
+        self.threads = threads_per_worker or max(1, len(cpus) // max(workers, 1))
+        self.cpu_sets = None
+
+        if pin:
+            self.cpu_sets = cpu_sets(workers, self.threads, cpus)
+            if self.cpu_sets is None:
+                warn(
+                    f'Cannot pin {workers} workers with {self.threads} threads each '
+                    f'to {len(cpus)} available CPUs; the workers will not be pinned'
+                )
+
+        warn_if_not_limited(self.threads)
+
+        self.limiter = None
+
+    def apply(self, index):
+        """Apply limits for the worker with given index; to be called in the worker process."""
+        if self.cpu_sets:
+            os.sched_setaffinity(0, self.cpu_sets[index])
+        self.limiter = limit_threads(self.threads)
+
+
+def placed(placement: Placement, index, target, *args):
+    """Call target with args, after applying placement of the worker with given index."""
+    placement.apply(index)
+    return target(*args)
@@ -1,29 +1,160 @@
-from contextlib import contextmanager
+import json
+import os
+import sys
+from collections import defaultdict
+from time import monotonic
 
-from multiprocessing import Queue, Process
 from tqdm import tqdm
 
-from multiprocess.signals import STOP
 
+# if set, progress reports are appended as JSON lines to the file
+# with given path ('-' for the standard error stream)
+PROGRESS_JSON_VARIABLE = 'PATAPY_PROGRESS_JSON'
 
-def progress_bar_worker(queue, total):
-    bar = tqdm(total=total)
 
-    for step in iter(queue.get, STOP):
-        if step is STOP:
-            return
-        bar.update(step)
+class Utilisation:
+    """Measures how much of the time the workers spent on computation (rather than waiting)."""
+
+    def __init__(self, processes):
+        self.processes = processes
+        self.busy = 0
+        self.busy_by_worker = defaultdict(float)
+        self.started = monotonic()
+        self.finished = None
+
+    def add(self, busy, worker=None):
+        self.busy += busy
+        if worker is not None:
+            self.busy_by_worker[worker] += busy
+
+    def finish(self):
+        if not self.finished:
+            self.finished = monotonic()
+
+    @property
+    def wall_time(self):
+        return (self.finished or monotonic()) - self.started
+
+    @property
+    def fraction(self):
+        available = self.wall_time * self.processes
+        return self.busy / available if available else 0
+
+    @property
+    def by_worker(self):
+        """Fraction of the wall time each of the workers spent on computation."""
+        wall_time = self.wall_time
+        return {
+            worker: busy / wall_time if wall_time else 0
+            for worker, busy in self.busy_by_worker.items()
+        }
+
+    def __str__(self):
+        return (
+            f'Workers were busy {self.fraction:.0%} of the time '
+            f'({self.processes} processes, {self.wall_time:.1f} s of wall time)'
+        )
+
+
+class Progress:
+    """Tracks progress of a pool run in the parent process.
 
+    Workers report on their own: the parent learns about the progress
+    from the results of chunks, so the counters are updated once per
+    chunk and no additional messages are sent.
 
-@contextmanager
-def progress_bar(total):
-    progress_queue = Queue()
+    Args:
+        total: count of items to be processed
+        processes: count of workers
+        callback: called with a report (see `report`) after updates,
+            at most once per `interval` seconds (and always at the end)
+        json_lines: a file to write the reports to, one JSON object
+            per line; by default given by PATAPY_PROGRESS_JSON variable
+        bar: should a progress bar be shown? By default, only if
+            the standard output is a terminal.
+        interval: minimal time (in seconds) between reports
+    """
 
-    progress = Process(target=progress_bar_worker, args=(progress_queue, total))
+    def __init__(self, total, processes, callback=None, json_lines=None, bar=None, interval=0.5):
+        self.total = total
+        self.done = 0
+        self.utilisation = Utilisation(processes)
+        self.callback = callback
+        self.interval = interval
+        self.reported = None
+
+        self.opened = None
+        if json_lines is None:
+            path = os.environ.get(PROGRESS_JSON_VARIABLE)
+            if path == '-':
+                json_lines = sys.stderr
+            elif path:
+                json_lines = self.opened = open(path, 'a')
+        self.json_lines = json_lines
+
+        if bar is None:
+            bar = sys.stdout.isatty()
+        self.bar = tqdm(total=total) if bar else None
+
+    def update(self, count, busy=0, worker=None):
+        """Record that `count` items were processed by `worker` in `busy` seconds."""
+        self.done += count
+        self.utilisation.add(busy, worker)
+
+        if self.bar:
+            self.bar.update(count)
+
+        now = monotonic()
+        if self.done >= self.total or self.reported is None or now - self.reported >= self.interval:
+            self.reported = now
+            self.emit()
+
+    @property
+    def items_per_second(self):
+        wall_time = self.utilisation.wall_time
+        return self.done / wall_time if wall_time else 0
+
+    @property
+    def eta(self):
+        """Estimated count of seconds until all items are processed (None if unknown)."""
+        speed = self.items_per_second
+        return (self.total - self.done) / speed if speed else None
+
+    def report(self) -> dict:
+        eta = self.eta
+        return {
+            'done': self.done,
+            'total': self.total,
+            'elapsed': round(self.utilisation.wall_time, 3),
+            'items_per_second': round(self.items_per_second, 3),
+            'eta': None if eta is None else round(eta, 3),
+            'utilisation': round(self.utilisation.fraction, 3),
+            'workers': {
+                str(worker): round(fraction, 3)
+                for worker, fraction in self.utilisation.by_worker.items()
+            }
+        }
+
+    def emit(self):
+        if not (self.callback or self.json_lines):
+            return
+        report = self.report()
+        if self.callback:
+            self.callback(report)
+        if self.json_lines:
+            self.json_lines.write(json.dumps(report) + '\n')
+            self.json_lines.flush()
 
-    progress.start()
+    def close(self):
+        self.utilisation.finish()
+        if self.bar:
+            self.bar.close()
+        if self.opened:
+            self.opened.close()
+            self.opened = None
 
-    yield progress_queue
+    def __enter__(self):
+        return self
 
-    progress_queue.put(STOP)
-    progress.join()
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
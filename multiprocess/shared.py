@@ -0,0 +1,177 @@
+from contextlib import contextmanager
+from threading import Lock
+from weakref import finalize
+
+import numpy as np
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:
+    # Python older than 3.8: the arrays are pickled instead
+    shared_memory = None
+
+
+# arrays smaller than this (in bytes) are cheaper to pickle than to share:
+# creating and attaching to a segment costs about as much as pickling
+# 64 KiB, and a shared array is not copied for each of the workers
+SHARING_THRESHOLD = 64 * 1024
+
+
+def attach_segment(name) -> 'shared_memory.SharedMemory':
+    """Attach to an existing shared memory segment, leaving its lifetime to the creator."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python older than 3.13 registers attached segments in the resource
+        # tracker too; as child processes share the tracker of their parent,
+        # this only repeats the registration made by the creator
+        return shared_memory.SharedMemory(name=name)
+
+
+def share_tracker():
+    """Start the resource tracker (if not running yet), to be inherited by processes forked afterwards.
+
+    Otherwise each worker would start a tracker of its own, which
+    would unlink the segments attached by the worker once it exits.
+    """
+    if shared_memory is not None:
+        resource_tracker.ensure_running()
+
+
+class SharedArray:
+    """A numpy array stored in a named shared memory segment.
+
+    When pickled (e.g. passed to a worker process) only the name of the
+    segment, shape and dtype are transferred; the receiving process
+    attaches to the very same memory, without copying the data.
+
+    The process which created the array is responsible for calling
+    `unlink()` once the array is no longer needed by any process.
+    """
+
+    def __init__(self, segment: 'shared_memory.SharedMemory', shape, dtype):
+        self.segment = segment
+        self.shape = shape
+        self.dtype = np.dtype(dtype)
+        self.array = np.ndarray(shape, dtype=self.dtype, buffer=segment.buf)
+        # the segment stays mapped for as long as the array (or any view
+        # of it) is in use, even if this wrapper is dropped (see `unwrap`)
+        finalize(self.array, segment.close)
+
+    @classmethod
+    def from_array(cls, array: np.ndarray):
+        """Copy the array into a newly created shared memory segment."""
+        # zero-sized segments are not allowed
+        segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        shared = cls(segment, array.shape, array.dtype)
+        shared.array[...] = array
+        return shared
+
+    @classmethod
+    def attach(cls, name, shape, dtype):
+        return cls(attach_segment(name), shape, dtype)
+
+    def __reduce__(self):
+        return self.attach, (self.segment.name, self.shape, self.dtype.str)
+
+    def __len__(self):
+        return len(self.array)
+
+    def close(self):
+        # views of the buffer have to be released before closing
+        self.array = None
+        self.segment.close()
+
+    def unlink(self):
+        self.close()
+        self.segment.unlink()
+
+
+def should_share(argument, threshold=SHARING_THRESHOLD) -> bool:
+    """Is the argument a numpy array large enough to be placed in shared memory (if supported)?"""
+    return (
+        shared_memory is not None
+        and isinstance(argument, np.ndarray)
+        and argument.nbytes >= threshold
+    )
+
+
+def unwrap(argument):
+    """Return numpy array for SharedArray or the argument itself otherwise."""
+    if isinstance(argument, SharedArray):
+        return argument.array
+    return argument
+
+
+@contextmanager
+def shared_arrays(arguments, threshold=SHARING_THRESHOLD):
+    """Move large numpy arrays from arguments to shared memory.
+
+    Yields arguments with the arrays of at least `threshold` bytes
+    replaced by `SharedArray`s; the shared memory is released on exit.
+    Without shared memory support the arguments are yielded unchanged.
+    """
+    shared = [
+        SharedArray.from_array(argument) if should_share(argument, threshold) else argument
+        for argument in arguments
+    ]
+    try:
+        yield shared
+    finally:
+        for argument in shared:
+            if isinstance(argument, SharedArray):
+                argument.unlink()
+
+
+class Sharing:
+    """Arrays placed in shared memory for the objects pickled within `sharing` context."""
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        # id of the array -> (the array, SharedArray)
+        self.arrays = {}
+        # the objects may be pickled by a feeder thread of a queue
+        self.lock = Lock()
+
+    def share(self, array):
+        if not should_share(array, self.threshold):
+            return array
+        with self.lock:
+            if id(array) not in self.arrays:
+                # the array is kept referenced, so that its id is not reused
+                self.arrays[id(array)] = array, SharedArray.from_array(array)
+            return self.arrays[id(array)][1]
+
+    def release(self):
+        for array, shared in self.arrays.values():
+            shared.unlink()
+        self.arrays = {}
+
+
+_sharing = None
+
+
+@contextmanager
+def sharing(threshold=SHARING_THRESHOLD):
+    """Place large arrays of the objects pickled within the context in shared memory.
+
+    Objects opt in by passing their arrays through `share` in `__getstate__`
+    (and through `unwrap` in `__setstate__`). An array pickled many times
+    (e.g. once per worker) is copied to shared memory only once. The memory
+    is released on exit, so the objects have to be unpickled by then; the
+    receiving processes can keep using the arrays afterwards.
+    """
+    global _sharing
+    previous, _sharing = _sharing, Sharing(threshold)
+    try:
+        yield _sharing
+    finally:
+        _sharing.release()
+        _sharing = previous
+
+
+def share(array):
+    """Return SharedArray for a large array pickled within `sharing` context, or the array itself otherwise."""
+    if _sharing is None:
+        return array
+    return _sharing.share(array)
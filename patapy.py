@@ -1,6 +1,7 @@
 #!/usr/bin/python3.6
 import sys
 from command_line import CLI
+from databases.pack import main as kegg_main
 from methods import Method, MethodResult
 
 
@@ -28,6 +29,10 @@ def render_text_table(method: Method, results: MethodResult):
 
 
 def run(argv):
+    # management of local copies of databases, e.g. `patapy kegg build-pack hsa`
+    if len(argv) > 1 and argv[1] == 'kegg':
+        return kegg_main(argv[2:])
+
     args = CLI().parse_args(argv[1:])
     results = args.method.run(args.experiment)
     render_text_table(args.method, results)
@@ -0,0 +1,103 @@
+import os
+from time import time
+
+import pytest
+
+from databases import DiskCache, KEGGPathways, OfflineError
+
+
+ORGANISMS = 'T01001\thsa\tHomo sapiens (human)\tEukaryotes;Animals;Vertebrates;Mammals\n'
+
+
+def test_store_and_load(tmpdir):
+    cache = DiskCache(tmpdir)
+
+    with pytest.raises(KeyError):
+        cache.load(('list', 'organism'))
+
+    cache.store(('list', 'organism'), ORGANISMS)
+    assert cache.load(('list', 'organism')) == ORGANISMS
+
+    # the cache is persistent
+    assert DiskCache(tmpdir).load(('list', 'organism')) == ORGANISMS
+
+    assert cache.statistics.hits == 1
+
+
+def test_read_only_cache(tmpdir, monkeypatch):
+    cache = DiskCache(tmpdir)
+    cache.store(('list', 'organism'), ORGANISMS)
+
+    def read_only(*args, **kwargs):
+        raise PermissionError('Read-only file system')
+
+    monkeypatch.setattr(os, 'utime', read_only)
+
+    # the access time cannot be updated, but the entry is there
+    assert cache.load(('list', 'organism')) == ORGANISMS
+    assert cache.statistics.hits == 1
+
+
+def test_size_after_overwrite(tmpdir):
+    cache = DiskCache(tmpdir)
+    cache.store(('a',), 'x' * 1000)
+    cache.store(('b',), 'x' * 1000)
+    size = cache.size
+
+    for _ in range(3):
+        cache.store(('a',), 'x' * 1000)
+
+    assert cache.size == size == sum(size for used, size, path in cache.entries())
+
+
+def test_expiry(tmpdir):
+    cache = DiskCache(tmpdir, ttl=60)
+    cache.store(('find', 'hsa', 'TP53'), 'hsa:7157')
+
+    # pretend the entry was stored two minutes ago
+    path = cache.path(('find', 'hsa', 'TP53'))
+    os.utime(path, (time(), time() - 120))
+
+    with pytest.raises(KeyError):
+        cache.load(('find', 'hsa', 'TP53'))
+    assert cache.statistics.expired == 1
+
+    assert cache.load(('find', 'hsa', 'TP53'), allow_expired=True) == 'hsa:7157'
+
+
+def test_eviction(tmpdir):
+    cache = DiskCache(tmpdir)
+    cache.store(('a',), 'x' * 1000)
+    entry_size = cache.size
+    cache.max_size = 2 * entry_size
+
+    cache.store(('b',), 'x' * 1000)
+    # make 'a' the most recently used one
+    os.utime(cache.path(('b',)), (time() - 10, time()))
+    cache.load(('a',))
+
+    cache.store(('c',), 'x' * 1000)
+
+    assert cache.statistics.evictions == 1
+    assert cache.size <= cache.max_size
+
+    with pytest.raises(KeyError):
+        cache.load(('b',))
+
+    assert cache.load(('a',)) == cache.load(('c',))
+
+
+def test_offline_kegg(tmpdir):
+    cache = DiskCache(tmpdir)
+    cache.store(('get_pathway_by_gene', 'BRCA2', 'gga'), {'gga03440': 'Homologous recombination'})
+
+    db = KEGGPathways('chicken', cache=cache, offline=True)
+    assert db.organism == 'gga'
+    assert db.search_by_gene('BRCA2') == {'gga03440': 'Homologous recombination'}
+
+    # fails fast, without trying to connect
+    with pytest.raises(OfflineError):
+        db.search_by_gene('TP53')
+    assert db._database is None
+
+    assert cache.statistics.hits == 1
@@ -0,0 +1,118 @@
+import random
+
+import networkx as nx
+
+from databases import DiskCache, KEGGPathways
+
+
+def quadratic_pathway_graph(pathway, self_loops=False):
+    """The former implementation: connect predecessors with successors of each non-gene node."""
+    G = nx.DiGraph()
+    names = {}
+    for entry in pathway['entries']:
+        if entry['gene_names']:
+            names[entry['id']] = {'name': entry['gene_names'], 'type': entry['type']}
+
+    for rel in pathway['relations']:
+        if rel['entry1'] in names and rel['entry2'] in names:
+            e1 = names[rel['entry1']]['name']
+            e2 = names[rel['entry2']]['name']
+            G.add_node(e1, type=names[rel['entry1']]['type'])
+            G.add_node(e2, type=names[rel['entry2']]['type'])
+            if G.has_edge(e1, e2):
+                G[e1][e2]['type'] = G[e1][e2]['type'] + [rel['name']]
+            elif e1 != e2 or self_loops:
+                G.add_edge(e1, e2, type=[rel['name']])
+
+    not_gene_nodes = []
+    for node in G.nodes():
+        if G.nodes[node]['type'] != 'gene':
+            for in_edge in G.in_edges(node):
+                for out_edge in G.out_edges(node):
+                    if in_edge[0] != out_edge[1] or self_loops:
+                        G.add_edge(in_edge[0], out_edge[1], type=['indirect'])
+            not_gene_nodes.append(node)
+    G.remove_nodes_from(not_gene_nodes)
+    return G
+
+
+def random_pathway(generator: random.Random, entries_count=30, relations_count=60):
+    entries = [
+        {
+            'id': str(i),
+            # some entries share names, some have none (e.g. maps)
+            'gene_names': generator.choice(['', f'node {generator.randrange(entries_count)}']),
+            'type': generator.choice(['gene', 'gene', 'compound', 'ortholog'])
+        }
+        for i in range(entries_count)
+    ]
+    relations = [
+        {
+            'entry1': str(generator.randrange(entries_count)),
+            'entry2': str(generator.randrange(entries_count)),
+            'name': generator.choice(['activation', 'inhibition', 'compound', 'binding/association'])
+        }
+        for _ in range(relations_count)
+    ]
+    return {'entries': entries, 'relations': relations}
+
+
+def test_chain_of_compounds():
+    entries = [
+        {'id': '1', 'gene_names': 'A', 'type': 'gene'},
+        {'id': '2', 'gene_names': 'C1', 'type': 'compound'},
+        {'id': '3', 'gene_names': 'C2', 'type': 'compound'},
+        {'id': '4', 'gene_names': 'B', 'type': 'gene'},
+        {'id': '5', 'gene_names': 'C', 'type': 'gene'},
+    ]
+    relations = [
+        {'entry1': '1', 'entry2': '2', 'name': 'compound'},
+        {'entry1': '2', 'entry2': '3', 'name': 'compound'},
+        {'entry1': '3', 'entry2': '2', 'name': 'compound'},
+        {'entry1': '3', 'entry2': '4', 'name': 'compound'},
+        {'entry1': '1', 'entry2': '4', 'name': 'activation'},
+        {'entry1': '4', 'entry2': '5', 'name': 'activation'},
+        {'entry1': '4', 'entry2': '5', 'name': 'phosphorylation'},
+    ]
+    G = KEGGPathways.pathway_graph({'entries': entries, 'relations': relations})
+
+    assert set(G.nodes) == {'A', 'B', 'C'}
+    # the direct edge is replaced by the one through the compounds
+    assert G['A']['B']['type'] == ['indirect']
+    assert G['B']['C']['type'] == ['activation', 'phosphorylation']
+    assert G.number_of_edges() == 2
+
+
+def test_same_as_quadratic_contraction():
+    generator = random.Random(0)
+    for _ in range(200):
+        pathway = random_pathway(generator)
+        for self_loops in [False, True]:
+            expected = quadratic_pathway_graph(pathway, self_loops)
+            G = KEGGPathways.pathway_graph(pathway, self_loops)
+            assert nx.utils.graphs_equal(G, expected)
+
+
+def test_graphs_cached(tmpdir, monkeypatch):
+    db = KEGGPathways('hsa', cache=DiskCache(tmpdir), offline=True, pack=False)
+    pathway = random_pathway(random.Random(1))
+    db.cache.store(('parse_kgml_pathway', 'hsa00001'), pathway)
+
+    contracted = []
+    pathway_graph = KEGGPathways.pathway_graph
+    monkeypatch.setattr(
+        KEGGPathways, 'pathway_graph',
+        staticmethod(lambda *args: contracted.append(args) or pathway_graph(*args))
+    )
+
+    G = db.get_pathway('hsa00001')
+    assert len(contracted) == 1
+
+    # changes of returned graphs do not affect the cached ones
+    G.add_node('new one')
+    assert 'new one' not in db.get_pathway('hsa00001')
+    assert nx.utils.graphs_equal(dict(db.get_pathways(['hsa00001']))['hsa00001'], pathway_graph(pathway))
+    assert len(contracted) == 1
+
+    db.get_pathway('hsa00001', self_loops=True)
+    assert len(contracted) == 2
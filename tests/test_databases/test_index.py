@@ -0,0 +1,55 @@
+from databases import DiskCache, KEGGPathways, PathwayIndex
+
+
+GENES = (
+    'hsa:675\tCDS\t13:32315508..32400268\tBRCA2, BRCC2, FACD; BRCA2 DNA repair associated\n'
+    'hsa:7157\tCDS\t17:complement(7668421..7687490)\tTP53, BCC7, LFS1; tumor protein p53\n'
+    'hsa:2176\tCDS\t9:complement(95099054..95178188)\tFANCC, FACC, FACD; FA complementation group C\n'
+)
+
+LINKS = (
+    'hsa:675\tpath:hsa03440\n'
+    'hsa:675\tpath:hsa03460\n'
+    'hsa:7157\tpath:hsa04110\n'
+    'hsa:2176\tpath:hsa03460\n'
+)
+
+PATHWAYS = (
+    'path:hsa03440\tHomologous recombination - Homo sapiens (human)\n'
+    'path:hsa03460\tFanconi anemia pathway - Homo sapiens (human)\n'
+    'path:hsa04110\tCell cycle - Homo sapiens (human)\n'
+)
+
+
+def test_index():
+    index = PathwayIndex.from_kegg(GENES, LINKS, PATHWAYS)
+
+    assert index.pathways_of('BRCA2') == {
+        'hsa03440': 'Homologous recombination',
+        'hsa03460': 'Fanconi anemia pathway'
+    }
+    # by KEGG gene id
+    assert index.pathways_of('7157') == {'hsa04110': 'Cell cycle'}
+
+    # FACD is an alias of both BRCA2 and FANCC
+    assert set(index.pathways_of('FACD')) == {'hsa03440', 'hsa03460'}
+
+    assert index.pathways_of('TheMostImportantGene') == {}
+
+    assert set(index.pathways_for_genes(['TP53', 'FANCC'])) == {'hsa04110', 'hsa03460'}
+    assert index.pathway_genes['hsa03460'] == {'675', '2176'}
+
+
+def test_lookups_after_bulk_queries(tmpdir):
+    cache = DiskCache(tmpdir)
+    cache.store(('list', 'hsa'), GENES)
+    cache.store(('link', 'pathway', 'hsa'), LINKS)
+    cache.store(('list', 'pathway', 'hsa'), PATHWAYS)
+
+    db = KEGGPathways(cache=cache, offline=True)
+
+    assert db.search_by_gene('TP53') == {'hsa04110': 'Cell cycle'}
+    assert len(db.pathways_for_genes(['BRCA2', 'TP53', 'TheMostImportantGene'])) == 3
+
+    # the index was built once, with three queries
+    assert cache.statistics.hits == 3
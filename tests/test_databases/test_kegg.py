@@ -1,11 +1,20 @@
 from databases import KEGGPathways
+from databases.cache import CACHE_DIR_VARIABLE
 import networkx as nx
 import pytest
 
 
-def test_keggpathways_init():
+@pytest.fixture(autouse=True)
+def cache_directory(tmpdir, monkeypatch):
+    # KEGGPathways() caches the responses in a temporary directory, not in the cache of the user
+    monkeypatch.setenv(CACHE_DIR_VARIABLE, str(tmpdir))
+    return tmpdir
+
+
+def test_keggpathways_init(cache_directory):
     db = KEGGPathways()
     assert db.organism == "hsa"
+    assert str(db.cache.directory).startswith(str(cache_directory))
     db1 = KEGGPathways("Gallus gallus")
     db2 = KEGGPathways("gallus gallus")
     db3 = KEGGPathways("chicken")
@@ -24,7 +33,7 @@ def test_search_by_gene():
 def test_get_pathway():
     db = KEGGPathways()
     pathway = db.get_pathway('hsa04630')
-    assert all([pathway.node[node]['type'] == 'gene' for node in pathway.nodes])
+    assert all([pathway.nodes[node]['type'] == 'gene' for node in pathway.nodes])
     assert all(isinstance(attr, list) for attr in nx.get_edge_attributes(pathway, 'type').values())
     assert all([pathway.degree(node) > 0 for node in pathway.nodes])
 
@@ -0,0 +1,103 @@
+import pickle
+import random
+
+import networkx as nx
+from bioservices.kegg import KEGG
+
+from databases import DiskCache, KEGGPathways
+from databases.kgml import KGMLPathway, parse_kgml
+
+
+KGML = """<?xml version="1.0"?>
+<!DOCTYPE pathway SYSTEM "https://www.kegg.jp/kegg/xml/KGML_v0.7.2_.dtd">
+<pathway name="path:hsa00002" org="hsa" number="00002" title="Test pathway">
+    <entry id="1" name="hsa:7157" type="gene" link="https://www.kegg.jp/dbget-bin/www_bget?hsa:7157">
+        <graphics name="TP53, LFS1" fgcolor="#000000" bgcolor="#BFFFBF" type="rectangle" x="1" y="2"/>
+    </entry>
+    <entry id="2" name="hsa:1017" type="gene"><graphics name="CDK2, CDKN2" type="rectangle"/></entry>
+    <entry id="3" name="cpd:C00001" type="compound"><graphics name="C00001" type="circle"/></entry>
+    <entry id="4" name="path:hsa04110" type="map"><graphics name="Cell cycle &amp; more" type="roundrectangle"/></entry>
+    <entry id="5" name="undefined" type="group">
+        <graphics fgcolor="#000000" type="rectangle"/>
+        <component id="1"/>
+        <component id="2"/>
+    </entry>
+    <entry id="6" name="hsa:675" type="gene"><graphics name="BRCA2" type="rectangle"/></entry>
+    <relation entry1="1" entry2="2" type="PPrel">
+        <subtype name="inhibition" value="--|"/>
+        <subtype name="phosphorylation" value="+p"/>
+    </relation>
+    <relation entry1="2" entry2="3" type="PCrel"><subtype name="compound" value="3"/></relation>
+    <relation entry1="3" entry2="6" type="PCrel"><subtype name="compound" value="3"/></relation>
+    <relation entry1="6" entry2="4" type="maplink"/>
+    <relation entry1="5" entry2="6" type="PPrel"><subtype name="activation" value="--&gt;"/></relation>
+    <relation entry1="6" entry2="99" type="PPrel"><subtype name="activation" value="--&gt;"/></relation>
+</pathway>
+"""
+
+
+def parse_with_bioservices(kgml):
+    # the parser does not need a connection (unlike the constructor)
+    return KEGG.__new__(KEGG).parse_kgml_pathway(None, res=kgml)
+
+
+def random_kgml(generator: random.Random, entries_count=40, relations_count=80):
+    lines = ['<?xml version="1.0"?>', '<pathway name="path:hsa00003" org="hsa">']
+    for i in range(entries_count):
+        node_type = generator.choice(['gene', 'gene', 'compound', 'ortholog', 'map'])
+        graphics = generator.choice(['', '<graphics type="line"/>', f'<graphics name="node {generator.randrange(20)}"/>'])
+        lines.append(f'<entry id="{i}" name="x:{i}" type="{node_type}">{graphics}</entry>')
+    for _ in range(relations_count):
+        subtypes = ''.join(
+            f'<subtype name="{generator.choice(["activation", "inhibition", "compound"])}" value="-"/>'
+            for _ in range(generator.randrange(3))
+        )
+        first, second = generator.randrange(entries_count + 2), generator.randrange(entries_count + 2)
+        lines.append(f'<relation entry1="{first}" entry2="{second}" type="PPrel">{subtypes}</relation>')
+    lines.append('</pathway>')
+    return '\n'.join(lines)
+
+
+def test_parse_kgml():
+    pathway = parse_kgml(KGML)
+
+    assert pathway.names == ['TP53, LFS1', 'CDK2, CDKN2', 'C00001', 'BRCA2', 'Cell cycle & more']
+    assert pathway.types == ['gene', 'gene', 'compound', 'gene', 'map']
+    # the group has no name, the relation with entry 99 leads outside of the pathway
+    assert len(pathway) == 5
+    assert [pathway.interaction_types[code] for code in pathway.interactions] == [
+        'inhibition', 'phosphorylation', 'compound', 'compound', None
+    ]
+
+    G = pathway.graph()
+    assert dict(G.edges) == {
+        ('TP53, LFS1', 'CDK2, CDKN2'): {'type': ['inhibition', 'phosphorylation']},
+        ('CDK2, CDKN2', 'BRCA2'): {'type': ['indirect']}
+    }
+
+    # bytes are accepted as well
+    assert parse_kgml(KGML.encode()).names == pathway.names
+
+
+def test_same_as_bioservices():
+    generator = random.Random(0)
+    for kgml in [KGML] + [random_kgml(generator) for _ in range(50)]:
+        parsed = parse_with_bioservices(kgml)
+        for self_loops in [False, True]:
+            assert nx.utils.graphs_equal(
+                parse_kgml(kgml).graph(self_loops),
+                KGMLPathway.from_parsed(parsed).graph(self_loops)
+            )
+
+
+def test_pickle():
+    pathway = pickle.loads(pickle.dumps(parse_kgml(KGML)))
+    assert nx.utils.graphs_equal(pathway.graph(), parse_kgml(KGML).graph())
+
+
+def test_pathways_cached_by_bioservices(tmpdir):
+    cache = DiskCache(tmpdir)
+    cache.store(('parse_kgml_pathway', 'hsa00002'), parse_with_bioservices(KGML))
+
+    db = KEGGPathways(cache=cache, offline=True, pack=False)
+    assert nx.utils.graphs_equal(db.get_pathway('hsa00002'), parse_kgml(KGML).graph())
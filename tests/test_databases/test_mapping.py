@@ -0,0 +1,40 @@
+from databases import DiskCache, GeneMapping, KEGGPathways
+from databases.mapping import parse_conversions
+
+from .test_index import GENES
+from .utilities import KEGGStandIn
+
+
+CONVERSIONS = 'hsa:675\tncbi-geneid:675\nhsa:7157\tncbi-geneid:7157\nhsa:2176\tncbi-geneid:2176\n'
+
+
+def test_parse_conversions():
+    assert parse_conversions(CONVERSIONS) == {'675': '675', '7157': '7157', '2176': '2176'}
+    # either direction
+    assert parse_conversions('ncbi-geneid:1\teco:b0001\n') == {'b0001': '1'}
+
+
+def test_mapping():
+    mapping = GeneMapping.from_kegg(GENES, CONVERSIONS)
+
+    ids, unmapped = mapping.map(['BRCA2', 'LFS1', '2176', 'TheMostImportantGene', 'BRCA2'])
+    assert ids == ['675', '7157', '2176', None, '675']
+    assert unmapped == ['TheMostImportantGene']
+
+    # FACD is an alias of both BRCA2 and FANCC
+    assert mapping.map(['FACD']) == (['2176'], [])
+
+    assert mapping.map([]) == ([], [])
+
+
+def test_gene_mapping(tmpdir):
+    responses = {'/list/hsa': GENES, '/conv/ncbi-geneid/hsa': CONVERSIONS}
+
+    with KEGGStandIn(responses) as server:
+        db = KEGGPathways(cache=DiskCache(tmpdir), base_url=server.url)
+        assert db.gene_mapping().map(['TP53']) == (['7157'], [])
+        assert db.gene_mapping() is db.gene_mapping()
+
+    # the tables are cached on the disk
+    assert server.requests == ['/list/hsa', '/conv/ncbi-geneid/hsa']
+    assert db.cache.load(('conv', 'ncbi-geneid', 'hsa')) == CONVERSIONS
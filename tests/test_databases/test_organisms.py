@@ -0,0 +1,50 @@
+import pytest
+
+from databases import DiskCache, KEGGPathways, OrganismTable
+from databases.organisms import SNAPSHOT
+
+
+ORGANISMS = (
+    'T01001\thsa\tHomo sapiens (human)\tEukaryotes;Animals;Vertebrates;Mammals\n'
+    'T00007\teco\tEscherichia coli K-12 MG1655\tProkaryotes;Bacteria;Gammaproteobacteria\n'
+    'T03325\tpvx\tPanthera pardus (leopard)\tEukaryotes;Animals;Vertebrates;Mammals\n'
+)
+
+
+def test_table():
+    table = OrganismTable.from_kegg_list(ORGANISMS)
+
+    assert table.code('Panthera pardus') == table.code('LEOPARD') == 'pvx'
+    assert table.code('escherichia coli k-12 mg1655') == 'eco'
+
+    # codes are accepted as well
+    assert table.code('pvx') == 'pvx'
+
+    assert sorted(table.names_of('hsa')) == ['homo sapiens', 'human']
+
+    with pytest.raises(KeyError):
+        table.code('Homo bioinformaticus')
+
+
+def test_snapshot():
+    assert SNAPSHOT.code('ChIcKeN') == SNAPSHOT.code('Gallus gallus') == 'gga'
+    assert 'hsa' in SNAPSHOT
+
+
+def test_organisms_loaded_once(tmpdir):
+    cache = DiskCache(tmpdir)
+
+    # common organisms need neither network nor cache
+    assert KEGGPathways('human', cache=cache, offline=True).organism == 'hsa'
+    assert cache.statistics.hits + cache.statistics.misses == 0
+
+    cache.store(('list', 'organism'), ORGANISMS)
+
+    databases = [KEGGPathways(name, cache=cache, offline=True) for name in ['leopard', 'pvx', 'Panthera pardus']]
+    assert {db.organism for db in databases} == {'pvx'}
+
+    # the list was loaded only for the first instance
+    assert cache.statistics.hits == 1
+
+    with pytest.raises(KeyError):
+        KEGGPathways('Homo bioinformaticus', cache=cache, offline=True)
@@ -0,0 +1,90 @@
+import networkx as nx
+import pytest
+
+from databases import DiskCache, KEGGPack, KEGGPathways
+from databases.cache import CACHE_DIR_VARIABLE
+from databases.pack import PACKS_VARIABLE, PackError
+from patapy import run
+
+
+GENES = (
+    'hsa:675\tCDS\t13:32315508..32400268\tBRCA2, FACD; BRCA2 DNA repair associated\n'
+    'hsa:7157\tCDS\t17:7668421..7687490\tTP53, LFS1; tumor protein p53\n'
+    'hsa:1017\tCDS\t12:55966769..55972784\tCDK2, CDKN2; cyclin dependent kinase 2\n'
+)
+
+LINKS = 'hsa:675\tpath:hsa03440\nhsa:7157\tpath:hsa04110\nhsa:1017\tpath:hsa04110\n'
+
+PATHWAYS = (
+    'path:hsa03440\tHomologous recombination - Homo sapiens (human)\n'
+    'path:hsa04110\tCell cycle - Homo sapiens (human)\n'
+)
+
+
+def entry(id, names, type='gene'):
+    return {'id': id, 'name': 'hsa:' + id, 'type': type, 'gene_names': names}
+
+
+def relation(first, second, name):
+    return {'entry1': first, 'entry2': second, 'name': name}
+
+
+CELL_CYCLE = {
+    'entries': [entry('1', 'TP53, LFS1'), entry('2', 'CDK2, CDKN2'), entry('3', 'C00001', 'compound')],
+    'relations': [
+        relation('1', '2', 'inhibition'), relation('1', '2', 'expression'),
+        relation('2', '3', 'activation'), relation('3', '1', 'activation')
+    ]
+}
+
+
+@pytest.fixture
+def kegg_cache(tmpdir, monkeypatch):
+    monkeypatch.setenv(CACHE_DIR_VARIABLE, str(tmpdir.join('cache')))
+    cache = DiskCache(tmpdir.join('cache', 'kegg'))
+    for key, value in [
+        (('list', 'hsa'), GENES),
+        (('link', 'pathway', 'hsa'), LINKS),
+        (('list', 'pathway', 'hsa'), PATHWAYS),
+        (('parse_kgml_pathway', 'hsa04110'), CELL_CYCLE),
+        (('parse_kgml_pathway', 'hsa03440'), {'entries': [entry('1', 'BRCA2, FACD')], 'relations': []}),
+    ]:
+        cache.store(key, value)
+    return cache
+
+
+def test_build_and_use_pack(tmpdir, kegg_cache, monkeypatch):
+    path = tmpdir.join('packs', 'hsa.pack')
+
+    pack = run(['patapy.py', 'kegg', 'build-pack', 'human', '--output', str(path), '--offline'])
+
+    assert pack.organism == 'hsa'
+    assert pack.pathway_ids == ['hsa03440', 'hsa04110']
+
+    cached = KEGGPathways(cache=kegg_cache, offline=True, pack=False)
+    packed = KEGGPathways(cache=DiskCache(tmpdir.join('empty')), offline=True, pack=str(path))
+
+    expected = cached.get_pathway('hsa04110')
+    graph = packed.get_pathway('hsa04110')
+
+    assert set(graph.edges) == set(expected.edges) == {('TP53, LFS1', 'CDK2, CDKN2'), ('CDK2, CDKN2', 'TP53, LFS1')}
+    assert nx.get_edge_attributes(graph, 'type') == nx.get_edge_attributes(expected, 'type')
+
+    assert packed.search_by_gene('LFS1') == {'hsa04110': 'Cell cycle'}
+    assert packed.pathways_for_genes(['BRCA2', '7157']) == cached.pathways_for_genes(['BRCA2', '7157'])
+    assert dict(packed.get_pathways(['hsa03440']))['hsa03440'].number_of_nodes() == 0
+
+    # packs are found in PATAPY_KEGG_PACKS directory
+    monkeypatch.setenv(PACKS_VARIABLE, str(tmpdir.join('packs')))
+    assert KEGGPathways(offline=True).pack.path == path
+
+    with pytest.raises(ValueError, match='not of gga'):
+        KEGGPathways('chicken', offline=True, pack=str(path))
+
+
+def test_pack_version(tmpdir):
+    path = tmpdir.join('broken.pack')
+    path.write_binary(b'PATAPACK' + (99).to_bytes(4, 'little') + bytes(8))
+
+    with pytest.raises(PackError, match='rebuild'):
+        KEGGPack(str(path))
@@ -0,0 +1,151 @@
+from time import monotonic
+
+import pytest
+from requests import HTTPError
+
+from databases import DiskCache, KEGGPathways, OfflineError, kegg
+from databases.remote import KEGG_URL_VARIABLE, RateLimiter
+
+from .test_index import GENES, LINKS, PATHWAYS
+from .utilities import KEGGStandIn
+
+
+KGML = """<?xml version="1.0"?>
+<pathway name="path:hsa00001" org="hsa" number="00001" title="Test pathway">
+    <entry id="1" name="hsa:675" type="gene"><graphics name="BRCA2" type="rectangle"/></entry>
+    <entry id="2" name="hsa:7157" type="gene"><graphics name="TP53" type="rectangle"/></entry>
+    <relation entry1="1" entry2="2" type="PPrel"><subtype name="activation" value="--&gt;"/></relation>
+</pathway>
+"""
+
+RESPONSES = {
+    '/get/hsa00001/kgml': KGML,
+    '/get/hsa00002/kgml': KGML,
+    '/list/hsa': GENES,
+    '/link/pathway/hsa': LINKS,
+    '/list/pathway/hsa': PATHWAYS,
+    '/find/hsa/BRCA2': 'hsa:675\tBRCA2, BRCC2, FACD; BRCA2 DNA repair associated\n',
+}
+
+
+@pytest.fixture
+def kegg_server():
+    with KEGGStandIn(RESPONSES) as server:
+        yield server
+
+
+def test_rate_limiter():
+    limiter = RateLimiter(rate=20)
+    started = monotonic()
+    for _ in range(5):
+        limiter.wait()
+    # the first call passes immediately
+    assert monotonic() - started >= 4 / 20
+
+
+def test_get_pathways(tmpdir, kegg_server):
+    db = KEGGPathways(cache=DiskCache(tmpdir), base_url=kegg_server.url)
+
+    ids = ['hsa00001', 'hsa00002', 'hsa99999']
+    pathways = dict(db.get_pathways(ids))
+
+    assert set(pathways) == set(ids)
+    assert list(pathways['hsa00001'].edges(data='type')) == [('BRCA2', 'TP53', ['activation'])]
+
+    # incorrect ids give empty graphs, as in get_pathway
+    assert len(pathways['hsa99999']) == 0
+
+    # the pathways are cached
+    offline = KEGGPathways(cache=DiskCache(tmpdir), offline=True)
+    assert [pathway_id for pathway_id, graph in offline.get_pathways(ids[:2])] == ids[:2]
+    assert offline.get_pathway('hsa00002').number_of_edges() == 1
+
+    with pytest.raises(OfflineError):
+        list(offline.get_pathways(['hsa99999']))
+
+    assert sorted(kegg_server.requests) == ['/get/%s/kgml' % pathway_id for pathway_id in ids]
+
+
+def test_cached_graphs_are_copies(tmpdir, kegg_server):
+    db = KEGGPathways(cache=DiskCache(tmpdir), base_url=kegg_server.url)
+
+    for _ in range(2):
+        # the first graph is contracted, the second one comes from the graphs remembered in the process
+        pathway = db.get_pathway('hsa00001')
+        assert list(pathway.edges(data='type')) == [('BRCA2', 'TP53', ['activation'])]
+
+        # as when edges are merged by a caller
+        pathway.edges['BRCA2', 'TP53']['type'].append('indirect')
+        pathway.nodes['TP53']['type'] = 'compound'
+
+    assert db.get_pathway('hsa00001').nodes['TP53']['type'] == 'gene'
+
+
+def test_bulk_queries(tmpdir, kegg_server, monkeypatch):
+    monkeypatch.setenv(KEGG_URL_VARIABLE, kegg_server.url)
+    db = KEGGPathways(cache=DiskCache(tmpdir))
+
+    assert db.pathways_for_genes(['BRCA2', 'TP53']) == {
+        'hsa03440': 'Homologous recombination',
+        'hsa03460': 'Fanconi anemia pathway',
+        'hsa04110': 'Cell cycle'
+    }
+    assert db.get_gene_code('BRCA2').startswith('hsa:675')
+    assert db.get_gene_code('BIOINF2018') == ''
+    assert kegg_server.requests == [
+        '/list/hsa', '/link/pathway/hsa', '/list/pathway/hsa', '/find/hsa/BRCA2', '/find/hsa/BIOINF2018'
+    ]
+
+
+def test_latency(tmpdir):
+    ids = ['hsa00001', 'hsa00002', 'hsa00003', 'hsa00004']
+
+    with KEGGStandIn(RESPONSES, latency=0.3) as server:
+        db = KEGGPathways(cache=DiskCache(tmpdir), base_url=server.url)
+        pathways = dict(db.get_pathways(ids, workers=4))
+
+    assert len(pathways) == 4
+    assert sorted(server.requests) == ['/get/%s/kgml' % pathway_id for pathway_id in ids]
+    # the downloads overlap (each waits for the latency long enough for the others to start)
+    assert server.max_in_flight > 1
+
+
+def test_errors(tmpdir, monkeypatch):
+    with KEGGStandIn(RESPONSES, errors={'/link/pathway/hsa': 500}) as server:
+        db = KEGGPathways(cache=DiskCache(tmpdir), base_url=server.url)
+        assert db.pathway_index() is None
+        requests = len(server.requests)
+
+        # the failure is remembered for a while, so that
+        # lookups of many genes do not repeat the queries
+        del server.errors['/link/pathway/hsa']
+        assert db.pathway_index() is None
+        assert len(server.requests) == requests
+
+        # and the index is built on the next attempt afterwards
+        monkeypatch.setattr(kegg, 'INDEX_RETRY_INTERVAL', 0)
+        assert db.pathway_index().pathways_of('TP53') == {'hsa04110': 'Cell cycle'}
+
+    with KEGGStandIn(RESPONSES, error_rate=1) as server:
+        db = KEGGPathways(cache=DiskCache(tmpdir.join('other')), base_url=server.url)
+        with pytest.raises(HTTPError):
+            list(db.get_pathways(['hsa00001']))
+        assert not list(db.cache.entries())
+
+
+def test_record_and_replay(tmpdir):
+    recording = str(tmpdir.join('kegg.json'))
+
+    with KEGGStandIn(RESPONSES) as upstream:
+        with KEGGStandIn(upstream=upstream.url) as recorder:
+            db = KEGGPathways(cache=DiskCache(tmpdir.join('first')), base_url=recorder.url)
+            recorded = db.get_pathway('hsa00001')
+            assert len(db.get_pathway('hsa99999')) == 0
+            recorder.save(recording)
+
+    with KEGGStandIn.from_file(recording) as server:
+        db = KEGGPathways(cache=DiskCache(tmpdir.join('second')), base_url=server.url)
+        assert list(db.get_pathway('hsa00001').edges(data='type')) == list(recorded.edges(data='type'))
+
+    assert upstream.requests == ['/get/hsa00001/kgml', '/get/hsa99999/kgml']
+    assert list(server.responses) == ['/get/hsa00001/kgml']
@@ -0,0 +1,207 @@
+"""Local stand-in for KEGG REST API, for tests and benchmarks.
+
+Responses are recorded once (from KEGG, or written by hand) and replayed
+by a local server, optionally with latency and failures added, so that the
+data, the timing and the errors are the same on every run.
+
+To record responses (of requests for paths which were not recorded yet)
+while running an analysis, and to replay them later::
+
+    python tests/test_databases/utilities.py kegg.json --record https://rest.kegg.jp
+    python tests/test_databases/utilities.py kegg.json --latency 0.3
+
+and point patapy at the printed URL with PATAPY_KEGG_URL variable.
+"""
+import json
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from random import Random
+from socketserver import ThreadingMixIn
+from threading import Lock, Thread
+from time import sleep
+
+import requests
+
+
+# http.server.ThreadingHTTPServer is available only from Python 3.7
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class KEGGStandIn:
+    """HTTP server replaying recorded responses of KEGG REST API.
+
+    Paths without a recorded response get 404 Not Found, as incorrect
+    queries get from KEGG. Use as a context manager; give `url`
+    to `KEGGPathways` as `base_url`.
+
+    Requests with 'Range: bytes=N-' header get the rest of the body from
+    the offset N (206 Partial Content), as needed to resume downloads
+    of files (see `from_directory`).
+
+    Args:
+        responses: recorded responses, path (ex. '/list/organism') -> body (text or bytes)
+        latency: seconds to wait before responding to each request
+        error_rate: fraction of requests (chosen randomly) to fail with HTTP 503
+        errors: path -> HTTP status code to respond with to each request for the path
+        upstream: URL of the server to forward the requests for paths not
+            recorded yet to, recording the responses (save these with `save`)
+        seed: seed of the random choice of failing requests
+    """
+
+    def __init__(
+        self, responses: dict = None, latency: float = 0, error_rate: float = 0,
+        errors: dict = None, upstream: str = None, seed=0
+    ):
+        self.responses = dict(responses or {})
+        self.latency = latency
+        self.error_rate = error_rate
+        self.errors = dict(errors or {})
+        self.upstream = upstream.rstrip('/') if upstream else None
+        self.random = Random(seed)
+        self.lock = Lock()
+        # paths of all the requests received, in order
+        self.requests = []
+        # 'Range' headers of the requests which had one, in order
+        self.ranges = []
+        # the number of requests being responded to, and its maximum so far
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.server = None
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        """Create the stand-in replaying responses saved with `save`."""
+        with open(path) as f:
+            return cls(json.load(f), **kwargs)
+
+    @classmethod
+    def from_directory(cls, directory, **kwargs):
+        """Create the stand-in serving files of the directory (as a mirror of a remote), read once."""
+        directory = Path(directory)
+        responses = {
+            '/' + path.relative_to(directory).as_posix(): path.read_bytes()
+            for path in directory.rglob('*')
+            if path.is_file()
+        }
+        return cls(responses, **kwargs)
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.responses, f, indent=0, sort_keys=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def respond(self, path: str, byte_range: str = None):
+        """Return (HTTP status code, body) of the response to request for `path`."""
+        with self.lock:
+            self.requests.append(path)
+            if byte_range:
+                self.ranges.append(byte_range)
+            failed = self.error_rate and self.random.random() < self.error_rate
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        try:
+            return self._respond(path, byte_range, failed)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def _respond(self, path, byte_range, failed):
+        if self.latency:
+            sleep(self.latency)
+
+        if path in self.errors:
+            return self.errors[path], ''
+        if failed:
+            return 503, 'Service Unavailable'
+
+        if path not in self.responses and self.upstream:
+            response = requests.get(self.upstream + path, timeout=60)
+            if response.status_code != 200:
+                return response.status_code, response.text
+            with self.lock:
+                self.responses[path] = response.text
+
+        if path not in self.responses:
+            return 404, ''
+
+        body = self.responses[path]
+        if byte_range:
+            offset = int(byte_range[len('bytes='):].rstrip('-'))
+            # 416 Range Not Satisfiable
+            if offset >= len(body):
+                return 416, ''
+            return 206, body[offset:]
+        return 200, body
+
+    def start(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                status, body = stand_in.respond(self.path, self.headers.get('Range'))
+                if isinstance(body, str):
+                    body = body.encode()
+                    content_type = 'text/plain; charset=utf-8'
+                else:
+                    content_type = 'application/octet-stream'
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def main():
+    parser = ArgumentParser(description='Serve recorded responses of KEGG REST API')
+    parser.add_argument('recording', help='JSON file with the responses (created if recording)')
+    parser.add_argument('--record', metavar='URL', help='record responses of this server for new paths')
+    parser.add_argument('--latency', type=float, default=0, help='seconds to wait before each response')
+    parser.add_argument('--error-rate', type=float, default=0, help='fraction of requests to fail with HTTP 503')
+    args = parser.parse_args()
+
+    options = dict(latency=args.latency, error_rate=args.error_rate, upstream=args.record)
+    try:
+        stand_in = KEGGStandIn.from_file(args.recording, **options)
+    except FileNotFoundError:
+        stand_in = KEGGStandIn(**options)
+
+    with stand_in:
+        print(f'export PATAPY_KEGG_URL={stand_in.url}')
+        try:
+            while True:
+                sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+    if args.record:
+        stand_in.save(args.recording)
+        print(f'Saved {len(stand_in.responses)} responses to {args.recording}')
+
+
+if __name__ == '__main__':
+    main()
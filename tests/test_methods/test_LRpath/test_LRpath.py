@@ -1,5 +1,12 @@
 from test_command_line.utilities import parse
 from test_command_line.utilities import parsing_output
+from test_databases.utilities import KEGGStandIn
+
+import pandas as pd
+import pytest
+
+from databases.cache import CACHE_DIR_VARIABLE
+from databases.remote import KEGG_URL_VARIABLE
 
 from methods.LRpath import LRpath
 
@@ -13,10 +20,25 @@ def test_help(capsys):
 
 
 def create_test_db():
-    db = {'GO:0001101': ['8649'], 'GO:0001819': ['6288', '3600']}
+    db = {'GO:0001101': ['5604'], 'GO:0001819': ['7157', '3600']}
     return db
 
 
+@pytest.fixture
+def kegg_server(tmpdir, monkeypatch):
+    responses = {
+        '/list/hsa': (
+            'hsa:7157\tCDS\t17:complement(7668421..7687490)\tTP53, BCC7, LFS1; tumor protein p53\n'
+            'hsa:5604\tCDS\t15:66386817..66490617\tMAP2K1, CFC3, MEK1; mitogen-activated protein kinase kinase 1\n'
+        ),
+        '/conv/ncbi-geneid/hsa': 'hsa:7157\tncbi-geneid:7157\nhsa:5604\tncbi-geneid:5604\n'
+    }
+    monkeypatch.setenv(CACHE_DIR_VARIABLE, str(tmpdir))
+    with KEGGStandIn(responses) as server:
+        monkeypatch.setenv(KEGG_URL_VARIABLE, server.url)
+        yield server
+
+
 def minimal_data():
 
     tp53 = Gene('TP53')
@@ -34,7 +56,7 @@ def minimal_data():
     return tp53, map2k1, case, control
 
 
-def test_run():
+def test_run(kegg_server):
 
     tp53, map2k1, case, control = minimal_data()
     experiment = Experiment(case, control)
@@ -48,7 +70,7 @@ def test_run():
     data, names = lrpath.create_data(match)
     data2, geneid = lrpath.name_geneid(data, experiment.case.genes)
     assert len(geneid) == 2
-    assert geneid == ['hsa:6288', 'hsa:8649']
+    assert geneid == ['7157', '5604']
 
     assert len(data2) == 2
     assert data2.index.all(geneid)
@@ -60,3 +82,34 @@ def test_run():
 
     map2k1 = results.scored_list[1]
     assert round(map2k1.LRcoeff, 10) == round(-0.0396834554227424, 10)
+
+
+def test_unmapped_genes(kegg_server, capsys):
+    genes = [Gene('TheMostImportantGene'), Gene('MAP2K1')]
+    lrpath = LRpath(min_g=1, database=create_test_db())
+
+    for _ in range(2):
+        data = pd.DataFrame({'1': [0.1, 0.2]}, index=genes)
+        data, geneid = lrpath.name_geneid(data, genes)
+
+        assert geneid == ['5604']
+        assert list(data.index) == ['5604']
+        assert '1 of 2 genes could not be mapped' in capsys.readouterr().out
+
+    # the tables are fetched once
+    assert kegg_server.requests == ['/list/hsa', '/conv/ncbi-geneid/hsa']
+
+
+def test_many_unmapped_genes(kegg_server, capsys):
+    genes = [Gene(f'Unknown{i}') for i in range(1000)] + [Gene('MAP2K1')]
+    lrpath = LRpath(min_g=1, database=create_test_db())
+
+    data = pd.DataFrame({'1': range(len(genes))}, index=genes)
+    lrpath.name_geneid(data, genes)
+
+    # only the first few genes are named
+    warning = capsys.readouterr().out
+    assert '1000 of 1001 genes could not be mapped' in warning
+    assert 'Unknown0, Unknown1' in warning
+    assert 'Unknown10,' not in warning and 'Unknown999' not in warning
+    assert 'and 990 more' in warning
@@ -1,6 +1,11 @@
 from test_command_line.utilities import parse
 from test_command_line.utilities import parsing_output
 
+import numpy as np
+
+from methods.SPIA import SPIA
+from multiprocess import get_pool
+
 
 def test_help(capsys):
     with parsing_output(capsys) as text:
@@ -8,3 +13,25 @@ def test_help(capsys):
     assert 'signaling pathway impact analysis (SPIA)' in text.std
 
 
+def test_analyze_pathway_with_backends():
+    relations = np.zeros((4, 4))
+    relations[0, 1] = relations[1, 2] = 0.5
+    pathways = [('path:%s' % i, relations, ['A', 'B', 'C', 'D'], np.arange(4)) for i in range(4)]
+
+    de = {'A': 2.0, 'C': -1.5}
+    all_genes = list('ABCDEFGH')
+    fold_changes = np.array([2.0, 0, -1.5, 0, 0, 0, 0, 0])
+
+    for backend in ['process', 'thread', 'serial']:
+        pool = get_pool(2, backend)
+        results = list(pool.imap(SPIA.analyze_pathway, pathways, shared_args=(de, fold_changes, all_genes, 20, 'fisher'), ordered=True))
+
+        assert [result[0] for result in results] == ['path:0', 'path:1', 'path:2', 'path:3']
+        # the hypergeometric p-value does not depend on the sampling
+        assert len({result[1] for result in results}) == 1
+
+
+def test_backend_argument(capsys):
+    with parsing_output(capsys) as text:
+        parse('SPIA --help')
+    assert '--backend {process,thread,serial,cluster}' in text.std
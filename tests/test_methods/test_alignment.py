@@ -0,0 +1,47 @@
+import networkx as nx
+import numpy as np
+
+from methods.alignment import AMBIGUOUS, NOT_FOUND, NodeAlignment, first_gene, unique_gene
+
+
+GENES = ['BRCA2', 'TP53', 'KIT', 'LFS1']
+
+
+def pathway(*nodes):
+    G = nx.DiGraph()
+    G.add_nodes_from(nodes)
+    return G
+
+
+def test_resolve():
+    positions = {gene: i for i, gene in enumerate(GENES)}
+
+    assert first_gene('TP53, LFS1', positions) == 1
+    assert first_gene('BRCC2, BRCA2', positions) == NOT_FOUND
+    assert first_gene('BRCC2,BRCA2', positions) == 0
+    assert first_gene('CDK2', positions) == NOT_FOUND
+
+    assert unique_gene('KIT, PBT', positions) == 2
+    assert unique_gene('TP53,LFS1', positions) == AMBIGUOUS
+    assert unique_gene('CDK2', positions) == NOT_FOUND
+
+
+def test_alignment():
+    alignment = NodeAlignment(GENES)
+
+    first = alignment.align(pathway('TP53, LFS1', 'CDK2, CDKN2', 'KIT'), 'hsa04110')
+    assert list(first.rows) == [1, NOT_FOUND, 2]
+    assert first.genes == {'TP53', 'LFS1', 'CDK2', 'CDKN2', 'KIT'}
+    assert first.positions['KIT'] == 2
+
+    fold_changes = np.array([0.5, 2.0, 4.0, 8.0])
+    assert list(first.values(fold_changes)) == [2.0, 0, 4.0]
+    assert list(first.values(fold_changes, missing=np.nan)[[0, 2]]) == [2.0, 4.0]
+
+    # aligned pathways are remembered
+    assert alignment['hsa04110'] is first
+    assert alignment.align(nx.DiGraph(), 'hsa04110') is first
+
+    # names shared by pathways are resolved once
+    alignment.align(pathway('KIT', 'BRCA2'))
+    assert alignment.node_rows == {'TP53, LFS1': 1, 'CDK2, CDKN2': NOT_FOUND, 'KIT': 2, 'BRCA2': 0}
@@ -0,0 +1,141 @@
+import gzip
+import hashlib
+from pathlib import Path
+
+import pytest
+
+from methods.gsea import signatures
+from methods.gsea.downloads import Fetcher, ChecksumError, MANIFEST, parse_manifest
+from methods.gsea.signatures import DATABASE_PRESETS, RemoteDatabase
+from test_command_line.utilities import parse
+from test_databases.utilities import KEGGStandIn
+
+
+def create_mirror(directory, files, manifest=True):
+    directory = Path(directory)
+    lines = []
+    for name, content in files.items():
+        path = directory / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+        lines.append(f'{hashlib.sha256(content).hexdigest()}  {name}')
+    if manifest:
+        (directory / MANIFEST).write_text('\n'.join(lines) + '\n')
+
+
+files = {
+    '6.1/h.all.v6.1.symbols.gmt.gz': b'hallmark' * 1000,
+    '6.1/c1.all.v6.1.symbols.gmt.gz': b'positional' * 1000,
+    '6.1/c6.all.v6.1.symbols.gmt.gz': b'oncogenic' * 1000
+}
+
+
+def test_parse_manifest():
+    assert parse_manifest('ABC  a/b.gz\ndef *c.gz\n') == {'a/b.gz': 'abc', 'c.gz': 'def'}
+
+
+def test_concurrent_fetch(tmpdir):
+    mirror = tmpdir.mkdir('mirror')
+    create_mirror(mirror, files)
+
+    with KEGGStandIn.from_directory(mirror) as server:
+        fetcher = Fetcher(server.url + '/', tmpdir / 'data', workers=3)
+        paths = fetcher.fetch(list(files))
+
+    assert [path.read_bytes() for path in paths] == list(files.values())
+
+
+def test_resume(tmpdir):
+    mirror = tmpdir.mkdir('mirror')
+    create_mirror(mirror, files)
+
+    name = '6.1/h.all.v6.1.symbols.gmt.gz'
+    destination = Path(tmpdir / 'data')
+    partial_path = destination / (name + '.part')
+    partial_path.parent.mkdir(parents=True)
+    partial_path.write_bytes(files[name][:100])
+
+    with KEGGStandIn.from_directory(mirror) as server:
+        path = Fetcher(server.url + '/', destination).fetch_file(name)
+
+    assert server.ranges == ['bytes=100-']
+    assert path.read_bytes() == files[name]
+    assert not partial_path.exists()
+
+
+@pytest.mark.parametrize('manifest', [True, False])
+def test_resume_complete(tmpdir, manifest):
+    mirror = tmpdir.mkdir('mirror')
+    create_mirror(mirror, files, manifest=manifest)
+
+    # downloaded completely, but not put in place (e.g. interrupted before)
+    name = '6.1/h.all.v6.1.symbols.gmt.gz'
+    destination = Path(tmpdir / 'data')
+    partial_path = destination / (name + '.part')
+    partial_path.parent.mkdir(parents=True)
+    partial_path.write_bytes(files[name])
+
+    with KEGGStandIn.from_directory(mirror) as server:
+        fetcher = Fetcher(server.url + '/', destination)
+        if not manifest:
+            with pytest.warns(UserWarning, match='No checksums manifest'):
+                fetcher.checksums
+        path = fetcher.fetch_file(name)
+
+    # the server has nothing more to send (416 Range Not Satisfiable);
+    # without checksums to verify the file, it is downloaded again
+    assert server.ranges == [f'bytes={len(files[name])}-']
+    assert path.read_bytes() == files[name]
+    assert not partial_path.exists()
+
+
+def test_checksum_mismatch(tmpdir):
+    mirror = tmpdir.mkdir('mirror')
+    create_mirror(mirror, files)
+
+    name = '6.1/c1.all.v6.1.symbols.gmt.gz'
+    (mirror / name).write_binary(b'corrupted')
+
+    destination = Path(tmpdir / 'data')
+
+    with KEGGStandIn.from_directory(mirror) as server:
+        with pytest.raises(ChecksumError):
+            Fetcher(server.url + '/', destination).fetch_file(name)
+
+    assert not (destination / name).exists()
+    assert not (destination / (name + '.part')).exists()
+
+
+def test_local_mirror(tmpdir):
+    mirror = tmpdir.mkdir('mirror')
+    create_mirror(mirror, files)
+
+    for remote in [str(mirror), 'file://' + str(mirror) + '/']:
+        destination = tmpdir / remote.replace('/', '_')
+        paths = Fetcher(remote, destination).fetch(list(files))
+        assert [path.read_bytes() for path in paths] == list(files.values())
+
+
+def test_missing_manifest(tmpdir):
+    mirror = tmpdir.mkdir('mirror')
+    create_mirror(mirror, files, manifest=False)
+
+    with pytest.warns(UserWarning, match='No checksums manifest'):
+        paths = Fetcher(str(mirror), tmpdir / 'data').fetch(list(files)[:1])
+
+    assert paths[0].read_bytes() == list(files.values())[0]
+
+
+def test_download_all_from_mirror(tmpdir, monkeypatch):
+    mirror = tmpdir.mkdir('mirror')
+    create_mirror(mirror, {
+        RemoteDatabase.relative_path(set_name, 'entrez', 5.2): gzip.compress(b'SET\turl\t7157\n')
+        for set_name, label in DATABASE_PRESETS.values()
+    })
+    monkeypatch.setattr(signatures, 'DATA_DIR', Path(tmpdir / 'data'))
+
+    with pytest.raises(SystemExit):
+        parse(f'gsea --download_all database --remote {mirror} --version 5.2 --identifiers entrez')
+
+    # the options of the database are respected
+    assert len(list(Path(tmpdir / 'data' / '5.2').glob('*.v5.2.entrez.gmt.gz'))) == len(DATABASE_PRESETS)
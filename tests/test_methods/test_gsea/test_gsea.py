@@ -1,12 +1,18 @@
+import pickle
 import random
 
 import numpy
+import pytest
 from test_command_line.utilities import parse
 from test_command_line.utilities import parsing_output
 
 from methods.gsea import GeneralisedGSEA
+from methods.gsea import gsea as gsea_module
 from methods.gsea.gsea import ScoreDistribution
+from methods.gsea.shufflers import GeneShuffler, PhenotypeShuffler
+from methods.gsea import signatures
 from methods.gsea.signatures import MolecularSignatureDatabase, GeneSet
+from multiprocess import PersistentPool, sharing
 from metrics import difference_of_classes
 from models import SampleCollection, Sample, Gene, Experiment
 
@@ -36,6 +42,45 @@ def test_gene_set():
     assert str(gene_set) == '<GeneSet: set with 2 genes>'
 
 
+def test_membership():
+    db = create_test_db()
+    genes = [Gene('TP53'), Gene('MAP2K1'), Gene('MAP2K2')]
+
+    membership = db.membership(genes)
+
+    # built once per order of genes
+    assert db.membership(list(genes)) is membership
+
+    assert membership.matrix.shape == (2, 3)
+    assert list(membership.sizes) == [2, 1]
+
+    anthrax = membership.row_index['anthrax pathway']
+    assert list(membership.members(anthrax)) == [1, 2]
+
+    columns = membership.columns([Gene('MAP2K2'), Gene('TP53')])
+    assert list(membership.hits(anthrax, columns)) == [True, False]
+
+    assert list(membership.overlaps([Gene('TP53'), Gene('MDM2')])) == [0, 1]
+
+
+def test_memberships_cache(monkeypatch):
+    monkeypatch.setattr(signatures, 'MEMBERSHIPS_CACHED', 2)
+    db = create_test_db()
+    tp53, map2k1, mdm2 = Gene('TP53'), Gene('MAP2K1'), Gene('MDM2')
+
+    first = db.membership([tp53, map2k1])
+    second = db.membership([map2k1, tp53])
+    # the first one becomes the most recently used
+    assert db.membership([tp53, map2k1]) is first
+
+    db.membership([mdm2])
+
+    # only the most recently used memberships are kept
+    assert len(db._memberships) == 2
+    assert db.membership([tp53, map2k1]) is first
+    assert db.membership([map2k1, tp53]) is not second
+
+
 def test_licence(capsys):
     with parsing_output(capsys) as text:
         parse('gsea --show_licence')
@@ -114,6 +159,31 @@ def test_shuffle_samples():
     assert new_control.samples == case.samples
 
 
+def test_leading_edge():
+    tp53, map2k1, case, control = minimal_data()
+    db = create_test_db()
+
+    gsea = GeneralisedGSEA(db, ranking_metric=difference_of_classes, fdr_cutoff=0.25)
+    ranked_list = gsea.create_ranked_gene_list(case, control)
+
+    gene_set = db.membership([tp53, map2k1]).view(db.gene_sets['p53 pathway'])
+    gene_set.enrichment = 1.5
+    gene_set.peak = 0
+    gene_set.hit_positions = numpy.array([0])
+
+    gene_set.fdr = 0.1
+    gsea.find_leading_edge(gene_set, ranked_list)
+
+    assert gene_set.leading_edge == 'TP53'
+    assert gene_set.tags == 1
+    assert gene_set.list_pct == 0.5
+
+    # not significant gene sets have no leading edge materialized
+    gene_set.fdr = 0.3
+    gsea.find_leading_edge(gene_set, ranked_list)
+    assert gene_set.leading_edge is None
+
+
 def test_run():
     tp53, map2k1, case, control = minimal_data()
     experiment = Experiment(case, control)
@@ -140,11 +210,16 @@ def test_run():
     results = gsea.run(experiment)
     assert len(gsea.gene_sets) == 2
 
-    assert results.scored_list == [
-        db.gene_sets['anthrax pathway'],
-        db.gene_sets['p53 pathway']
+    assert [gene_set.name for gene_set in results.scored_list] == [
+        'anthrax pathway',
+        'p53 pathway'
     ]
 
+    # the database is left untouched and can be reused
+    anthrax_genes = db.gene_sets['anthrax pathway'].genes
+    assert anthrax_genes == {Gene('MAP2K1'), Gene('MAP2K2')}
+    assert db.gene_sets['p53 pathway'].enrichment is None
+
     anthrax = results.scored_list[0]
 
     # the enrichment is set to zero to reflect the fact of no
@@ -158,3 +233,206 @@ def test_run():
     # caveat: this is hardened (not hand-calculated) result;
     # would be beneficial to try to hand-calculate this too.
     assert p53.enrichment == 1.4634615384615386
+
+    # position of the maximum deviation is recorded during the walk
+    assert p53.peak == 1
+    assert list(p53.hit_positions) == [0]
+
+    numpy.random.seed(0)
+    random.seed(0)
+
+    rerun = gsea.run(experiment)
+    assert rerun.scored_list[1].enrichment == p53.enrichment
+
+
+def test_time_budget():
+    tp53, map2k1, case, control = minimal_data()
+    experiment = Experiment(case, control)
+
+    gsea = GeneralisedGSEA(
+        create_test_db(),
+        ranking_metric=difference_of_classes,
+        min_genes=1,
+        processes=1,
+        time_budget=1
+    )
+
+    results = gsea.run(experiment)
+
+    # the count of permutations is chosen to fit the budget
+    assert f'{gsea.permutations} permutations' in results.description
+    assert len(results.scored_list[1].null_distribution) == gsea.permutations
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TimedShuffler:
+    """Takes `duration` seconds of the clock for each gene of the gene set in each permutation."""
+
+    def __init__(self, clock, duration):
+        self.clock = clock
+        self.duration = duration
+        self.gene_set = None
+
+    def set_gene_set(self, gene_set):
+        self.gene_set = gene_set
+
+    def permute_and_score(self):
+        self.clock.now += self.duration * len(self.gene_set)
+
+
+def fit_permutations(clock, gene_sets, time_budget, parallelism=1, permutations=10 ** 6):
+    gsea = GeneralisedGSEA(create_test_db(), time_budget=time_budget, permutations=permutations)
+    gsea.shuffler = TimedShuffler(clock, duration=0.001)
+    return gsea.fit_permutations_in_budget(gene_sets, started=clock(), parallelism=parallelism)
+
+
+def test_permutations_fit_budget(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(gsea_module, 'monotonic', clock)
+    # each permutation of a set of 10 genes takes 0.01s
+    gene_sets = [['gene'] * 10 for _ in range(10)]
+
+    def fitted(time_budget, **kwargs):
+        return fit_permutations(clock, gene_sets, time_budget, **kwargs)
+
+    permutations = fitted(100)
+    # 0.3s of calibration (3 sets, 10 permutations each) is spent from the budget
+    assert permutations == int((100 - 0.3) * GeneralisedGSEA.budget_safety_factor / (0.01 * len(gene_sets)))
+
+    # the count scales with the budget and with the count of gene sets analysed at once
+    assert abs(fitted(200) / permutations - 2) < 0.05
+    assert abs(fitted(100, parallelism=2) / permutations - 2) < 0.05
+    # but not beyond the count of the gene sets
+    assert fitted(100, parallelism=20) == fitted(100, parallelism=10)
+
+    # the count given by the user is an upper bound
+    assert fitted(100, permutations=500) == 500
+    assert fitted(100, permutations=1000) == permutations
+
+    with pytest.raises(ValueError, match='too small'):
+        fitted(0.3)
+
+
+def test_calibration_sample(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(gsea_module, 'monotonic', clock)
+    # the largest sets first, as ordered by a database
+    gene_sets = [['gene'] * size for size in range(100, 0, -10)]
+
+    gsea = GeneralisedGSEA(create_test_db())
+    assert [len(gene_set) for gene_set in gsea.calibration_sample(gene_sets)] == [20, 60, 90]
+    assert [len(gene_set) for gene_set in gsea.calibration_sample(gene_sets[:2])] == [90, 100]
+
+    # the time of a permutation is estimated for a set of average size
+    calibration = 10 * 0.001 * (20 + 60 + 90)
+    time_of_permutations = 0.001 * sum(len(gene_set) for gene_set in gene_sets)
+    expected = (100 - calibration) * GeneralisedGSEA.budget_safety_factor / time_of_permutations
+
+    assert abs(fit_permutations(clock, gene_sets, 100) / expected - 1) < 0.05
+
+
+def test_run_on_persistent_pool():
+    tp53, map2k1, case, control = minimal_data()
+    experiment = Experiment(case, control)
+
+    gsea = GeneralisedGSEA(
+        create_test_db(),
+        ranking_metric=difference_of_classes,
+        min_genes=1,
+        permutations=10
+    )
+
+    with PersistentPool(2) as pool:
+        first = gsea.run(experiment)
+        # the membership index is released once the run is over
+        assert not pool.loaded
+
+        second = gsea.run(experiment)
+        assert not pool.loaded
+
+    for results in [first, second]:
+        assert [gene_set.name for gene_set in results.scored_list] == [
+            'anthrax pathway',
+            'p53 pathway'
+        ]
+
+
+def worker_payload(samples, set_size):
+    """Size of the job sent to each worker of a persistent pool, for an experiment with given dimensions."""
+    genes = [f'G{i}' for i in range(2000)]
+    random_values = numpy.random.RandomState(0).rand
+
+    def collection(name):
+        return SampleCollection(name, [
+            Sample.from_names(f'{name} {i}', dict(zip(genes, random_values(len(genes)))))
+            for i in range(samples)
+        ])
+
+    experiment = Experiment(collection('case'), collection('control'))
+    database = MolecularSignatureDatabase({
+        f'set {i}': GeneSet(f'set {i}', genes[i:i + set_size])
+        for i in range(50)
+    })
+
+    gsea = GeneralisedGSEA(database, ranking_metric=difference_of_classes, permutation_type=PhenotypeShuffler)
+    gsea.membership = database.membership(list(experiment.case.genes))
+    gsea.shuffler = PhenotypeShuffler(experiment, gsea.create_ranked_gene_list, gsea.calculate_enrichment_score)
+
+    with sharing():
+        return len(pickle.dumps(gsea.analyze_gene_set))
+
+
+def test_shuffler_copy():
+    tp53, map2k1, case, control = minimal_data()
+    experiment = Experiment(case, control)
+    gsea = GeneralisedGSEA(create_test_db(), ranking_metric=difference_of_classes)
+
+    for shuffler_class in [PhenotypeShuffler, GeneShuffler]:
+        shuffler = shuffler_class(experiment, gsea.create_ranked_gene_list, gsea.calculate_enrichment_score)
+        copied = shuffler.copy()
+
+        # copies share the experiment, without packing the expression values again
+        assert copied.experiment is shuffler.experiment
+        assert type(copied) is shuffler_class
+
+    # but not the state of permutations
+    assert copied.permutation == shuffler.permutation
+    assert copied.permutation is not shuffler.permutation
+
+
+def test_worker_payload():
+    small = worker_payload(samples=10, set_size=500)
+
+    # four times more expression values and gene set members
+    large = worker_payload(samples=40, set_size=1900)
+
+    # are placed in shared memory rather than sent to each of the workers
+    assert large < small * 1.1
+
+
+def test_run_with_threads():
+    tp53, map2k1, case, control = minimal_data()
+    experiment = Experiment(case, control)
+
+    gsea = GeneralisedGSEA(
+        create_test_db(),
+        ranking_metric=difference_of_classes,
+        min_genes=1,
+        permutations=10,
+        processes=2,
+        backend='thread'
+    )
+    results = gsea.run(experiment)
+
+    assert [gene_set.name for gene_set in results.scored_list] == [
+        'anthrax pathway',
+        'p53 pathway'
+    ]
@@ -18,6 +18,11 @@ def test_gene_init():
     from copy import copy
     assert copy(g).id is g.id
 
+    # genes unpickled separately are still the same objects
+    from pickle import dumps, loads
+    assert loads(dumps(g)) is g
+    assert loads(dumps([g]))[0] is list(loads(dumps({g: 1})))[0]
+
 
 def test_sample_init():
     genes = {Gene('BAD'): 1.2345, Gene('FUCA2'): 6.5432}
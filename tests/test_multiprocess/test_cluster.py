@@ -0,0 +1,139 @@
+import operator
+import os
+import signal
+import socket
+from multiprocessing import Pipe
+from threading import Thread
+from time import sleep
+
+import pytest
+
+from multiprocess import PersistentPool, TaskError, get_pool
+from multiprocess.cluster import JOB, RESULT, TASK, ClusterPool, handle, local_cluster, parse_nodes
+
+
+def slow_square(x):
+    sleep(0.05)
+    return x * x
+
+
+def test_parse_nodes():
+    assert parse_nodes('node1:7531, 10.0.0.2:80,') == [('node1', 7531), ('10.0.0.2', 80)]
+
+
+def test_local_cluster():
+    with local_cluster(nodes=2) as pool:
+        for _ in range(2):
+            # the daemons serve subsequent calls
+            squared = pool.imap(pow, list(range(20)), shared_args=[2], chunksize=3, ordered=True)
+            assert list(squared) == [i * i for i in range(20)]
+
+        squared = pool.imap(pow, list(range(20)), shared_args=[2], costs=list(range(20)))
+        assert sorted(squared) == [i * i for i in range(20)]
+
+        with pytest.raises(TaskError, match='ZeroDivisionError'):
+            list(pool.imap(operator.truediv, [1, 2], shared_args=[0]))
+
+
+def slow_pid(_):
+    sleep(0.05)
+    return os.getpid()
+
+
+def test_local_pools_of_daemons():
+    with local_cluster(nodes=1, processes=2) as pool:
+        # a single chunk is computed by both workers of the node
+        pids = set(pool.imap(slow_pid, list(range(8)), chunksize=8))
+
+        assert len(pids) == 2
+        assert pool.daemons[0].pid not in pids
+
+
+def test_job_sent_to_local_workers_once(monkeypatch):
+    broadcasts = []
+    broadcast = PersistentPool.broadcast
+    monkeypatch.setattr(PersistentPool, 'broadcast', lambda pool, *message: (
+        broadcasts.append(message[0]), broadcast(pool, *message)
+    ))
+
+    with PersistentPool(2) as pool:
+        # created after the workers, so that these do not inherit the ends
+        coordinator, daemon = Pipe()
+        server = Thread(target=handle, args=(daemon, 1, pool))
+        server.start()
+
+        coordinator.send((JOB, pow, (2,)))
+        coordinator.recv()
+        for index in range(3):
+            coordinator.send((TASK, index, [index, index + 3]))
+            kind, result_index, results, busy = coordinator.recv()
+            assert (kind, result_index, results) == (RESULT, index, [index ** 2, (index + 3) ** 2])
+
+        coordinator.close()
+        server.join()
+
+    # the arguments are not sent again with each of the chunks
+    assert broadcasts == [JOB]
+
+
+def test_failed_handshake():
+    with local_cluster(nodes=1) as pool:
+        host, port = pool.nodes[0]
+
+        # a client disconnecting before authentication
+        socket.create_connection((host, port)).close()
+        # and one sending garbage instead of a response to the challenge
+        with socket.create_connection((host, port)) as client:
+            client.sendall(b'\xff' * 16)
+
+        squared = pool.imap(pow, list(range(5)), shared_args=[2], ordered=True)
+        assert list(squared) == [i * i for i in range(5)]
+
+
+def test_unresponsive_node():
+    with local_cluster(nodes=2, heartbeat_interval=0.1, timeout=1) as pool:
+        squared = pool.imap(slow_square, list(range(20)), chunksize=1, ordered=True)
+        assert next(squared) == 0
+
+        # the node freezes in the middle of a task: neither results nor heartbeats are sent
+        os.kill(pool.daemons[0].pid, signal.SIGSTOP)
+
+        with pytest.warns(UserWarning, match='Lost node'):
+            assert list(squared) == [i * i for i in range(1, 20)]
+
+
+def test_disconnected_node():
+    with local_cluster(nodes=2, heartbeat_interval=0.1) as pool:
+        squared = pool.imap(slow_square, list(range(20)), chunksize=1, ordered=True)
+
+        assert next(squared) == 0
+        pool.daemons[0].terminate()
+
+        with pytest.warns(UserWarning, match='Lost node'):
+            assert list(squared) == [i * i for i in range(1, 20)]
+
+
+def test_all_nodes_lost():
+    with local_cluster(nodes=1, heartbeat_interval=0.1) as pool:
+        squared = pool.imap(slow_square, list(range(20)), chunksize=1)
+        next(squared)
+        pool.daemons[0].terminate()
+
+        with pytest.warns(UserWarning, match='Lost node'):
+            with pytest.raises(TaskError, match='lost'):
+                list(squared)
+
+
+def test_cluster_backend(monkeypatch):
+    monkeypatch.delenv('PATAPY_CLUSTER', raising=False)
+
+    with pytest.raises(ValueError, match='No nodes'):
+        get_pool(2, 'cluster')
+
+    monkeypatch.setenv('PATAPY_CLUSTER', 'localhost:7531')
+    monkeypatch.setenv('PATAPY_CLUSTER_KEY', 'secret')
+
+    pool = get_pool(2, 'cluster')
+    assert isinstance(pool, ClusterPool)
+    assert pool.nodes == [('localhost', 7531)]
+    assert pool.authkey == b'secret'
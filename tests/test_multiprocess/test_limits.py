@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+import multiprocess.limits
+from multiprocess import Pool
+from multiprocess.limits import Placement, cpu_sets, allowed_cpus
+
+
+def test_cpu_sets():
+    assert cpu_sets(2, 2, cpus=[0, 1, 2, 3, 4]) == [{0, 1}, {2, 3}]
+    assert cpu_sets(3, 1, cpus=[5, 1, 3]) == [{1}, {3}, {5}]
+    # not enough CPUs
+    assert cpu_sets(3, 2, cpus=[0, 1, 2, 3]) is None
+
+
+def test_placement():
+    cpus = allowed_cpus()
+
+    placement = Placement(workers=1)
+    assert placement.threads == len(cpus)
+
+    # at least a single thread
+    assert Placement(workers=len(cpus) + 1).threads == 1
+
+    with pytest.warns(UserWarning, match='will not be pinned'):
+        placement = Placement(workers=len(cpus) + 1, pin=True)
+    assert placement.cpu_sets is None
+
+
+@pytest.mark.skipif(len(allowed_cpus()) < 2, reason='requires at least two CPUs')
+def test_placement_without_threadpoolctl(monkeypatch):
+    monkeypatch.setattr(multiprocess.limits, 'threadpool_limits', None)
+
+    # the libraries were loaded with numpy, so the limit cannot be applied
+    with pytest.warns(UserWarning, match='threadpoolctl is not installed'):
+        Placement(workers=2)
+
+
+def worker_limits(_):
+    return os.environ['OMP_NUM_THREADS'], os.sched_getaffinity(0)
+
+
+def test_limits_in_workers():
+    results = Pool(2, threads_per_worker=3).imap(worker_limits, [0, 1], chunksize=1)
+    assert {threads for threads, affinity in results} == {'3'}
+
+
+def worker_blas_threads(_):
+    from threadpoolctl import threadpool_info
+    return [library['num_threads'] for library in threadpool_info() if library['user_api'] == 'blas']
+
+
+def test_blas_limits_in_workers():
+    pytest.importorskip('threadpoolctl')
+
+    results = list(Pool(2, threads_per_worker=1).imap(worker_blas_threads, [0, 1], chunksize=1))
+
+    if not any(results):
+        pytest.skip('numpy is not linked with a BLAS library known to threadpoolctl')
+    # BLAS was loaded before the workers started, yet these are limited
+    assert {threads for result in results for threads in result} == {1}
+
+
+@pytest.mark.skipif(len(allowed_cpus()) < 2, reason='requires at least two CPUs')
+def test_pinned_workers():
+    results = Pool(2, threads_per_worker=1, pin=True).imap(worker_limits, range(4))
+    for threads, affinity in results:
+        assert threads == '1'
+        assert len(affinity) == 1
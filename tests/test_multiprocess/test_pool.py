@@ -1,8 +1,19 @@
 import operator
+import os
+import random
+
+from time import sleep
+
+import numpy
+import pytest
 
 from multiprocess import Pool
 from multiprocess import worker
+from multiprocess import multiprocessing_queue
+from multiprocess import auto_chunksize, chunks, schedule
+from multiprocess import TaskError
 from multiprocess import STOP
+from multiprocess import PersistentPool, SerialPool, ThreadPool, available_cores, get_pool, worker_state
 
 
 def test_imap():
@@ -19,21 +30,223 @@ def test_imap():
 
         assert set(squared) == {1, 4, 9, 16}
 
+    squared = Pool(2).imap(pow, list(range(10)), shared_args=[2], chunksize=3)
+    assert sorted(squared) == [i * i for i in range(10)]
+
+
+def sleep_and_return(x):
+    # the first items take longest
+    sleep(0.05 * (5 - x))
+    return x
+
+
+def test_ordered_imap():
+    data = [0, 1, 2, 3, 4]
+
+    results = Pool(3).imap(sleep_and_return, data, chunksize=1, ordered=True)
+    assert list(results) == data
+
+
+def test_lazy_imap():
+    results = Pool(2).imap(pow, list(range(100)), shared_args=[2], chunksize=1)
+
+    # results are available before all items are processed
+    first = next(results)
+    assert first in [i * i for i in range(100)]
+
+    # abandoning the iterator shuts the workers down
+    results.close()
+
+
+def test_task_error():
+    results = Pool(2).imap(operator.truediv, [1, 0], shared_args=[0], chunksize=1)
+
+    with pytest.raises(TaskError, match='ZeroDivisionError'):
+        list(results)
+
+
+def test_chunks():
+    assert list(chunks(range(5), 2)) == [[0, 1], [2, 3], [4]]
+
+    assert auto_chunksize(total=100, processes=5) == 5
+    assert auto_chunksize(total=101, processes=5) == 6
+    assert auto_chunksize(total=3, processes=5) == 1
+
+
+def test_schedule():
+    items = ['a', 'b', 'c', 'd', 'e']
+
+    # without costs chunks follow the order of items
+    assert schedule(items, processes=1, chunksize=2) == [
+        ([0, 1], ['a', 'b']), ([2, 3], ['c', 'd']), ([4], ['e'])
+    ]
+
+    # the most costly first; cheap items are grouped, up to
+    # a quarter of the average cost per worker in each chunk
+    costs = [1, 8, 1, 2, 4]
+    assert schedule(items, processes=2, costs=costs) == [
+        ([1], ['b']), ([4], ['e']), ([3], ['d']), ([0, 2], ['a', 'c'])
+    ]
+
+    assert schedule(items, processes=2, chunksize=2, costs=costs)[0] == ([1, 4], ['b', 'e'])
+
+
+def test_imap_with_costs():
+    data = list(range(20))
+    costs = [x % 7 for x in data]
+
+    for ordered in [True, False]:
+        pool = Pool(3)
+        squared = pool.imap(pow, data, shared_args=[2], costs=costs, ordered=ordered)
+        results = list(squared)
+
+        if ordered:
+            assert results == [x * x for x in data]
+        else:
+            assert sorted(results) == [x * x for x in data]
+
+        # utilisation of workers is measured
+        assert 0 <= pool.utilisation.fraction <= 1
+        assert 'Workers were busy' in str(pool.utilisation)
+
 
 def test_worker():
-    from multiprocessing import Manager, Queue
+    from multiprocessing import Queue
 
-    manager = Manager()
-    output = manager.list()
+    output = Queue()
 
     input_queue = Queue()
-    progress_queue = Queue()
 
-    for i in [0, 1, 2]:
-        input_queue.put(i)
+    input_queue.put((0, [0, 1]))
+    input_queue.put((1, [2]))
     input_queue.put(STOP)
 
     # let's add 5 to each number from the input queue
-    worker(operator.add, input_queue, progress_queue, output, 5)
+    worker(operator.add, input_queue, output, 5)
+
+    results = [output.get(), output.get()]
+    assert [(index, chunk) for index, chunk, busy, pid in results] == [(0, [5, 6]), (1, [7])]
+
+    # workers identify themselves, so that utilisation of each can be reported
+    assert {pid for index, chunk, busy, pid in results} == {os.getpid()}
+
+
+def test_queue_backpressure():
+    with multiprocessing_queue(pow, [2], processes=2, total=10) as api:
+
+        # the queue is bounded...
+        assert api.queue._maxsize == 4
+
+        # ...and the workers are consuming items as soon as they are queued
+        api.queue.put((0, [3]))
+
+        assert api.results.get(timeout=5)[:2] == (0, [9])
+
+        for i in range(9):
+            api.queue.put((i + 1, [i]))
+
+        results = [api.results.get(timeout=5)[:2] for _ in range(9)]
+
+    assert sorted(results) == [(i + 1, [i * i]) for i in range(9)]
+
+
+def get_state(key, offset):
+    return worker_state[key] + offset
+
+
+def get_pid(_):
+    return os.getpid()
+
+
+def draw(_):
+    sleep(0.01)
+    return os.getpid(), random.random(), numpy.random.rand()
+
+
+@pytest.mark.parametrize('pool_class', [Pool, PersistentPool])
+def test_workers_are_reseeded(pool_class):
+    random.seed(0)
+    numpy.random.seed(0)
+
+    pool = pool_class(2)
+    draws = list(pool.imap(draw, range(8), chunksize=1, ordered=True))
+    if isinstance(pool, PersistentPool):
+        pool.close()
+
+    first_draws = {}
+    for pid, *numbers in draws:
+        first_draws.setdefault(pid, numbers)
+
+    assert len(first_draws) == 2
+    # the workers do not repeat the draws of each other
+    first, second = first_draws.values()
+    assert first[0] != second[0] and first[1] != second[1]
+
+
+def test_persistent_pool():
+    with PersistentPool(2) as pool:
+
+        # the active pool is used by methods
+        assert get_pool(0) is pool
+        assert isinstance(get_pool(1), SerialPool)
+
+        pool.load('answer', 40)
+        assert pool.is_loaded('answer')
+
+        results = pool.imap(get_state, ['answer'] * 4, shared_args=[2])
+        assert list(results) == [42] * 4
+
+        pool.unload('answer')
+        assert not pool.is_loaded('answer')
+        with pytest.raises(TaskError, match='KeyError'):
+            list(pool.imap(get_state, ['answer'], shared_args=[2]))
+
+        # workers are kept between runs
+        workers = {process.pid for process in pool.workers}
+        for _ in range(2):
+            assert set(pool.imap(get_pid, range(10), chunksize=1)) <= workers
+
+        # results of an abandoned run do not leak into the next one
+        abandoned = pool.imap(sleep_and_return, [0, 1, 2, 3], chunksize=1)
+        next(abandoned)
+        abandoned.close()
+
+        squared = pool.imap(pow, list(range(10)), shared_args=[2], ordered=True)
+        assert list(squared) == [i * i for i in range(10)]
+
+        with pytest.raises(TaskError, match='ZeroDivisionError'):
+            list(pool.imap(operator.truediv, [1], shared_args=[0]))
+
+    assert not pool.running
+    assert not isinstance(get_pool(0), PersistentPool)
+
+
+def test_backends():
+    data = list(range(10))
+
+    for pool in [ThreadPool(3), SerialPool()]:
+        squared = pool.imap(pow, data, shared_args=[2], ordered=True)
+        assert list(squared) == [x * x for x in data]
+
+    pool = ThreadPool(2)
+    assert sorted(pool.imap(pow, data, shared_args=[2], costs=data)) == [x * x for x in data]
+    assert pool.utilisation.fraction <= 1
+
+    with pytest.raises(TaskError, match='ZeroDivisionError'):
+        list(ThreadPool(2).imap(operator.truediv, [1, 2], shared_args=[0]))
+
+    assert isinstance(get_pool(2, 'thread'), ThreadPool)
+    assert isinstance(get_pool(2, 'serial'), SerialPool)
+
+    with pytest.raises(ValueError, match='Unknown backend'):
+        get_pool(2, 'gpu')
+
+
+def test_parallelism():
+    assert get_pool(4, 'process').parallelism == 4
+    assert get_pool(0, 'process').parallelism == available_cores()
+    assert PersistentPool(3).parallelism == 3
 
-    assert list(output) == [5, 6, 7]
+    # the threads (holding the GIL) and the serial pool process one item at a time
+    assert get_pool(4, 'thread').parallelism == 1
+    assert get_pool(4, 'serial').parallelism == 1
@@ -1,7 +1,9 @@
+import io
+import json
 import re
 
-from multiprocess import STOP
-from multiprocess.progress_bar import progress_bar, progress_bar_worker
+from multiprocess import Pool, ThreadPool
+from multiprocess.progress_bar import Progress, PROGRESS_JSON_VARIABLE
 
 # simulate five consecutive, step-by-step updates
 data = [1, 1, 1, 1, 1]
@@ -13,35 +15,73 @@ expected_bar = re.compile(
 )
 
 
-def test_bar_worker(capfd):
-    from multiprocessing import Queue
+def test_bar(capfd):
+    capfd.readouterr()     # clean buffers
+
+    with Progress(len(data), 1, bar=True) as progress:
+        for i in data:
+            progress.update(i)
+
+    # let's capture the output on both standard stream
+    std, err = capfd.readouterr()
 
+    # tqdm writes to err stream
+    assert expected_bar.match(err)
+
+
+def test_bar_disabled_without_terminal(capfd):
     capfd.readouterr()
 
-    queue = Queue()
+    # standard output is captured, so it is not a terminal
+    with Progress(len(data), 1) as progress:
+        for i in data:
+            progress.update(i)
 
-    for i in data:
-        queue.put(i)
-    queue.put(STOP)
+    assert capfd.readouterr() == ('', '')
 
-    progress_bar_worker(queue, 5)
 
-    std, err = capfd.readouterr()
+def test_reports():
+    reports = []
+    lines = io.StringIO()
 
-    assert expected_bar.match(err)
+    with Progress(4, 2, callback=reports.append, json_lines=lines, bar=False, interval=0) as progress:
+        progress.update(2, busy=0.5, worker='a')
+        progress.update(2, busy=0.5, worker='b')
 
+    assert [report['done'] for report in reports] == [2, 4]
 
-def test_bar(capfd):
-    capfd.readouterr()     # clean buffers
+    last = reports[-1]
+    assert last['total'] == 4
+    assert last['eta'] == 0
+    assert last['items_per_second'] > 0
+    assert set(last['workers']) == {'a', 'b'}
 
-    with progress_bar(len(data)) as queue:
-        for i in data:
-            queue.put(i)
+    assert [json.loads(line) for line in lines.getvalue().splitlines()] == reports
 
-    assert queue.empty()
 
-    # let's capture the output on both standard stream
-    std, err = capfd.readouterr()
+def test_reports_are_coalesced():
+    reports = []
 
-    # tqdm writes to err stream
-    assert expected_bar.match(err)
+    with Progress(100, 1, callback=reports.append, bar=False, interval=60) as progress:
+        for _ in range(100):
+            progress.update(1)
+
+    # the first one and the final one
+    assert [report['done'] for report in reports] == [1, 100]
+
+
+def test_pool_reports(tmpdir, monkeypatch):
+    path = tmpdir.join('progress.jsonl')
+    monkeypatch.setenv(PROGRESS_JSON_VARIABLE, str(path))
+
+    for pool_class in [Pool, ThreadPool]:
+        reports = []
+        pool = pool_class(2, on_progress=reports.append)
+
+        assert sorted(pool.imap(pow, list(range(10)), shared_args=[2])) == [i * i for i in range(10)]
+
+        assert reports[-1]['done'] == 10
+        assert 1 <= len(reports[-1]['workers']) <= 2
+
+    lines = path.readlines()
+    assert json.loads(lines[-1])['done'] == 10
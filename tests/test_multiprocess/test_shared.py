@@ -0,0 +1,92 @@
+import gc
+import pickle
+
+import numpy as np
+import pytest
+
+import multiprocess.shared
+from multiprocess import PersistentPool, Pool
+from multiprocess.shared import SharedArray, attach_segment, shared_arrays, unwrap
+
+
+def test_pickled_array_attaches_to_same_memory():
+    shared = SharedArray.from_array(np.arange(10, dtype=float))
+
+    try:
+        attached = pickle.loads(pickle.dumps(shared))
+
+        assert attached.segment.name == shared.segment.name
+        assert np.array_equal(attached.array, np.arange(10))
+
+        # no copy was made: changes are visible in the other "process"
+        shared.array[0] = 42
+        assert attached.array[0] == 42
+
+        attached.close()
+    finally:
+        shared.unlink()
+
+
+def test_unwrapped_array_outlives_wrapper():
+    shared = SharedArray.from_array(np.arange(10, dtype=float))
+
+    try:
+        array = unwrap(pickle.loads(pickle.dumps(shared)))
+        # the attached wrapper is gone, but its memory is still mapped
+        gc.collect()
+        assert array.sum() == 45
+    finally:
+        shared.unlink()
+
+
+def test_shared_arrays():
+    large = np.ones(1000)
+    small = np.ones(10)
+
+    with shared_arrays([large, small, 'other'], threshold=large.nbytes) as arguments:
+        shared, not_shared, other = arguments
+
+        assert isinstance(shared, SharedArray)
+        assert not_shared is small
+        assert other == 'other'
+
+        name = shared.segment.name
+
+    # the memory is released afterwards
+    with pytest.raises(FileNotFoundError):
+        attach_segment(name)
+
+
+def test_shared_arrays_without_shared_memory(monkeypatch):
+    # as on Python older than 3.8
+    monkeypatch.setattr(multiprocess.shared, 'shared_memory', None)
+    large = np.ones(1000)
+
+    with shared_arrays([large], threshold=large.nbytes) as arguments:
+        assert arguments == [large]
+        assert arguments[0] is large
+
+
+def weighted(index, weights):
+    return index * weights[index]
+
+
+def test_imap_with_shared_array():
+    # large enough to be shared with default threshold
+    weights = np.arange(200000, dtype=float)
+    indices = list(range(0, 200000, 1000))
+
+    results = Pool(2).imap(weighted, indices, shared_args=[weights], ordered=True)
+
+    assert list(results) == [i * i for i in indices]
+
+
+def test_persistent_pool_with_shared_array():
+    weights = np.arange(200000, dtype=float)
+    indices = list(range(0, 200000, 1000))
+
+    with PersistentPool(2) as pool:
+        # the workers keep using the arrays after the job message is gone
+        for _ in range(2):
+            results = pool.imap(weighted, indices, shared_args=[weights], ordered=True)
+            assert list(results) == [i * i for i in indices]